@@ -1,10 +1,15 @@
 import os
+import json
+import signal
+import asyncio
+from contextlib import asynccontextmanager, suppress
 from typing import List, Optional, Any, Dict
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, BackgroundTasks
+from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from starlette.concurrency import run_in_threadpool
 from pathlib import Path
 
 from src.document_ingestion.data_ingestion import (
@@ -13,15 +18,56 @@ from src.document_ingestion.data_ingestion import (
     ChatIngestor,
     FaissManager,
 )
-from src.document_analyzer.data_analysis import DocumentAnalyzer
+from src.document_analyzer.data_analysis import ANALYSIS_MODES, DocumentAnalyzer
 from src.document_compare.document_comparator import DocumentComparatorLLM
 from src.document_chat.retrieval import ConversationalRAG
+from src.document_chat.vectorstore_cache import get_vectorstore_cache
+from src.document_chat.rewrite_cache import get_rewrite_cache
+from src.document_chat.chat_memory import get_chat_memory
+from src.document_chat.answer_cache import get_answer_cache
+from src.document_ingestion.faiss_index import search_params
+from src.document_ingestion.shared_index import get_shared_index, shared_index_enabled
+from utils.model_loader import get_model_registry
+from utils.file_io import UPLOAD_CHUNK_BYTES, UPLOAD_MAX_BYTES, UploadTooLarge
+from utils.blob_store import get_blob_store
+from utils.artifact_cache import get_artifact_cache
+from utils.pdf_extraction import shutdown_pool
+from logger.custom_logger import CustomLogger
 
 FAISS_BASE = os.getenv("FAISS_BASE", "faiss_index")
 UPLOAD_BASE = os.getenv("UPLOAD_BASE", "data")
 FAISS_INDEX_NAME = os.getenv("FAISS_INDEX_NAME", "index")  # <--- keep consistent with save_local()
 
-app = FastAPI(title="Document Portal API", version="0.1")
+log = CustomLogger().get_logger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the shared LLM/embedding clients once per worker, before serving traffic
+    registry = await run_in_threadpool(get_model_registry)
+    warm_up = registry.config.get("model_registry", {}).get("warm_up", True)
+    if warm_up:
+        await run_in_threadpool(registry.warm_up)
+    app.state.models = registry
+    # `kill -HUP <worker pid>` re-reads env/config and rebuilds the model clients (e.g. after a key rotation)
+    with suppress(NotImplementedError, AttributeError):  # no SIGHUP / loop signal handlers on Windows
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, registry.reload_in_background, warm_up)
+    sweeper = asyncio.create_task(_expire_upload_sessions(registry.config.get("uploads", {}) or {}))
+    yield
+    sweeper.cancel()
+    shutdown_pool()
+
+async def _expire_upload_sessions(cfg: Dict[str, Any]):
+    """Release the uploads (links + blob references) of every session idle past uploads.session_ttl_hours."""
+    ttl = float(cfg.get("session_ttl_hours", 24)) * 3600
+    interval = float(cfg.get("sweep_minutes", 30)) * 60
+    while True:
+        try:
+            await run_in_threadpool(get_blob_store().expire_sessions, ttl)
+        except Exception as e:
+            log.error("Upload session sweep failed", error=str(e))
+        await asyncio.sleep(interval)
+
+app = FastAPI(title="Document Portal API", version="0.1", lifespan=lifespan)
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 app.mount("/static", StaticFiles(directory=str(BASE_DIR / "static")), name="static")
@@ -47,16 +93,22 @@ def health() -> Dict[str, str]:
 
 # ---------- ANALYZE ----------
 @app.post("/analyze")
-async def analyze_document(file: UploadFile = File(...)) -> Any:
+async def analyze_document(file: UploadFile = File(...), mode: Optional[str] = Form(None)) -> Any:
     try:
+        _check_upload_size(file)
+        if mode and mode.lower() not in ANALYSIS_MODES:
+            raise HTTPException(status_code=400, detail=f"Unsupported mode: {mode} (expected one of {ANALYSIS_MODES})")
         dh = DocHandler()
-        saved_path = dh.save_pdf(FastAPIFileAdapter(file))
-        text = _read_pdf_via_handler(dh, saved_path)
-        analyzer = DocumentAnalyzer()
-        result = analyzer.analyze_document(text)
+        saved_path = await run_in_threadpool(dh.save_pdf, FastAPIFileAdapter(file))
+        analyzer = DocumentAnalyzer(mode=mode)  # mode: trim | map_reduce (default from config)
+        # pages are extracted on demand: trim mode only reads the head and tail pages
+        with await run_in_threadpool(dh.open_pdf, saved_path) as document:
+            result = await run_in_threadpool(analyzer.analyze_document, document)
         return JSONResponse(content=result)
     except HTTPException:
         raise
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Analysis failed: {e}")
 
@@ -64,17 +116,21 @@ async def analyze_document(file: UploadFile = File(...)) -> Any:
 @app.post("/compare")
 async def compare_documents(reference: UploadFile = File(...), actual: UploadFile = File(...)) -> Any:
     try:
+        _check_upload_size(reference, actual)
         dc = DocumentComparator()
-        ref_path, act_path = dc.save_uploaded_files(
-            FastAPIFileAdapter(reference), FastAPIFileAdapter(actual)
+        ref_path, act_path = await run_in_threadpool(
+            dc.save_uploaded_files, FastAPIFileAdapter(reference), FastAPIFileAdapter(actual)
         )
         _ = ref_path, act_path
-        combined_text = dc.combine_documents()
+        # page extraction waits on the process pool and comparing is an LLM call: keep both off the loop
+        combined_text = await run_in_threadpool(dc.combine_documents)
         comp = DocumentComparatorLLM()
-        df = comp.compare_documents(combined_text)
+        df = await run_in_threadpool(comp.compare_documents, combined_text)
         return {"rows": df.to_dict(orient="records"), "session_id": dc.session_id}
     except HTTPException:
         raise
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Comparison failed: {e}")
 
@@ -87,45 +143,64 @@ async def chat_build_index(
     chunk_size: int = Form(1000),
     chunk_overlap: int = Form(200),
     k: int = Form(5),
+    shared: Optional[bool] = Form(None),
 ) -> Any:
     try:
+        _check_upload_size(*files)
         wrapped = [FastAPIFileAdapter(f) for f in files]
         ci = ChatIngestor(
             temp_base=UPLOAD_BASE,
             faiss_base=FAISS_BASE,
             use_session_dirs=use_session_dirs,
             session_id=session_id or None,
+            shared=shared_index_enabled() if shared is None else shared,
         )
         # NOTE: ensure your ChatIngestor saves with index_name="index" or FAISS_INDEX_NAME
         # e.g., if it calls FAISS.save_local(dir, index_name=FAISS_INDEX_NAME)
-        ci.built_retriver(  # if your method name is actually build_retriever, fix it there as well
-            wrapped, chunk_size=chunk_size, chunk_overlap=chunk_overlap, k=k
+        await run_in_threadpool(  # if your method name is actually build_retriever, fix it there as well
+            ci.built_retriver, wrapped, chunk_size=chunk_size, chunk_overlap=chunk_overlap, k=k
         )
-        return {"session_id": ci.session_id, "k": k, "use_session_dirs": use_session_dirs}
+        # drop any cached store/chains for this index so the next query sees the new vectors
+        get_vectorstore_cache().invalidate(str(ci.faiss_dir), index_name=FAISS_INDEX_NAME)
+        return {
+            "session_id": ci.session_id,
+            "k": k,
+            "use_session_dirs": use_session_dirs,
+            "shared": ci.shared is not None,
+        }
     except HTTPException:
         raise
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Indexing failed: {e}")
 
 # ---------- CHAT: QUERY ----------
 @app.post("/chat/query")
 async def chat_query(
+    background_tasks: BackgroundTasks,
     question: str = Form(...),
     session_id: Optional[str] = Form(None),
     use_session_dirs: bool = Form(True),
     k: int = Form(5),
+    nprobe: Optional[int] = Form(None),
+    ef_search: Optional[int] = Form(None),
+    shared: Optional[bool] = Form(None),
+    sessions: Optional[str] = Form(None),
 ) -> Any:
     try:
-        if use_session_dirs and not session_id:
-            raise HTTPException(status_code=400, detail="session_id is required when use_session_dirs=True")
+        # cached per index dir: no FAISS reload / chain rebuild unless the index changed on disk
+        rag = await run_in_threadpool(_get_rag, session_id, use_session_dirs, k, shared, sessions)
 
-        index_dir = os.path.join(FAISS_BASE, session_id) if use_session_dirs else FAISS_BASE  # type: ignore
-        if not os.path.isdir(index_dir):
-            raise HTTPException(status_code=404, detail=f"FAISS index not found at: {index_dir}")
+        def answer() -> str:
+            with search_params(nprobe=nprobe, ef_search=ef_search):  # only used by IVF / HNSW indexes
+                return rag.invoke(question, chat_history=_chat_history(session_id), session_id=session_id)
 
-        rag = ConversationalRAG(session_id=session_id)
-        rag.load_retriever_from_faiss(index_dir, k=k, index_name=FAISS_INDEX_NAME)  # build retriever + chain
-        response = rag.invoke(question, chat_history=[])
+        # LLM calls (and their rate-limit backoff) must not block the event loop
+        response = await run_in_threadpool(answer)
+        if session_id:
+            # after the response is sent: may summarize older turns with an LLM call
+            background_tasks.add_task(get_chat_memory().append, session_id, question, response)
 
         return {
             "answer": response,
@@ -135,26 +210,144 @@ async def chat_query(
         }
     except HTTPException:
         raise
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Query failed: {e}")
+
+@app.post("/chat/query/stream")
+async def chat_query_stream(
+    question: str = Form(...),
+    session_id: Optional[str] = Form(None),
+    use_session_dirs: bool = Form(True),
+    k: int = Form(5),
+    nprobe: Optional[int] = Form(None),
+    ef_search: Optional[int] = Form(None),
+    shared: Optional[bool] = Form(None),
+    sessions: Optional[str] = Form(None),
+) -> StreamingResponse:
+    """
+    Server-Sent Events: one `sources` event (retrieved chunk metadata), then
+    `token` events as the LLM generates, then `done` (or `error`).
+    """
+    try:
+        rag = await run_in_threadpool(_get_rag, session_id, use_session_dirs, k, shared, sessions)
+    except HTTPException:
+        raise
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Query failed: {e}")
 
+    chat_history = await run_in_threadpool(_chat_history, session_id)
+
+    async def events():
+        tokens: List[str] = []
+        try:
+            with search_params(nprobe=nprobe, ef_search=ef_search):
+                async for event in rag.astream(question, chat_history=chat_history, session_id=session_id):
+                    if event["type"] == "token":
+                        tokens.append(event["content"])
+                    yield _sse(event["type"], event)
+            yield _sse("done", {"session_id": session_id, "k": k, "engine": "LCEL-RAG"})
+        except Exception as e:
+            yield _sse("error", {"detail": f"Query failed: {e}"})
+            return
+        if session_id:
+            await run_in_threadpool(get_chat_memory().append, session_id, question, "".join(tokens))
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"},
+    )
+
+@app.delete("/chat/history/{session_id}")
+def chat_history_clear(session_id: str) -> Dict[str, Any]:
+    get_chat_memory().clear(session_id)
+    return {"session_id": session_id, "cleared": True}
+
+@app.get("/cache/stats")
+def cache_stats() -> Dict[str, Any]:
+    registry = get_model_registry()
+    emb_cache = registry.embedding_cache
+    return {
+        "vectorstore": get_vectorstore_cache().stats(),
+        "embeddings": emb_cache.stats() if emb_cache else None,
+        "llm_responses": registry.llm_cache.stats() if registry.llm_cache else None,
+        "uploads": get_blob_store().stats(),
+        "artifacts": get_artifact_cache().stats(),
+        "rewrites": get_rewrite_cache().stats(),
+        "chat_memory": get_chat_memory().stats(),
+        "answers": get_answer_cache().stats() if get_answer_cache() else None,
+        "shared_index": get_shared_index().stats() if shared_index_enabled() else None,
+        "rate_limits": registry.rate_limits.stats() if registry.rate_limits else None,
+    }
+
 
 # ---------- Helpers ----------
+def _chat_history(session_id: Optional[str]) -> list:
+    """Server-side history window for the session (none without a session id)."""
+    return get_chat_memory().get_history(session_id) if session_id else []
+
 class FastAPIFileAdapter:
-    """Adapt FastAPI UploadFile -> .name + .getbuffer() API"""
+    """Adapt FastAPI UploadFile -> .name + .iter_chunks() / .getbuffer() API"""
     def __init__(self, uf: UploadFile):
         self._uf = uf
         self.name = uf.filename
+        self.size = uf.size
+    def iter_chunks(self, chunk_size: int = UPLOAD_CHUNK_BYTES):
+        # UploadFile is already spooled by Starlette; copy it out without materializing it
+        self._uf.file.seek(0)
+        while True:
+            block = self._uf.file.read(chunk_size)
+            if not block:
+                break
+            yield block
     def getbuffer(self) -> bytes:
         self._uf.file.seek(0)
         return self._uf.file.read()
 
-def _read_pdf_via_handler(handler: DocHandler, path: str) -> str:
-    if hasattr(handler, "read_pdf"):
-        return handler.read_pdf(path)  # type: ignore
-    if hasattr(handler, "read_"):
-        return handler.read_(path)  # type: ignore
-    raise RuntimeError("DocHandler has neither read_pdf nor read_ method.")
+def _get_rag(
+    session_id: Optional[str],
+    use_session_dirs: bool,
+    k: int,
+    shared: Optional[bool],
+    sessions: Optional[str],
+) -> ConversationalRAG:
+    """
+    The cached chain for a query: per-session index dir, or the shared index
+    filtered to session_id plus any comma-separated `sessions` (cross-session search).
+    """
+    if shared is None:
+        shared = shared_index_enabled()
+    if not shared:
+        index_dir = _resolve_index_dir(session_id, use_session_dirs)
+        return get_vectorstore_cache().get_rag(index_dir, k=k, index_name=FAISS_INDEX_NAME)
+    session_ids = [s for s in [session_id, *(sessions or "").split(",")] if s and s.strip()]
+    if not session_ids:
+        raise HTTPException(status_code=400, detail="session_id or sessions is required for the shared index")
+    return get_vectorstore_cache().get_shared_rag([s.strip() for s in session_ids], k=k)
+
+def _resolve_index_dir(session_id: Optional[str], use_session_dirs: bool) -> str:
+    if use_session_dirs and not session_id:
+        raise HTTPException(status_code=400, detail="session_id is required when use_session_dirs=True")
+    index_dir = os.path.join(FAISS_BASE, session_id) if use_session_dirs else FAISS_BASE  # type: ignore
+    if not os.path.isdir(index_dir):
+        raise HTTPException(status_code=404, detail=f"FAISS index not found at: {index_dir}")
+    return index_dir
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def _check_upload_size(*files: UploadFile) -> None:
+    """
+    Reject oversized uploads before copying a single byte. Chunked uploads declare
+    no size: they are stopped while streaming (UploadTooLarge, answered with 413).
+    """
+    for f in files:
+        if f.size is not None and f.size > UPLOAD_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"{f.filename} exceeds {UPLOAD_MAX_BYTES} bytes")
 
 
 
@@ -0,0 +1,76 @@
+"""
+Compare text-extraction backends on throughput and memory.
+
+Each (backend, file) pair runs in a fresh process so peak RSS is not polluted
+by earlier runs; the PDF process pool is disabled so numbers are per-core.
+
+    python -m benchmarks.extractor_benchmark data/sample.pdf other.pdf --repeat 3
+"""
+import os
+import sys
+import time
+import argparse
+import resource
+import multiprocessing
+from pathlib import Path
+
+# measure single-process extraction; parallelism is benchmarked separately
+os.environ.setdefault("PDF_WORKERS", "1")
+
+
+def _run(backend: str, path: str, repeat: int, out):
+    from utils.extractors import EXTRACTORS
+
+    extractor = EXTRACTORS[backend]()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    timings, pages, chars = [], 0, 0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        docs = extractor.extract(path)
+        timings.append(time.perf_counter() - t0)
+        pages, chars = len(docs), sum(len(d.page_content) for d in docs)
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    out.put({
+        "backend": backend,
+        "file": Path(path).name,
+        "pages": pages,
+        "chars": chars,
+        "best_s": min(timings),
+        "pages_per_s": pages / min(timings) if min(timings) > 0 else float("inf"),
+        "peak_rss_mb": max(rss_after - rss_before, 0) / 1024,  # ru_maxrss is KiB on Linux
+    })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--backends", nargs="*", help="default: every backend configured for each extension")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    from utils.extractors import extractor_chain
+
+    ctx = multiprocessing.get_context("spawn")
+    rows = []
+    for path in args.files:
+        backends = args.backends or [e.name for e in extractor_chain(Path(path).suffix)]
+        for backend in backends:
+            q = ctx.Queue()
+            p = ctx.Process(target=_run, args=(backend, path, args.repeat, q))
+            p.start()
+            p.join()
+            if p.exitcode != 0:
+                print(f"{backend} failed on {path} (exit {p.exitcode})", file=sys.stderr)
+                continue
+            rows.append(q.get())
+
+    header = f"{'backend':<10} {'file':<30} {'pages':>6} {'chars':>10} {'best s':>8} {'pages/s':>9} {'peak MB':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(f"{r['backend']:<10} {r['file'][:30]:<30} {r['pages']:>6} {r['chars']:>10} "
+              f"{r['best_s']:>8.3f} {r['pages_per_s']:>9.1f} {r['peak_rss_mb']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Recall and memory of compressed FAISS bases (faiss_db.compression) against
+exact float32 search.
+
+Each configuration is built with the same code path compaction uses
+(faiss_index.build_index); recall@k is measured against a brute-force flat
+index over the full-precision vectors, and "codes MB" is the serialized size
+of the index that stays resident (full-precision vectors are re-read from
+disk for re-ranking only).
+
+    python -m benchmarks.vector_compression_benchmark --vectors embeddings.npy --k 5
+    python -m benchmarks.vector_compression_benchmark --n 50000 --dim 768   # synthetic
+
+Without --vectors, unit-norm vectors with a decaying spectrum are generated,
+which roughly mimics Matryoshka-trained embeddings (most variance up front).
+"""
+import time
+import argparse
+
+import numpy as np
+import faiss
+
+CONFIGS = [
+    ("none", 0),
+    ("fp16", 0),
+    ("int8", 0),
+    ("fp16", 384),
+    ("int8", 384),
+    ("int8", 256),
+]
+
+
+def _synthetic(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    scale = 1.0 / np.sqrt(1.0 + np.arange(dim) / 16.0)
+    x = (rng.standard_normal((n, dim)) * scale).astype("float32")
+    faiss.normalize_L2(x)
+    return x
+
+
+def _recall(truth: np.ndarray, found: np.ndarray) -> float:
+    k = truth.shape[1]
+    return float(np.mean([len(set(t) & set(f)) / k for t, f in zip(truth, found)]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", help=".npy float32 matrix (rows = embeddings); default: synthetic")
+    parser.add_argument("--n", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--kind", default="flat", choices=["flat", "hnsw", "ivf_flat"])
+    parser.add_argument("--rerank", type=int, nargs="*", default=[1, 4])
+    args = parser.parse_args(argv)
+
+    from src.document_ingestion.faiss_index import IndexSettings, build_index
+
+    data = np.load(args.vectors).astype("float32") if args.vectors else _synthetic(args.n + args.queries, args.dim)
+    queries, base = data[: args.queries], np.ascontiguousarray(data[args.queries:])
+    exact = faiss.IndexFlatL2(base.shape[1])
+    exact.add(base)
+    _, truth = exact.search(queries, args.k)
+
+    header = f"{'codes':<6} {'dim':>5} {'rerank':>6} {'recall@k':>9} {'codes MB':>9} {'ratio':>6} {'ms/query':>9}"
+    print(f"{len(base)} vectors x {base.shape[1]} dims, {args.queries} queries, k={args.k}, index={args.kind}")
+    print(header)
+    print("-" * len(header))
+    full_mb = base.nbytes / 2**20
+    for qtype, dim in CONFIGS:
+        for rerank in args.rerank if (qtype, dim) != ("none", 0) else [1]:
+            settings = IndexSettings({
+                "index": {"type": args.kind},
+                "compression": {"type": qtype, "dim": dim, "rerank": rerank},
+            })
+            index = build_index(args.kind, base, faiss.METRIC_L2, settings, compressed=True)
+            codes = getattr(index, "base_index", index)
+            mb = faiss.serialize_index(codes).nbytes / 2**20
+            t0 = time.perf_counter()
+            _, found = index.search(queries, args.k)
+            ms = (time.perf_counter() - t0) * 1000 / len(queries)
+            print(f"{qtype:<6} {dim or base.shape[1]:>5} {rerank:>6} {_recall(truth, found):>9.4f} "
+                  f"{mb:>9.1f} {full_mb / mb:>5.1f}x {ms:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -25,4 +25,7 @@ class PromptType(str, Enum):
     DOCUMENT_ANALYSIS = "document_analysis"
     DOCUMENT_COMPARISON = "document_comparison"
     CONTEXTUALIZE_QUESTION = "contextualize_question"
-    CONTEXT_QA = "context_qa"
\ No newline at end of file
+    CONTEXT_QA = "context_qa"
+    SUMMARIZE_HISTORY = "summarize_history"
+    DOCUMENT_SECTION_NOTES = "document_section_notes"
+    DOCUMENT_ANALYSIS_REDUCE = "document_analysis_reduce"
\ No newline at end of file
@@ -52,12 +52,55 @@ context_qa_prompt = ChatPromptTemplate.from_messages([
     ("human", "{input}"),
 ])
 
+# Prompt for folding older chat turns into a running summary
+summarize_history_prompt = ChatPromptTemplate.from_messages([
+    ("system", (
+        "You maintain a running summary of a conversation about some documents. Extend the existing summary with "
+        "the new messages below. Keep names, figures and open questions the user may refer back to; drop "
+        "pleasantries. Reply with the updated summary only, at most five sentences.\n\n"
+        "Existing summary: {summary}"
+    )),
+    MessagesPlaceholder("chat_history"),
+])
+
+# Map step of map-reduce analysis: notes on one section of a long document
+document_section_notes_prompt = ChatPromptTemplate.from_template("""
+You are reading part {section_no} of {section_count} of a longer document.
+Write concise notes on this part only:
+- 3 to 6 bullet points with its key content
+- any title, author, publisher, creation or modification date, and language you can see
+- the overall tone of this part in a few words
+
+Do not invent details that are not in the text.
+
+Document part:
+{section_text}
+""")
+
+# Reduce step: metadata for the whole document from the section notes
+document_analysis_reduce_prompt = ChatPromptTemplate.from_template("""
+You are a highly capable assistant trained to analyze and summarize documents.
+Below are notes on consecutive parts of one document, in order. Combine them
+into metadata and a summary for the whole document.
+Return ONLY valid JSON matching the exact schema below.
+
+{format_instructions}
+
+Page count (from the extracted text): {page_count}
+
+Notes:
+{section_notes}
+""")
+
 # Central dictionary to register prompts
 PROMPT_REGISTRY = {
     "document_analysis": document_analysis_prompt,
     "document_comparison": document_comparison_prompt,
     "contextualize_question": contextualize_question_prompt,
     "context_qa": context_qa_prompt,
+    "summarize_history": summarize_history_prompt,
+    "document_section_notes": document_section_notes_prompt,
+    "document_analysis_reduce": document_analysis_reduce_prompt,
 }
 
 
@@ -1,13 +1,27 @@
 import os
+import re
 import sys
-from utils.model_loader import ModelLoader
+from typing import Any, List, Optional, Union
+from utils.model_loader import get_model_registry
 from logger.custom_logger import CustomLogger
 from exception.custom_exception import DocumentPortalException
 from model.models import *
 from langchain_core.output_parsers import JsonOutputParser
 from langchain_classic.output_parsers import OutputFixingParser
+from langchain_core.output_parsers import StrOutputParser
+from langchain_text_splitters import RecursiveCharacterTextSplitter
 from prompt.prompt_library import *
 
+ANALYSIS_MODES = ("trim", "map_reduce")
+
+# Page markers written by DocHandler.read_pdf
+_PAGE_MARKER = re.compile(r"--- Page (\d+) ---")
+
+
+def approx_tokens(text: str) -> int:
+    # ~4 chars per token is a common rule of thumb for English
+    return max(1, len(text) // 4)
+
 # helper function 
 # trim what to send to metadata, reduces 429s dramatically
 def trim_text_for_metadata(text: str, head_chars: int = 15000, tail_chars: int = 3000) -> str:
@@ -19,33 +33,58 @@ def trim_text_for_metadata(text: str, head_chars: int = 15000, tail_chars: int =
     if len(text) <= head_chars + tail_chars:
         return text
 
-    head = text[:head_chars]
-    tail = text[-tail_chars:]
+    return _join_head_tail(text[:head_chars], text[-tail_chars:])
 
+def _join_head_tail(head: str, tail: str) -> str:
     return (
         head
         + "\n\n--- [TRUNCATED MIDDLE CONTENT] ---\n\n"
         + tail
     )
 
+def trim_document_for_metadata(document, head_chars: int = 15000, tail_chars: int = 3000) -> str:
+    """
+    Same result as trim_text_for_metadata(document.text()) for a lazy document
+    (see LazyPdfDocument), extracting only the pages the head and tail need.
+    """
+    head, tail, complete = document.head_tail(head_chars, tail_chars)
+    if complete:
+        return trim_text_for_metadata(head, head_chars, tail_chars)
+    # pages in between were never read, so the text is longer than head + tail
+    return _join_head_tail(head[:head_chars], tail[-tail_chars:])
+
 class DocumentAnalyzer:
     """
     Analyzes documents using a pre-trained model.
     Automatically logs all actions and supports session-based organization.
+
+    mode "trim" (default) sends the head and tail of the text in one call;
+    "map_reduce" writes notes on every token-budgeted section concurrently
+    (as batch-priority calls) and reduces them into the Metadata schema, so the whole
+    document is covered (config: analysis).
     """
-    def __init__(self):
+    def __init__(self, mode: Optional[str] = None):
         self.log = CustomLogger().get_logger(__name__)
         try:
-            self.loader=ModelLoader()
-            self.llm=self.loader.load_llm()
+            self.registry=get_model_registry()
+            self.llm=self.registry.get_llm(cached=True)  # temperature 0: identical inputs reuse the stored response
             
             # Prepare parsers
             self.parser = JsonOutputParser(pydantic_object=Metadata)
             self.fixing_parser = OutputFixingParser.from_llm(parser=self.parser, llm=self.llm)
             
             self.prompt = prompt
+
+            cfg = self.registry.config.get("analysis", {}) or {}
+            self.mode = (mode or cfg.get("mode", "trim")).lower()
+            if self.mode not in ANALYSIS_MODES:
+                raise ValueError(f"Unsupported analysis mode: {self.mode} (expected one of {ANALYSIS_MODES})")
+            self.section_tokens = int(cfg.get("section_tokens", 6000))
+            self.max_concurrency = int(cfg.get("max_concurrency", 4))
+            # section calls are bulk work: they yield to interactive calls in the shared rate limiter
+            self.section_llm = self.registry.get_llm(cached=True, priority="batch")
             
-            self.log.info("DocumentAnalyzer initialized successfully")
+            self.log.info("DocumentAnalyzer initialized successfully", mode=self.mode)
             
             
         except Exception as e:
@@ -55,13 +94,27 @@ class DocumentAnalyzer:
             raise DocumentPortalException("Error in DocumentAnalyzer initialization") from e
 
 
-    def analyze_document(self, document_text: str) -> dict:
+    def analyze_document(self, document_text: Union[str, Any]) -> dict:
         """
         Analyze a document's text and extract structured metadata & summary.
+        document_text may also be a lazy document (DocHandler.open_pdf): only the
+        pages the head/tail trim keeps are extracted.
         """
+        lazy = None if isinstance(document_text, str) else document_text
+        if self.mode == "map_reduce":
+            if lazy is not None:
+                document_text = lazy.text()  # map-reduce covers every page
+                lazy = None
+            if approx_tokens(document_text) > self.section_tokens:
+                return self.analyze_map_reduce(document_text)
         try:
             # 1) Trim large docs for metadata extraction
-            trimmed_text = trim_text_for_metadata(document_text)
+            if lazy is None:
+                trimmed_text = trim_text_for_metadata(document_text)
+                source = {"original_length_chars": len(document_text)}
+            else:
+                trimmed_text = trim_document_for_metadata(lazy)
+                source = {"page_count": lazy.page_count, "pages_extracted": lazy.pages_extracted}
 
             # 2) Prompt-size logging (before calling the LLM)
             format_instructions = self.parser.get_format_instructions()
@@ -74,7 +127,7 @@ class DocumentAnalyzer:
 
             self.log.info(
                 "Prepared metadata prompt payload",
-                original_length_chars=len(document_text),
+                **source,
                 trimmed_length_chars=len(trimmed_text),
                 format_instructions_chars=len(format_instructions),
                 approx_tokens_document=approx_tokens_doc,
@@ -98,9 +151,91 @@ class DocumentAnalyzer:
                 "document_text": trimmed_text,
             })
 
+            if lazy is not None:
+                response["PageCount"] = lazy.page_count  # from the page tree, not the LLM's guess
             self.log.info("Metadata extraction successful", keys=list(response.keys()))
             return response
 
         except Exception as e:
             self.log.exception("Metadata analysis failed")
             raise DocumentPortalException("Metadata extraction failed") from e
+
+    def analyze_map_reduce(self, document_text: str) -> dict:
+        """
+        Notes per section (concurrent, rate limited), collapsed while they exceed
+        one section's budget, then a single reduce call into the Metadata schema.
+        """
+        try:
+            sections = self._split(document_text)
+            pages = [int(n) for n in _PAGE_MARKER.findall(document_text)]
+            self.log.info(
+                "Map-reduce analysis started",
+                original_length_chars=len(document_text),
+                sections=len(sections),
+                section_tokens=self.section_tokens,
+                max_concurrency=self.max_concurrency,
+            )
+
+            notes = self._section_notes(sections)
+            rounds = 0
+            while len(notes) > 1 and approx_tokens("\n\n".join(notes)) > self.section_tokens:
+                groups = self._pack(notes)
+                if len(groups) == len(notes):
+                    break  # every note alone fills a section: collapsing cannot shrink further
+                notes = self._section_notes(groups)
+                rounds += 1
+
+            chain = PROMPT_REGISTRY[PromptType.DOCUMENT_ANALYSIS_REDUCE.value] | self.llm | self.fixing_parser
+            response = chain.invoke({
+                "format_instructions": self.parser.get_format_instructions(),
+                "page_count": max(pages) if pages else "Not Available",
+                "section_notes": "\n\n".join(f"[Part {i + 1}]\n{n}" for i, n in enumerate(notes)),
+            })
+            if pages:
+                response["PageCount"] = max(pages)
+
+            self.log.info(
+                "Metadata extraction successful",
+                keys=list(response.keys()),
+                mode="map_reduce",
+                sections=len(sections),
+                collapse_rounds=rounds,
+            )
+            return response
+
+        except Exception as e:
+            self.log.exception("Map-reduce metadata analysis failed")
+            raise DocumentPortalException("Metadata extraction failed") from e
+
+    def _split(self, text: str) -> List[str]:
+        # prefer page boundaries, then paragraphs
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=self.section_tokens,
+            chunk_overlap=0,
+            length_function=approx_tokens,
+            separators=["\n--- Page ", "\n\n", "\n", " ", ""],
+        )
+        return splitter.split_text(text)
+
+    def _pack(self, notes: List[str]) -> List[str]:
+        """Group consecutive notes into texts of at most section_tokens."""
+        groups: List[str] = []
+        current: List[str] = []
+        for note in notes:
+            if current and approx_tokens("\n\n".join(current + [note])) > self.section_tokens:
+                groups.append("\n\n".join(current))
+                current = []
+            current.append(note)
+        if current:
+            groups.append("\n\n".join(current))
+        return groups
+
+    def _section_notes(self, sections: List[str]) -> List[str]:
+        chain = PROMPT_REGISTRY[PromptType.DOCUMENT_SECTION_NOTES.value] | self.section_llm | StrOutputParser()
+        return chain.batch(
+            [
+                {"section_text": text, "section_no": i + 1, "section_count": len(sections)}
+                for i, text in enumerate(sections)
+            ],
+            config={"max_concurrency": self.max_concurrency},
+        )
@@ -0,0 +1,118 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional
+
+import numpy as np
+
+from utils.config_loader import load_config
+
+
+class _Scope:
+    __slots__ = ("generation", "vectors", "entries")
+
+    def __init__(self, generation: Any):
+        self.generation = generation
+        self.vectors: List[np.ndarray] = []
+        self.entries: List[Dict[str, Any]] = []
+
+
+class SemanticAnswerCache:
+    """
+    Per-session cache of answers, looked up by embedding similarity of the
+    (standalone) question rather than its exact wording.
+
+    A scope is one session index + retriever k. An entry is only served while
+    the index generation it was answered from is current; any change to the
+    index empties the scope. Each scope keeps at most max_entries answers
+    (least recently used dropped first) and at most max_scopes scopes are kept.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 256, max_scopes: int = 1000):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_scopes = max_scopes
+        self._lock = threading.Lock()
+        self._scopes: "OrderedDict[Hashable, _Scope]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(v))
+        return v / norm if norm else v
+
+    def _scope(self, scope: Hashable, generation: Any) -> _Scope:
+        s = self._scopes.get(scope)
+        if s is not None and s.generation != generation:
+            self._scopes.pop(scope)
+            self.invalidations += 1
+            s = None
+        if s is None:
+            s = _Scope(generation)
+            self._scopes[scope] = s
+            while len(self._scopes) > self.max_scopes:
+                self._scopes.popitem(last=False)
+        self._scopes.move_to_end(scope)
+        return s
+
+    def lookup(self, scope: Hashable, generation: Any, vector) -> Optional[Dict[str, Any]]:
+        """Best cached entry with cosine similarity >= threshold, else None."""
+        q = self._normalize(vector)
+        with self._lock:
+            s = self._scope(scope, generation)
+            if s.vectors:
+                sims = np.stack(s.vectors) @ q
+                best = int(np.argmax(sims))
+                if float(sims[best]) >= self.threshold:
+                    # most recently used last
+                    s.vectors.append(s.vectors.pop(best))
+                    s.entries.append(s.entries.pop(best))
+                    self.hits += 1
+                    return {**s.entries[-1], "similarity": float(sims[best])}
+            self.misses += 1
+            return None
+
+    def store(self, scope: Hashable, generation: Any, vector, question: str, answer: str, sources=None):
+        with self._lock:
+            s = self._scope(scope, generation)
+            s.vectors.append(self._normalize(vector))
+            s.entries.append({"question": question, "answer": answer, "sources": sources or []})
+            if len(s.entries) > self.max_entries:
+                del s.vectors[0], s.entries[0]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "scopes": len(self._scopes),
+                "entries": sum(len(s.entries) for s in self._scopes.values()),
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+_cache: Optional[SemanticAnswerCache] = None
+_cache_loaded = False  # config read once, so a disabled cache is not re-checked per query
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> Optional[SemanticAnswerCache]:
+    """Return the process-wide SemanticAnswerCache (None when config['answer_cache'] disables it)."""
+    global _cache, _cache_loaded
+    if not _cache_loaded:
+        with _cache_lock:
+            if not _cache_loaded:
+                cfg = load_config().get("answer_cache", {}) or {}
+                if cfg.get("enabled", True):
+                    _cache = SemanticAnswerCache(
+                        threshold=float(cfg.get("similarity", 0.95)),
+                        max_entries=int(cfg.get("max_entries", 256)),
+                        max_scopes=int(cfg.get("max_sessions", 1000)),
+                    )
+                _cache_loaded = True
+    return _cache
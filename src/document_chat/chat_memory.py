@@ -0,0 +1,238 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, messages_from_dict, messages_to_dict
+from langchain_core.messages.utils import count_tokens_approximately, trim_messages
+from langchain_core.output_parsers import StrOutputParser
+
+from utils.config_loader import load_config
+from utils.model_loader import get_model_registry
+from prompt.prompt_library import PROMPT_REGISTRY
+from model.models import PromptType
+from logger.custom_logger import CustomLogger
+from exception.custom_exception import DocumentPortalException
+
+log = CustomLogger().get_logger(__name__)
+
+SUMMARY_PREFIX = "Summary of the earlier conversation: "
+
+
+class _Session:
+    __slots__ = ("messages", "summary", "updated")
+
+    def __init__(self, messages: Optional[List[BaseMessage]] = None, summary: str = "", updated: float = 0.0):
+        self.messages: List[BaseMessage] = messages or []
+        self.summary = summary
+        self.updated = updated or time.time()
+
+
+class ChatMemory:
+    """
+    Server-side chat history per session, fed to ConversationalRAG as chat_history.
+
+    - get_history() returns a window of at most max_tokens (approximate): the most
+      recent whole turns, preceded by a running summary of older turns if any.
+    - Turns that fall out of the window are folded into that summary when a
+      summarizer is set, otherwise dropped; either way stored history stays bounded.
+    - Sessions idle for ttl_seconds are evicted; with a path they are also
+      persisted in SQLite and reloaded on first access after a restart.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 1500,
+        ttl_seconds: int = 24 * 3600,
+        max_sessions: int = 10000,
+        path: Optional[str] = None,
+        summarizer: Optional[Callable[[str, List[BaseMessage]], str]] = None,
+    ):
+        try:
+            self.max_tokens = max_tokens
+            self.ttl_seconds = ttl_seconds
+            self.max_sessions = max_sessions
+            self.summarizer = summarizer
+            self._lock = threading.RLock()
+            self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+            self._folding: set = set()  # sessions with a summarization in flight
+            self._conn: Optional[sqlite3.Connection] = None
+            self.summaries = 0
+            self.dropped_messages = 0
+            if path:
+                Path(path).parent.mkdir(parents=True, exist_ok=True)
+                self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    """CREATE TABLE IF NOT EXISTS chat_sessions (
+                           session_id TEXT PRIMARY KEY,
+                           messages TEXT NOT NULL,
+                           summary TEXT NOT NULL,
+                           updated REAL NOT NULL
+                       )"""
+                )
+                self._conn.commit()
+        except Exception as e:
+            log.error("Failed to open chat memory", error=str(e), path=str(path))
+            raise DocumentPortalException("Chat memory initialization error", sys) from e
+
+    # ---------- Public API ----------
+
+    def get_history(self, session_id: str) -> List[BaseMessage]:
+        """The token-budgeted history window for session_id ([] for a new session)."""
+        with self._lock:
+            session = self._get(session_id)
+            if session is None:
+                return []
+            return self._window(session)
+
+    def append(self, session_id: str, question: str, answer: str):
+        """Record one turn, then summarize or drop whatever no longer fits the window."""
+        with self._lock:
+            session = self._get(session_id) or _Session()
+            session.messages.extend([HumanMessage(content=question), AIMessage(content=answer)])
+            session.updated = time.time()
+            self._sessions[session_id] = session
+            self._sessions.move_to_end(session_id)
+            overflow = [] if session_id in self._folding else self._overflow(session)
+            if overflow:
+                self._folding.add(session_id)
+            summary = session.summary
+            self._evict()
+
+        if overflow and self.summarizer is not None:
+            try:
+                summary = self.summarizer(summary, overflow)
+                self.summaries += 1
+            except Exception as e:
+                # keep serving: losing detail from old turns beats failing the request
+                log.warning("Chat history summarization failed", session_id=session_id, error=str(e))
+
+        with self._lock:
+            self._folding.discard(session_id)
+            session = self._sessions.get(session_id)
+            if session is None:
+                return
+            if overflow:
+                del session.messages[: len(overflow)]
+                session.summary = summary
+                self.dropped_messages += len(overflow)
+            self._persist(session_id, session)
+
+    def clear(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM chat_sessions WHERE session_id=?", (session_id,))
+                self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "max_tokens": self.max_tokens,
+                "ttl_seconds": self.ttl_seconds,
+                "persistent": self._conn is not None,
+                "summaries": self.summaries,
+                "dropped_messages": self.dropped_messages,
+            }
+
+    # ---------- Internals ----------
+
+    def _expired(self, updated: float) -> bool:
+        return self.ttl_seconds > 0 and time.time() - updated > self.ttl_seconds
+
+    def _get(self, session_id: str) -> Optional[_Session]:
+        session = self._sessions.get(session_id)
+        if session is None and self._conn is not None:
+            row = self._conn.execute(
+                "SELECT messages, summary, updated FROM chat_sessions WHERE session_id=?", (session_id,)
+            ).fetchone()
+            if row is not None:
+                session = _Session(messages_from_dict(json.loads(row[0])), row[1], row[2])
+                self._sessions[session_id] = session
+        if session is None:
+            return None
+        if self._expired(session.updated):
+            self.clear(session_id)
+            return None
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def _window(self, session: _Session) -> List[BaseMessage]:
+        prefix: List[BaseMessage] = []
+        if session.summary:
+            prefix = [AIMessage(content=SUMMARY_PREFIX + session.summary)]
+        budget = max(self.max_tokens - count_tokens_approximately(prefix), 0)
+        recent = trim_messages(
+            session.messages,
+            max_tokens=budget,
+            token_counter=count_tokens_approximately,
+            strategy="last",
+            start_on="human",
+        )
+        return prefix + recent
+
+    def _overflow(self, session: _Session) -> List[BaseMessage]:
+        """Oldest messages that no longer make it into the window."""
+        kept = len(self._window(session)) - (1 if session.summary else 0)
+        return list(session.messages[: len(session.messages) - kept])
+
+    def _evict(self):
+        # idle sessions first, then least recently used beyond max_sessions
+        for sid in [sid for sid, s in self._sessions.items() if self._expired(s.updated)]:
+            self.clear(sid)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)  # stays in SQLite until its TTL
+        if self._conn is not None and self.ttl_seconds > 0:
+            self._conn.execute("DELETE FROM chat_sessions WHERE updated < ?", (time.time() - self.ttl_seconds,))
+            self._conn.commit()
+
+    def _persist(self, session_id: str, session: _Session):
+        if self._conn is None:
+            return
+        self._conn.execute(
+            "INSERT OR REPLACE INTO chat_sessions(session_id, messages, summary, updated) VALUES (?,?,?,?)",
+            (session_id, json.dumps(messages_to_dict(session.messages)), session.summary, session.updated),
+        )
+        self._conn.commit()
+
+
+def build_summarizer(llm) -> Callable[[str, List[BaseMessage]], str]:
+    """Fold older turns into the running summary with one LLM call."""
+    chain = PROMPT_REGISTRY[PromptType.SUMMARIZE_HISTORY.value] | llm | StrOutputParser()
+
+    def summarize(summary: str, messages: List[BaseMessage]) -> str:
+        return chain.invoke({"summary": summary or "(none)", "chat_history": messages}).strip()
+
+    return summarize
+
+
+_memory: Optional[ChatMemory] = None
+_memory_lock = threading.Lock()
+
+
+def get_chat_memory() -> ChatMemory:
+    """Return the process-wide ChatMemory, configured from config['chat_memory']."""
+    global _memory
+    if _memory is None:
+        with _memory_lock:
+            if _memory is None:
+                cfg = load_config().get("chat_memory", {}) or {}
+                summarizer = None
+                if cfg.get("summarize", False):
+                    registry = get_model_registry()
+                    summarizer = build_summarizer(registry.get_llm(cfg.get("summary_provider") or None, priority="batch"))
+                _memory = ChatMemory(
+                    max_tokens=int(cfg.get("max_tokens", 1500)),
+                    ttl_seconds=int(cfg.get("ttl_seconds", 24 * 3600)),
+                    max_sessions=int(cfg.get("max_sessions", 10000)),
+                    path=os.getenv("CHAT_MEMORY_PATH", cfg.get("path") or "") or None,
+                    summarizer=summarizer,
+                )
+    return _memory
@@ -0,0 +1,55 @@
+from typing import Any, Dict, List
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Dense (FAISS) + lexical (BM25) retrieval fused by reciprocal rank:
+
+        score(d) = sum over rankings of 1 / (rrf_k + rank(d))
+
+    Each side contributes its top fetch_k; the fused top k are returned. BM25
+    catches exact identifiers (clause/part numbers) that embeddings blur, so a
+    small k is enough.
+    """
+
+    vectorstore: Any
+    lexical: Any  # BM25Index over the same chunk ids as the vectorstore
+    k: int = 5
+    fetch_k: int = 20
+    rrf_k: int = 60
+
+    @staticmethod
+    def _doc_id(doc: Document) -> str:
+        return doc.id or (doc.metadata or {}).get("chunk_id") or doc.page_content
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        fetch_k = max(self.fetch_k, self.k)
+        dense = self.vectorstore.similarity_search(query, k=fetch_k)
+        sparse = self.lexical.search(query, k=fetch_k)
+
+        scores: Dict[str, float] = {}
+        docs: Dict[str, Document] = {}
+        for rank, doc in enumerate(dense):
+            cid = self._doc_id(doc)
+            docs[cid] = doc
+            scores[cid] = scores.get(cid, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+        for rank, (cid, _) in enumerate(sparse):
+            scores[cid] = scores.get(cid, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+
+        fused: List[Document] = []
+        for cid in sorted(scores, key=scores.get, reverse=True):
+            doc = docs.get(cid)
+            if doc is None:
+                doc = self.vectorstore.docstore.search(cid)
+                if not isinstance(doc, Document):  # BM25 ahead of a concurrent delete
+                    continue
+            fused.append(doc)
+            if len(fused) >= self.k:
+                break
+        return fused
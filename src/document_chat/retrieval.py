@@ -1,19 +1,31 @@
 import sys
 import os
+from contextlib import contextmanager
+from contextvars import ContextVar
 from operator import itemgetter
-from typing import List, Optional, Dict, Any
+from typing import AsyncIterator, List, Optional, Dict, Any
 
 from langchain_core.messages import BaseMessage
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_community.vectorstores import FAISS
+from langchain_core.runnables import RunnableLambda, RunnableParallel, RunnablePassthrough
+from pathlib import Path
 
-from utils.model_loader import ModelLoader
+from utils.model_loader import get_model_registry
 from exception.custom_exception import DocumentPortalException
 #from logger import GLOBAL_LOGGER as log
 from logger.custom_logger import CustomLogger
 from prompt.prompt_library import PROMPT_REGISTRY
 from model.models import PromptType
+from src.document_ingestion.segment_store import SegmentStore
+from src.document_ingestion.lexical_index import BM25Index
+from src.document_ingestion.faiss_index import search_param_defaults
+from src.document_chat.hybrid_retriever import HybridRetriever
+from src.document_chat.rewrite_cache import get_rewrite_cache
+from src.document_chat.answer_cache import get_answer_cache
+
+# Session of the current invoke/astream call: cached chains are shared by every session on an index
+_call_session: ContextVar[Optional[str]] = ContextVar("rag_call_session", default=None)
 
 
 class ConversationalRAG:
@@ -24,6 +36,14 @@ class ConversationalRAG:
         rag = ConversationalRAG(session_id="abc")
         rag.load_retriever_from_faiss(index_path="faiss_index/abc", k=5, index_name="index")
         answer = rag.invoke("What is ...?", chat_history=[])
+
+        # or token by token (sources first):
+        async for event in rag.astream("What is ...?"):
+            ...
+
+    A chain shared by several sessions (see VectorStoreCache.get_rag) is built
+    with session_id=None; callers pass their session_id to invoke/astream so
+    the logs of that call are attributed to it.
     """
 
     def __init__(self, session_id: Optional[str], retriever=None):
@@ -33,6 +53,16 @@ class ConversationalRAG:
 
             # Load LLM and prompts once
             self.llm = self._load_llm()
+            self.rewrite_llm, self.rewrite_model = self._load_rewrite_llm()
+            self.rewrite_cache = get_rewrite_cache()
+            rewrite_cfg = (get_model_registry().config.get("retriever", {}) or {}).get("rewrite", {}) or {}
+            self.speculative = bool(rewrite_cfg.get("speculative", False))
+            self.speculative_similarity = float(rewrite_cfg.get("speculative_similarity", 0.8))
+
+            # Semantic answer cache; only used once a cache scope is set (see VectorStoreCache.get_rag)
+            self.answer_cache = get_answer_cache()
+            self.cache_scope = None
+            self.index_generation = None
             self.contextualize_prompt: ChatPromptTemplate = PROMPT_REGISTRY[
                 PromptType.CONTEXTUALIZE_QUESTION.value
             ]
@@ -42,7 +72,11 @@ class ConversationalRAG:
 
             # Lazy pieces
             self.retriever = retriever
+            self.search_params: Dict[str, int] = {}
             self.chain = None
+            self.rewrite_chain = None
+            self.retrieve_chain = None
+            self.answer_chain = None
             if self.retriever is not None:
                 self._build_lcel_chain()
 
@@ -63,32 +97,29 @@ class ConversationalRAG:
     ):
         """
         Load FAISS vectorstore from disk and build retriever + LCEL chain.
+        search_type="hybrid" fuses it with the BM25 index persisted next to it.
         """
         try:
             if not os.path.isdir(index_path):
                 raise FileNotFoundError(f"FAISS index directory not found: {index_path}")
 
-            embeddings = ModelLoader().load_embeddings()
-            vectorstore = FAISS.load_local(
-                index_path,
-                embeddings,
-                index_name=index_name,
-                allow_dangerous_deserialization=True,  # ok if you trust the index
-            )
-
-            if search_kwargs is None:
-                search_kwargs = {"k": k}
-
-            self.retriever = vectorstore.as_retriever(
-                search_type=search_type, search_kwargs=search_kwargs
+            embeddings = get_model_registry().get_embeddings()
+            store = SegmentStore(Path(index_path), index_name=index_name)
+            gen = store.last_gen()
+            vectorstore = store.load(embeddings)
+            if vectorstore is None:
+                raise FileNotFoundError(f"No FAISS data in: {index_path}")
+            lexical = BM25Index.for_store(store, vectorstore, gen) if search_type == "hybrid" else None
+            self.load_retriever_from_vectorstore(
+                vectorstore, k=k, search_type=search_type, search_kwargs=search_kwargs, lexical=lexical
             )
-            self._build_lcel_chain()
 
             self.log.info(
                 "FAISS retriever loaded successfully",
                 index_path=index_path,
                 index_name=index_name,
                 k=k,
+                search_type=search_type,
                 session_id=self.session_id,
             )
             return self.retriever
@@ -97,8 +128,73 @@ class ConversationalRAG:
             self.log.error("Failed to load retriever from FAISS", error=str(e))
             raise DocumentPortalException("Loading error in ConversationalRAG", sys)
 
-    def invoke(self, user_input: str, chat_history: Optional[List[BaseMessage]] = None) -> str:
+    def load_retriever_from_vectorstore(
+        self,
+        vectorstore,
+        k: int = 5,
+        search_type: str = "similarity",
+        search_kwargs: Optional[Dict[str, Any]] = None,
+        lexical: Optional[BM25Index] = None,
+    ):
+        """
+        Build retriever + LCEL chain on an already-loaded vectorstore
+        (e.g. one held by the VectorStoreCache). search_type="hybrid" needs the
+        matching BM25 index as lexical.
+        """
+        try:
+            search_kwargs = dict(search_kwargs or {"k": k})
+            # approximate-index breadth (IVF nprobe / HNSW efSearch), applied around each query
+            self.search_params = {
+                name: search_kwargs.pop(name) for name in ("nprobe", "ef_search") if name in search_kwargs
+            }
+
+            if search_type == "hybrid":
+                if lexical is None:
+                    raise ValueError("Hybrid retrieval needs a BM25 index")
+                cfg = (get_model_registry().config.get("retriever", {}) or {}).get("hybrid", {}) or {}
+                self.retriever = HybridRetriever(
+                    vectorstore=vectorstore,
+                    lexical=lexical,
+                    k=search_kwargs.get("k", k),
+                    fetch_k=int(cfg.get("fetch_k", 20)),
+                    rrf_k=int(cfg.get("rrf_k", 60)),
+                )
+            else:
+                self.retriever = vectorstore.as_retriever(
+                    search_type=search_type, search_kwargs=search_kwargs
+                )
+            self._build_lcel_chain()
+            return self.retriever
+        except Exception as e:
+            self.log.error("Failed to build retriever from vectorstore", error=str(e))
+            raise DocumentPortalException("Retriever error in ConversationalRAG", sys)
+
+    @property
+    def current_session(self) -> Optional[str]:
+        return _call_session.get() or self.session_id
+
+    @contextmanager
+    def _for_session(self, session_id: Optional[str]):
+        token = _call_session.set(session_id)
+        try:
+            yield
+        finally:
+            try:
+                _call_session.reset(token)
+            except ValueError:
+                pass  # stream closed from another context (e.g. finalized by the GC)
+
+    def invoke(
+        self,
+        user_input: str,
+        chat_history: Optional[List[BaseMessage]] = None,
+        session_id: Optional[str] = None,
+    ) -> str:
         """Invoke the LCEL pipeline."""
+        with self._for_session(session_id):
+            return self._invoke(user_input, chat_history)
+
+    def _invoke(self, user_input: str, chat_history: Optional[List[BaseMessage]]) -> str:
         try:
             if self.chain is None:
                 raise DocumentPortalException(
@@ -106,15 +202,20 @@ class ConversationalRAG:
                 )
             chat_history = chat_history or []
             payload = {"input": user_input, "chat_history": chat_history}
-            answer = self.chain.invoke(payload)
+            with search_param_defaults(**self.search_params):
+                state = self.chain.invoke(payload)
+            answer = state["answer"]
+            if state["cached"] is not None:
+                return answer
             if not answer:
                 self.log.warning(
-                    "No answer generated", user_input=user_input, session_id=self.session_id
+                    "No answer generated", user_input=user_input, session_id=self.current_session
                 )
                 return "no answer generated."
+            self._store_answer(state["rewritten"], state["vector"], answer)
             self.log.info(
                 "Chain invoked successfully",
-                session_id=self.session_id,
+                session_id=self.current_session,
                 user_input=user_input,
                 answer_preview=str(answer)[:150],
             )
@@ -123,11 +224,69 @@ class ConversationalRAG:
             self.log.error("Failed to invoke ConversationalRAG", error=str(e))
             raise DocumentPortalException("Invocation error in ConversationalRAG", sys)
 
+    async def astream(
+        self,
+        user_input: str,
+        chat_history: Optional[List[BaseMessage]] = None,
+        session_id: Optional[str] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream the answer. Yields {"type": "sources", "sources": [...]} once retrieval
+        is done, then {"type": "token", "content": "..."} per LLM chunk.
+        """
+        with self._for_session(session_id):
+            async for event in self._astream(user_input, chat_history):
+                yield event
+
+    async def _astream(
+        self, user_input: str, chat_history: Optional[List[BaseMessage]]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        try:
+            if self.chain is None:
+                raise DocumentPortalException(
+                    "RAG chain not initialized. Call load_retriever_from_faiss() before astream().", sys
+                )
+            chat_history = chat_history or []
+            payload = {"input": user_input, "chat_history": chat_history}
+            with search_param_defaults(**self.search_params):
+                state = await self.retrieve_chain.ainvoke(payload)
+            cached = state["cached"]
+            if cached is not None:
+                yield {"type": "sources", "sources": cached["sources"], "cached": True}
+                yield {"type": "token", "content": cached["answer"]}
+                return
+
+            docs = state["docs"]
+            sources = [self._source_info(d) for d in docs]
+            yield {"type": "sources", "sources": sources}
+
+            tokens: List[str] = []
+            async for token in self.answer_chain.astream(
+                {"context": self._format_docs(docs), **payload}
+            ):
+                if token:
+                    tokens.append(token)
+                    yield {"type": "token", "content": token}
+            answer = "".join(tokens)
+            answer_len = len(answer)
+            if answer:
+                self._store_answer(state["rewritten"], state["vector"], answer, sources)
+
+            self.log.info(
+                "Chain streamed successfully",
+                session_id=self.current_session,
+                user_input=user_input,
+                answer_chars=answer_len,
+            )
+        except Exception as e:
+            self.log.error("Failed to stream ConversationalRAG", error=str(e))
+            raise DocumentPortalException("Streaming error in ConversationalRAG", sys)
+
     # ---------- Internals ----------
 
     def _load_llm(self):
         try:
-            llm = ModelLoader().load_llm()
+            llm = get_model_registry().get_llm()
             if not llm:
                 raise ValueError("LLM could not be loaded")
             self.log.info("LLM loaded successfully", session_id=self.session_id)
@@ -136,6 +295,161 @@ class ConversationalRAG:
             self.log.error("Failed to load LLM", error=str(e))
             raise DocumentPortalException("LLM loading error in ConversationalRAG", sys)
 
+    def _load_rewrite_llm(self):
+        """
+        LLM used to contextualize follow-up questions: config retriever.rewrite.provider
+        (usually a smaller, faster model), else the answering LLM.
+        """
+        registry = get_model_registry()
+        cfg = (registry.config.get("retriever", {}) or {}).get("rewrite", {}) or {}
+        provider_key = cfg.get("provider") or None
+        llm = registry.get_llm(provider_key) if provider_key else self.llm
+        model = registry.loader.llm_config(provider_key).get("model_name", "")
+        return llm, str(model)
+
+    def _cached_rewrite(self, payload: Dict[str, Any]):
+        """(question, cache key) -- key is None when the rewrite is already known."""
+        question = payload["input"]
+        chat_history = payload.get("chat_history") or []
+        if not chat_history:
+            # nothing to resolve against: the question is already standalone
+            self.rewrite_cache.record_skip()
+            return question, None
+        key = self.rewrite_cache.make_key(self.rewrite_model, chat_history, question)
+        cached = self.rewrite_cache.get(key)
+        if cached is not None:
+            return cached, None
+        return None, key
+
+    def _rewrite_question(self, payload: Dict[str, Any]) -> str:
+        question, key = self._cached_rewrite(payload)
+        if key is None:
+            return question
+        question = self.rewrite_chain.invoke(payload)
+        self.rewrite_cache.put(key, question)
+        return question
+
+    async def _arewrite_question(self, payload: Dict[str, Any]) -> str:
+        question, key = self._cached_rewrite(payload)
+        if key is None:
+            return question
+        question = await self.rewrite_chain.ainvoke(payload)
+        self.rewrite_cache.put(key, question)
+        return question
+
+    def _lookup_answer(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Adds "vector" (embedding of the rewritten question) and "cached" (answer
+        cache entry or None) to the chain state. Runs after the rewrite, so a miss
+        costs one embed_query; both are None when no cache scope is set.
+        """
+        vector, cached = None, None
+        if self.answer_cache is not None and self.cache_scope is not None:
+            vector = get_model_registry().get_embeddings().embed_query(state["rewritten"])
+            cached = self.answer_cache.lookup(self.cache_scope, self.index_generation, vector)
+            if cached is not None:
+                self.log.info(
+                    "Answer cache hit",
+                    session_id=self.current_session,
+                    similarity=round(cached["similarity"], 4),
+                    cached_question=cached["question"][:150],
+                )
+        return {**state, "vector": vector, "cached": cached}
+
+    def _store_answer(self, question: Optional[str], vector, answer: str, sources=None):
+        if self.answer_cache is None or vector is None:
+            return
+        self.answer_cache.store(self.cache_scope, self.index_generation, vector, question, answer, sources)
+
+    @staticmethod
+    def _similar_questions(a: str, b: str) -> float:
+        """Token-set Jaccard similarity of two questions (1.0 == same words)."""
+        ta, tb = set(a.lower().split()), set(b.lower().split())
+        if not ta or not tb:
+            return float(ta == tb)
+        return len(ta & tb) / len(ta | tb)
+
+    @staticmethod
+    def _doc_key(doc):
+        md = getattr(doc, "metadata", {}) or {}
+        return md.get("chunk_id") or (md.get("source"), md.get("page"), doc.page_content)
+
+    def _merge_docs(self, primary, secondary) -> list:
+        """Interleave two ranked lists, dropping duplicates, capped at the retriever's k."""
+        k = (
+            getattr(self.retriever, "k", None)
+            or (getattr(self.retriever, "search_kwargs", {}) or {}).get("k")
+            or max(len(primary), len(secondary))
+        )
+        merged, seen = [], set()
+        for pair in zip(primary, secondary):
+            for doc in pair:
+                key = self._doc_key(doc)
+                if key not in seen:
+                    seen.add(key)
+                    merged.append(doc)
+        longer = primary if len(primary) > len(secondary) else secondary
+        for doc in longer[min(len(primary), len(secondary)):]:
+            key = self._doc_key(doc)
+            if key not in seen:
+                seen.add(key)
+                merged.append(doc)
+        return merged[:k]
+
+    def _reuse_speculative(self, question: str, rewritten: str) -> bool:
+        reuse = self._similar_questions(question, rewritten) >= self.speculative_similarity
+        self.log.info(
+            "Speculative retrieval",
+            session_id=self.current_session,
+            reused=reuse,
+            rewritten_preview=rewritten[:150],
+        )
+        return reuse
+
+    def _retrieve(self, out: Dict[str, Any]) -> list:
+        if out["cached"] is not None:
+            return []
+        if not self.speculative:
+            return self.retriever.invoke(out["rewritten"])
+        if self._reuse_speculative(out["input"], out["rewritten"]):
+            return out["raw_docs"]
+        return self._merge_docs(self.retriever.invoke(out["rewritten"]), out["raw_docs"])
+
+    async def _aretrieve(self, out: Dict[str, Any]) -> list:
+        if out["cached"] is not None:
+            return []
+        if not self.speculative:
+            return await self.retriever.ainvoke(out["rewritten"])
+        if self._reuse_speculative(out["input"], out["rewritten"]):
+            return out["raw_docs"]
+        return self._merge_docs(await self.retriever.ainvoke(out["rewritten"]), out["raw_docs"])
+
+    def _answer_inputs(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "context": self._format_docs(state["docs"]),
+            "input": state["input"],
+            "chat_history": state["chat_history"],
+        }
+
+    def _answer(self, state: Dict[str, Any]) -> str:
+        if state["cached"] is not None:
+            return state["cached"]["answer"]
+        return self.answer_chain.invoke(self._answer_inputs(state))
+
+    async def _aanswer(self, state: Dict[str, Any]) -> str:
+        if state["cached"] is not None:
+            return state["cached"]["answer"]
+        return await self.answer_chain.ainvoke(self._answer_inputs(state))
+
+    @staticmethod
+    def _source_info(doc) -> Dict[str, Any]:
+        md = getattr(doc, "metadata", {}) or {}
+        return {
+            "source": md.get("file_key") or md.get("source"),
+            "page": md.get("page"),
+            "chunk_id": md.get("chunk_id"),
+        }
+
     @staticmethod
     def _format_docs(docs) -> str:
         return "\n\n".join(getattr(d, "page_content", str(d)) for d in docs)
@@ -146,26 +460,38 @@ class ConversationalRAG:
                 raise DocumentPortalException("No retriever set before building chain", sys)
 
             # 1) Rewrite user question with chat history context
-            question_rewriter = (
+            #    (skipped without history, cached per (history, question))
+            self.rewrite_chain = (
                 {"input": itemgetter("input"), "chat_history": itemgetter("chat_history")}
                 | self.contextualize_prompt
-                | self.llm
+                | self.rewrite_llm
                 | StrOutputParser()
             )
+            question_rewriter = RunnableLambda(self._rewrite_question, afunc=self._arewrite_question)
 
-            # 2) Retrieve docs for rewritten question
-            retrieve_docs = question_rewriter | self.retriever | self._format_docs
+            if self.speculative:
+                # retrieve on the raw question while the rewrite runs; keep those
+                # docs if the rewrite barely changed it, else merge a second retrieval
+                rewrite = RunnableParallel(
+                    input=itemgetter("input"),
+                    chat_history=itemgetter("chat_history"),
+                    rewritten=question_rewriter,
+                    raw_docs=itemgetter("input") | self.retriever,
+                )
+            else:
+                rewrite = RunnablePassthrough.assign(rewritten=question_rewriter)
+
+            # 2) Answer cache lookup on the rewritten question, then retrieval (skipped on a hit)
+            self.retrieve_chain = (
+                rewrite
+                | RunnableLambda(self._lookup_answer)
+                | RunnablePassthrough.assign(docs=RunnableLambda(self._retrieve, afunc=self._aretrieve))
+            )
 
             # 3) Answer using retrieved context + original input + chat history
-            self.chain = (
-                {
-                    "context": retrieve_docs,
-                    "input": itemgetter("input"),
-                    "chat_history": itemgetter("chat_history"),
-                }
-                | self.qa_prompt
-                | self.llm
-                | StrOutputParser()
+            self.answer_chain = self.qa_prompt | self.llm | StrOutputParser()
+            self.chain = self.retrieve_chain | RunnablePassthrough.assign(
+                answer=RunnableLambda(self._answer, afunc=self._aanswer)
             )
 
             self.log.info("LCEL graph built successfully", session_id=self.session_id)
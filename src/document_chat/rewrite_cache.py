@@ -0,0 +1,87 @@
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain_core.messages import BaseMessage
+
+from utils.config_loader import load_config
+
+
+def history_digest(chat_history: Sequence[BaseMessage]) -> str:
+    """Stable digest of a chat history (message roles + contents)."""
+    payload = [
+        [getattr(m, "type", type(m).__name__), m.content if isinstance(m.content, str) else json.dumps(m.content, default=str)]
+        for m in chat_history
+    ]
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class RewriteCache:
+    """
+    Bounded in-process LRU of standalone-question rewrites, keyed by
+    (rewrite model, chat-history digest, question).
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0  # empty history: no rewrite needed at all
+
+    @staticmethod
+    def make_key(model: str, chat_history: Sequence[BaseMessage], question: str) -> str:
+        return hashlib.sha256(
+            "|".join([model, history_digest(chat_history), question]).encode("utf-8")
+        ).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: str):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record_skip(self):
+        with self._lock:
+            self.skipped += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "skipped": self.skipped,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+_cache: Optional[RewriteCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_rewrite_cache() -> RewriteCache:
+    """Return the process-wide RewriteCache, sized from config['retriever']['rewrite']."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                cfg = (load_config().get("retriever", {}) or {}).get("rewrite", {}) or {}
+                _cache = RewriteCache(max_entries=int(cfg.get("cache_size", 1024)))
+    return _cache
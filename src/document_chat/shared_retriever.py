@@ -0,0 +1,84 @@
+import threading
+import weakref
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import faiss
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_community.vectorstores.utils import DistanceStrategy
+
+from utils.model_loader import get_model_registry
+from src.document_chat.vectorstore_cache import get_vectorstore_cache
+from src.document_ingestion.faiss_index import search_selected
+
+# Per loaded shard store: chunk id -> position, and the position lists of recent tenant sets
+_positions: "weakref.WeakKeyDictionary[Any, Dict[str, Any]]" = weakref.WeakKeyDictionary()
+_positions_lock = threading.Lock()
+_MAX_TENANT_LISTS = 256
+
+
+def _tenant_positions(vs, shared, shard: str, session_ids: Tuple[str, ...], version: int) -> np.ndarray:
+    with _positions_lock:
+        state = _positions.get(vs)
+        if state is None:
+            state = {"reverse": {cid: pos for pos, cid in vs.index_to_docstore_id.items()}, "lists": {}}
+            _positions[vs] = state
+        cached = state["lists"].get((session_ids, version))
+    if cached is not None:
+        return cached
+
+    reverse = state["reverse"]
+    ids = shared.tenant_chunk_ids(list(session_ids), shard)
+    positions = np.fromiter((reverse[cid] for cid in ids if cid in reverse), dtype="int64")
+    with _positions_lock:
+        lists = state["lists"]
+        if len(lists) >= _MAX_TENANT_LISTS:
+            lists.clear()
+        lists[(session_ids, version)] = positions
+    return positions
+
+
+class SharedIndexRetriever(BaseRetriever):
+    """
+    Top-k over a SharedIndex restricted to some sessions: each shard holding
+    any of them is searched with an ID selector over just their vectors, and
+    the per-shard hits are merged by distance. Passing several session ids
+    searches across them.
+    """
+
+    shared: Any  # SharedIndex
+    session_ids: List[str]
+    k: int = 5
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        sessions = tuple(sorted(set(self.session_ids)))
+        query_vec = np.asarray([get_model_registry().get_embeddings().embed_query(query)], dtype="float32")
+        version = self.shared.version()
+        cache = get_vectorstore_cache()
+
+        hits = []
+        for shard in self.shared.tenant_shards(list(sessions)):
+            vs = cache.get_vectorstore(str(self.shared.shard_dir(shard)))
+            positions = _tenant_positions(vs, self.shared, shard, sessions, version)
+            if not len(positions):
+                continue
+            x = query_vec.copy()
+            if getattr(vs, "_normalize_L2", False):
+                faiss.normalize_L2(x)
+            distances, labels = search_selected(vs.index, x, self.k, positions)
+            higher_is_better = vs.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT
+            for dist, pos in zip(distances[0], labels[0]):
+                if pos >= 0:
+                    hits.append((-dist if higher_is_better else dist, vs, int(pos)))
+
+        hits.sort(key=lambda h: h[0])
+        docs: List[Document] = []
+        for _, vs, pos in hits[: self.k]:
+            doc = vs.docstore.search(vs.index_to_docstore_id[pos])
+            if isinstance(doc, Document):
+                docs.append(doc)
+        return docs
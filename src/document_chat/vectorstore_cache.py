@@ -0,0 +1,247 @@
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from utils.model_loader import get_model_registry
+from exception.custom_exception import DocumentPortalException
+from logger.custom_logger import CustomLogger
+from src.document_chat.retrieval import ConversationalRAG
+from src.document_ingestion.segment_store import SegmentStore
+from src.document_ingestion.lexical_index import BM25Index
+from src.document_ingestion.faiss_index import search_param_defaults
+from src.document_ingestion.shared_index import get_shared_index
+
+log = CustomLogger().get_logger(__name__)
+
+_MAX_SHARED_CHAINS = 256
+
+
+class _Entry:
+    __slots__ = ("generation", "size", "vectorstore", "chains", "lexical", "store", "gen")
+
+    def __init__(self, generation: Tuple, size: int, vectorstore: FAISS, store: SegmentStore, gen: int):
+        self.generation = generation
+        self.size = size
+        self.vectorstore = vectorstore
+        self.store = store
+        self.gen = gen  # manifest generation read before loading
+        self.lexical: Optional[BM25Index] = None  # loaded on first hybrid query
+        self.chains: Dict[int, ConversationalRAG] = {}
+
+
+class VectorStoreCache:
+    """
+    In-process LRU cache of loaded FAISS stores and the ConversationalRAG chains
+    built on them, keyed by index directory.
+
+    - Entries are invalidated when the index changes on disk (SegmentStore.generation()).
+    - Total size is kept under max_bytes; least recently used sessions are evicted first.
+      The size is that of the store's files on disk (SegmentStore.disk_bytes()), not
+      resident memory: it matches for pickled stores, but an mmapped base and its
+      SQLite docstore are only paged in as searched, so for those it is an upper bound.
+    - A directory without an index raises FileNotFoundError (a 404 for the API).
+    """
+
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._shared_chains: "OrderedDict[Tuple, ConversationalRAG]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    # ---------- Public API ----------
+
+    def get_vectorstore(self, index_dir: str, index_name: str = "index") -> FAISS:
+        return self._get_entry(index_dir, index_name).vectorstore
+
+    @staticmethod
+    def clamp_k(k: int) -> int:
+        """Chains are cached per k, so k is bounded by retriever.max_k."""
+        max_k = int((get_model_registry().config.get("retriever", {}) or {}).get("max_k", 20))
+        return max(1, min(int(k), max_k))
+
+    def get_rag(self, index_dir: str, k: int = 5, index_name: str = "index") -> ConversationalRAG:
+        """
+        Return a ready-to-invoke ConversationalRAG for index_dir (top-k = k, see clamp_k).
+        The chain is shared by every session on the index: pass session_id per call.
+        """
+        k = self.clamp_k(k)
+        entry = self._get_entry(index_dir, index_name)
+        rag = entry.chains.get(k)
+        if rag is None:
+            rag = ConversationalRAG(session_id=None)
+            search_type = (get_model_registry().config.get("retriever", {}) or {}).get("search_type", "similarity")
+            if search_type == "hybrid" and entry.lexical is None:
+                entry.lexical = BM25Index.for_store(entry.store, entry.vectorstore, entry.gen)
+            rag.load_retriever_from_vectorstore(
+                entry.vectorstore, k=k, search_type=search_type, lexical=entry.lexical
+            )
+            # answers are cached per (index, k) and only for this index generation
+            rag.cache_scope = (self._key(index_dir, index_name), k)
+            rag.index_generation = entry.generation
+            # setdefault: a concurrent builder may have won the race, keep a single chain
+            rag = entry.chains.setdefault(k, rag)
+        return rag
+
+    def get_shared_rag(self, session_ids: List[str], k: int = 5) -> ConversationalRAG:
+        """
+        ConversationalRAG over the shared index restricted to session_ids. Shard
+        stores are loaded through this cache (one copy for every tenant); only
+        the small per-tenant chain is kept here.
+        """
+        from src.document_chat.shared_retriever import SharedIndexRetriever
+
+        k = self.clamp_k(k)
+        shared = get_shared_index()
+        sessions = tuple(sorted(set(session_ids)))
+        key = (sessions, k)
+        with self._lock:
+            rag = self._shared_chains.get(key)
+            if rag is not None:
+                self._shared_chains.move_to_end(key)
+        if rag is None:
+            rag = ConversationalRAG(
+                session_id=None,
+                retriever=SharedIndexRetriever(shared=shared, session_ids=list(sessions), k=k),
+            )
+            rag.cache_scope = ("shared", sessions, k)
+            with self._lock:
+                rag = self._shared_chains.setdefault(key, rag)
+                while len(self._shared_chains) > _MAX_SHARED_CHAINS:
+                    self._shared_chains.popitem(last=False)
+        # cached answers are only valid for the tenants' current files
+        rag.index_generation = shared.version()
+        return rag
+
+    def invalidate(self, index_dir: str, index_name: str = "index"):
+        key = self._key(index_dir, index_name)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry.size
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._shared_chains.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "shared_chains": len(self._shared_chains),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    # ---------- Internals ----------
+
+    @staticmethod
+    def _key(index_dir: str, index_name: str) -> Tuple[str, str]:
+        return str(Path(index_dir).resolve()), index_name
+
+    def _get_entry(self, index_dir: str, index_name: str) -> _Entry:
+        try:
+            key = self._key(index_dir, index_name)
+            store = SegmentStore(Path(index_dir), index_name=index_name)
+            generation = store.generation()
+
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry.generation == generation:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry
+                if entry is not None:
+                    # Index was rewritten since we loaded it
+                    self._entries.pop(key)
+                    self._bytes -= entry.size
+                    self.invalidations += 1
+                self.misses += 1
+
+            # Load outside the lock so one cold session does not block the others
+            gen = store.last_gen()
+            vectorstore = store.load(get_model_registry().get_embeddings())
+            if vectorstore is None:
+                raise FileNotFoundError(f"No FAISS data in {index_dir}")
+            size = store.disk_bytes()
+            entry = _Entry(generation, size, vectorstore, store, gen)
+
+            with self._lock:
+                old = self._entries.pop(key, None)
+                if old is not None:
+                    self._bytes -= old.size
+                self._entries[key] = entry
+                self._bytes += size
+                self._evict()
+
+            log.info("FAISS index cached", index_dir=index_dir, bytes=size, cache_bytes=self._bytes)
+            return entry
+        except FileNotFoundError:
+            raise
+        except Exception as e:
+            log.error("Failed to load FAISS index into cache", error=str(e), index_dir=index_dir)
+            raise DocumentPortalException("Vectorstore cache load error", sys)
+
+    def _evict(self):
+        # Always keep the most recent entry, even if it alone exceeds the budget
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            key, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            self.evictions += 1
+            log.info("FAISS index evicted from cache", index_dir=key[0], bytes=entry.size)
+
+
+class CachedIndexRetriever(BaseRetriever):
+    """
+    Top-k retrieval over an index directory through the retriever of the cached
+    chain (VectorStoreCache.get_rag), resolved on each query: the same search
+    type (similarity or hybrid), k clamp and search params as /chat/query.
+    Nothing is loaded until the first query, and a store already cached (or
+    reloaded after a commit) is shared.
+    """
+
+    index_dir: str
+    index_name: str = "index"
+    k: int = 5
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        rag = get_vectorstore_cache().get_rag(self.index_dir, k=self.k, index_name=self.index_name)
+        with search_param_defaults(**rag.search_params):
+            return rag.retriever.invoke(query)
+
+
+_cache: Optional[VectorStoreCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_vectorstore_cache() -> VectorStoreCache:
+    """Return the process-wide VectorStoreCache, sized from config (cache.vectorstore.max_mb, on-disk bytes)."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                cfg = get_model_registry().config.get("cache", {}).get("vectorstore", {})
+                _cache = VectorStoreCache(max_bytes=int(cfg.get("max_mb", 512)) * 1024 * 1024)
+    return _cache
@@ -3,7 +3,7 @@ from dotenv import load_dotenv
 import pandas as pd
 from langchain_core.output_parsers import JsonOutputParser
 # from langchain.output_parsers import OutputFixingParser
-from utils.model_loader import ModelLoader
+from utils.model_loader import get_model_registry
 from logger.custom_logger import CustomLogger
 from exception.custom_exception import DocumentPortalException
 from prompt.prompt_library import PROMPT_REGISTRY
@@ -13,8 +13,8 @@ class DocumentComparatorLLM:
     def __init__(self):
         load_dotenv()
         self.log = CustomLogger().get_logger(__name__)
-        self.loader = ModelLoader()
-        self.llm = self.loader.load_llm()
+        self.registry = get_model_registry()
+        self.llm = self.registry.get_llm(cached=True)  # temperature 0: identical inputs reuse the stored response
         self.parser = JsonOutputParser(pydantic_object=SummaryResponse)
         #self.fixing_parser = OutputFixingParser.from_llm(parser=self.parser, llm=self.llm)
         #self.fixing_parser = JsonOutputParser.from_llm(parser=self.parser, llm=self.llm)
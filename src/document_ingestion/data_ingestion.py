@@ -5,105 +5,388 @@ import json
 import uuid
 import hashlib
 import shutil
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Iterable, List, Optional, Dict, Any
+from typing import Iterable, Iterator, List, Optional, Dict, Any, Tuple
 import fitz  # PyMuPDF
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
-from utils.model_loader import ModelLoader
+from utils.model_loader import ModelLoader, get_model_registry
 #from logger import GLOBAL_LOGGER as log
 from logger.custom_logger import CustomLogger
 from exception.custom_exception import DocumentPortalException
-from utils.file_io import generate_session_id, save_uploaded_files
-from utils.document_ops import load_documents, concat_for_analysis, concat_for_comparison
+from utils.file_io import (
+    generate_session_id,
+    save_uploaded_file,
+    UploadTooLarge,
+    UPLOAD_MEMORY_BYTES,
+)
+from utils.blob_store import get_blob_store
+from utils.document_ops import (
+    load_documents,
+    concat_for_analysis,
+    concat_for_comparison,
+    extract_documents,
+    extract_pdf_pages,
+    documents_from_records,
+)
+from utils.extractors import extractor_signature
+from utils.artifact_cache import get_artifact_cache
+from utils.pdf_extraction import LazyPdfPages
+from src.document_ingestion.segment_store import SegmentStore
+from src.document_ingestion.lexical_index import BM25Index
+from src.document_ingestion.shared_index import get_shared_index
 
 SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".txt"}
 
-# FAISS Manager (load-or-create)
+# FAISS Manager (load-or-create + incremental sync)
 class FaissManager:
-    def __init__(self, index_dir: Path, model_loader: Optional[ModelLoader] = None):
+    """
+    Owns one FAISS index directory (stored as append-only segments, see SegmentStore)
+    and its file manifest.
+
+    Every chunk gets a content-hash id (see chunk_id) that is also its FAISS
+    docstore id, and the manifest maps each source file to the ids of its chunks:
+
+        {"files": {"<file_key>": {"sha256": "...", "chunking": [...], "ids": ["...", ...]}},
+         "rows":  {"<chunk_id>": "<file_key>"}}
+
+    Re-uploading a file only embeds chunks that are new, removes vectors of
+    chunks that disappeared, and skips the file entirely if its hash is unchanged.
+    Changes are buffered and written by save() as one segment + one manifest record,
+    so a batch costs time proportional to the batch, not to the index. Streamed
+    (already embedded) chunks are flushed every segment_chunks chunks, so a large
+    file becomes a few segments rather than one per embedding batch.
+
+    A BM25 inverted index over the same chunk ids is kept in step with every
+    commit and persisted next to the index on save() (see BM25Index).
+    """
+    def __init__(self, index_dir: Path, model_loader: Optional[ModelLoader] = None, index_name: str = "index"):
         self.index_dir = Path(index_dir)
         self.index_dir.mkdir(parents=True, exist_ok=True)
-        
-        self.meta_path = self.index_dir / "ingested_meta.json"
-        self._meta: Dict[str, Any] = {"rows": {}} ## this is dict of rows
-        
-        if self.meta_path.exists():
-            try:
-                self._meta = json.loads(self.meta_path.read_text(encoding="utf-8")) or {"rows": {}} # load it if alrady there
-            except Exception:
-                self._meta = {"rows": {}} # init the empty one if dones not exists
-        
 
-        self.model_loader = model_loader or ModelLoader()
-        self.emb = self.model_loader.load_embeddings()
+        self.store = SegmentStore(self.index_dir, index_name=index_name)
+        self._meta: Dict[str, Any] = self.store.load_meta()
+
+        # Shared embedding client unless the caller brings its own loader
+        self.model_loader = model_loader
+        self.emb = model_loader.load_embeddings() if model_loader else get_model_registry().get_embeddings()
+        config = model_loader.config if model_loader else get_model_registry().config
+        self.compact_after = int(config.get("faiss_db", {}).get("segments", {}).get("compact_after", 8))
+        self.segment_chunks = int((config.get("ingestion", {}) or {}).get("segment_chunks", 2048))
         self.vs: Optional[FAISS] = None
-        
+        self._bm25: Optional[BM25Index] = None
+        self._bm25_dirty = False
+        self._reset_pending()
+
+    def _reset_pending(self):
+        self._pending_docs: Dict[str, Document] = {}
+        self._pending_vectors: Dict[str, List[float]] = {}  # of pending docs embedded by the caller
+        self._pending_deletes: List[str] = []
+        self._files_delta: Dict[str, Any] = {}
+        self._rows_delta: Dict[str, Any] = {}
+
     def _exists(self)-> bool:
-        return (self.index_dir / "index.faiss").exists() and (self.index_dir / "index.pkl").exists()
+        return self.store.exists()
     
     @staticmethod
-    def _fingerprint(text: str, md: Dict[str, Any]) -> str:
-        src = md.get("source") or md.get("file_path")
-        rid = md.get("row_id")
-        if src is not None:
-            return f"{src}::{'' if rid is None else rid}"
-        return hashlib.sha256(text.encode("utf-8")).hexdigest()
-    
-    def _save_meta(self):
-        self.meta_path.write_text(json.dumps(self._meta, ensure_ascii=False, indent=2), encoding="utf-8")
-        
-        
+    def chunk_id(file_key: str, text: str, occurrence: int = 0) -> str:
+        """Stable id of a chunk: sha256(file key + chunk text + n-th repeat of that text in the file)."""
+        h = hashlib.sha256()
+        h.update(file_key.encode("utf-8") + b"\0")
+        h.update(text.encode("utf-8") + b"\0")
+        h.update(str(occurrence).encode("ascii"))
+        return h.hexdigest()
+
+    def file_unchanged(self, file_key: str, sha256: str, chunking: Optional[List[int]] = None) -> bool:
+        entry = self._meta["files"].get(file_key)
+        return (
+            entry is not None
+            and entry.get("sha256") == sha256
+            and entry.get("chunking") == (list(chunking) if chunking else None)
+        )
+
+    def _add(self, docs: List[Document], ids: List[str]):
+        for d, cid in zip(docs, ids):
+            self._pending_docs[cid] = d
+
+    def _remove(self, ids: List[str]):
+        for cid in ids:
+            # Not yet written: just forget it, otherwise record a delete for the next commit
+            self._pending_vectors.pop(cid, None)
+            if self._pending_docs.pop(cid, None) is None:
+                self._pending_deletes.append(cid)
+
+    def _set_file(self, file_key: str, entry: Optional[Dict[str, Any]]):
+        if entry is None:
+            self._meta["files"].pop(file_key, None)
+        else:
+            self._meta["files"][file_key] = entry
+        self._files_delta[file_key] = entry
+
+    def _set_row(self, cid: str, file_key: Optional[str]):
+        if file_key is None:
+            self._meta["rows"].pop(cid, None)
+        else:
+            self._meta["rows"][cid] = file_key
+        self._rows_delta[cid] = file_key
+
+    def file_ids(self, file_key: str) -> List[str]:
+        return list(self._meta["files"].get(file_key, {}).get("ids", []))
+
+    def is_indexed(self, cid: str) -> bool:
+        return cid in self._meta["rows"]
+
+    def append_embedded(self, docs: List[Document], ids: List[str], vectors: List[List[float]]):
+        """
+        Buffer one already-embedded batch (streaming ingestion); committed once
+        segment_chunks chunks are buffered, and by save().
+        """
+        for d, cid, vec in zip(docs, ids, vectors):
+            self._pending_docs[cid] = d
+            self._pending_vectors[cid] = vec
+            self._set_row(cid, (d.metadata or {}).get("file_key"))
+        if len(self._pending_vectors) >= self.segment_chunks:
+            self.save()
+
+    def finish_file(self, file_key: str, sha256: str, ids: List[str], chunking: Optional[List[int]] = None) -> int:
+        """
+        Close a streamed file: drop vectors of chunks that are gone and record the
+        file's id list. Returns the number of removed vectors.
+        """
+        new_ids = set(ids)
+        to_remove = [cid for cid in self.file_ids(file_key) if cid not in new_ids]
+        self._remove(to_remove)
+        for cid in to_remove:
+            self._set_row(cid, None)
+        self._set_file(file_key, {
+            "sha256": sha256,
+            "chunking": list(chunking) if chunking else None,
+            "ids": ids,
+        })
+        self.save()
+        return len(to_remove)
+
+    def delete_file(self, file_key: str) -> int:
+        """Drop every vector that came from file_key."""
+        entry = self._meta["files"].get(file_key)
+        if entry is None:
+            return 0
+        self._remove(entry["ids"])
+        for cid in entry["ids"]:
+            self._set_row(cid, None)
+        self._set_file(file_key, None)
+        return len(entry["ids"])
+
     def add_documents(self,docs: List[Document]):
-        
-        if self.vs is None:
-            raise RuntimeError("Call load_or_create() before add_documents_idempotent().")
-        
+        """Add chunks that are not in the index yet (ids from chunk_id metadata or content hash)."""
         new_docs: List[Document] = []
-        
+        new_ids: List[str] = []
         for d in docs:
-            
-            key = self._fingerprint(d.page_content, d.metadata or {})
-            if key in self._meta["rows"]:
+            md = d.metadata or {}
+            key = md.get("chunk_id") or self.chunk_id(str(md.get("source", "")), d.page_content)
+            if key in self._meta["rows"] or key in new_ids:
                 continue
-            self._meta["rows"][key] = True
+            self._set_row(key, md.get("file_key"))
             new_docs.append(d)
-            
-        if new_docs:
-            self.vs.add_documents(new_docs)
-            self.vs.save_local(str(self.index_dir))
-            self._save_meta()
+            new_ids.append(key)
+
+        self._add(new_docs, new_ids)
+        self.save()
         return len(new_docs)
-    
+
+    def _update_lexical(self, gen: int, ids: List[str], texts: List[str], deletes: List[str]):
+        """
+        Apply one commit to the in-memory BM25 index. If another writer committed
+        in between, drop it instead: it is rebuilt from the docstore when queried.
+        """
+        if self._bm25 is None:
+            idx = BM25Index.load(BM25Index.path_for(self.index_dir, self.store.index_name))
+            if idx is None and self.store.started_empty(gen):
+                idx = BM25Index()  # brand-new index; a legacy base is indexed from its docstore on first query
+            if idx is None or idx.gen != gen - 1:
+                return
+            self._bm25 = idx
+        elif self._bm25.gen != gen - 1:
+            self._bm25, self._bm25_dirty = None, False
+            return
+        self._bm25.remove(deletes)
+        self._bm25.add(ids, texts)
+        self._bm25.gen = gen
+        self._bm25_dirty = True
+
+    def _save_lexical(self):
+        if not self._bm25_dirty or self._bm25 is None:
+            return
+        # only if nothing was committed since; a newer writer owns the file then
+        bm25, path = self._bm25, BM25Index.path_for(self.index_dir, self.store.index_name)
+        self.store.write_if_current(bm25.gen, lambda: bm25.save(path))
+        self._bm25_dirty = False
+
+    def save(self):
+        """Commit buffered changes as one segment + manifest record (no-op if nothing changed)."""
+        if not (self._pending_docs or self._pending_deletes or self._files_delta or self._rows_delta):
+            self._save_lexical()
+            return
+        segment = None
+        ids: List[str] = []
+        if self._pending_docs:
+            ids = list(self._pending_docs)
+            docs = [self._pending_docs[i] for i in ids]
+            missing = [i for i in ids if i not in self._pending_vectors]
+            if missing:
+                vectors = self.emb.embed_documents([self._pending_docs[i].page_content for i in missing])
+                self._pending_vectors.update(zip(missing, vectors))
+            segment = FAISS.from_embeddings(
+                [(d.page_content, self._pending_vectors[i]) for d, i in zip(docs, ids)],
+                self.emb,
+                metadatas=[d.metadata for d in docs],
+                ids=ids,
+            )
+        gen = self.store.commit(segment, self._pending_deletes, self._files_delta, self._rows_delta)
+        self._update_lexical(gen, ids, [self._pending_docs[i].page_content for i in ids], self._pending_deletes)
+        self._save_lexical()
+        self._reset_pending()
+        self.vs = None  # stale; load() again if needed
+
+        if self.store.needs_compaction(self.compact_after):
+            self.store.compact_async(self.emb)
+
+    def load(self) -> Optional[FAISS]:
+        """Load the merged index (base + segments) into memory."""
+        if self.vs is None:
+            self.vs = self.store.load(self.emb)
+        return self.vs
+
     def load_or_create(self,texts:Optional[List[str]]=None, metadatas: Optional[List[dict]] = None):
         ## if we running first time then it will not go in this block
         if self._exists():
-            self.vs = FAISS.load_local(
-                str(self.index_dir),
-                embeddings=self.emb,
-                allow_dangerous_deserialization=True,
-            )
-            return self.vs
-        
-        
-        if not texts:
-            raise DocumentPortalException("No existing FAISS index and no data to create one", sys)
-        self.vs = FAISS.from_texts(texts=texts, embedding=self.emb, metadatas=metadatas or [])
-        self.vs.save_local(str(self.index_dir))
-        return self.vs
+            return self.load()
+
+        # No index yet: it is created by the first add, so no chunk is ever embedded twice
+        if texts:
+            self.add_documents([Document(page_content=t, metadata=m) for t, m in zip(texts, metadatas or [{}] * len(texts))])
+        return self.load()
         
         
+class IngestPipeline:
+    """
+    Streaming load -> split -> embed -> index for one FaissManager.
+
+    Pages are split as they come, chunks are embedded in batches of batch_size
+    with up to max_inflight batches embedding concurrently, and embedded batches
+    are handed to the FaissManager, which writes a segment every segment_chunks
+    chunks and at the end of the file. Memory stays bounded by one file's pages,
+    max_inflight batches and one segment's worth of chunks, whatever the number
+    of documents in the upload.
+    """
+    def __init__(
+        self,
+        fm: FaissManager,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 200,
+        batch_size: int = 64,
+        max_inflight: int = 2,
+        extra_metadata: Optional[Dict[str, Any]] = None,
+    ):
+        self.log = CustomLogger().get_logger(__name__)
+        self.fm = fm
+        self.extra_metadata = dict(extra_metadata or {})  # e.g. session_id in the shared index
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.batch_size = max(1, batch_size)
+        self.max_inflight = max(1, max_inflight)
+        self.splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+    @property
+    def chunking(self) -> List[int]:
+        return [self.chunk_size, self.chunk_overlap]
+
+    def iter_chunks(self, path: Path, sha256: str, file_key: str) -> Iterator[Document]:
+        """Yield the file's chunks (with chunk ids), reusing cached chunks of identical content."""
+        cache = get_artifact_cache()
+        key = (sha256, extractor_signature(path.suffix), self.chunk_size, self.chunk_overlap)
+        cached = cache.get("chunks", *key)
+        if cached is not None:
+            self.log.info("Chunks served from cache", file=str(path), chunks=len(cached))
+            chunks: Iterable[Document] = documents_from_records(cached, path)
+        else:
+            chunks = self._split_pages(path, sha256, key)
+
+        seen: Dict[str, int] = {}
+        for c in chunks:
+            digest = hashlib.sha256(c.page_content.encode("utf-8")).digest()
+            n = seen.get(digest, 0)
+            seen[digest] = n + 1
+            c.metadata = {
+                **(c.metadata or {}),
+                **self.extra_metadata,
+                "chunk_id": FaissManager.chunk_id(file_key, c.page_content, n),
+                "file_key": file_key,
+            }
+            yield c
+
+    def _split_pages(self, path: Path, sha256: str, key) -> Iterator[Document]:
+        records: List[Dict[str, Any]] = []
+        for page in extract_documents(str(path), sha256=sha256):
+            for c in self.splitter.split_documents([page]):
+                records.append({"page_content": c.page_content, "metadata": dict(c.metadata)})
+                yield c
+        # only reached when the file was consumed completely
+        get_artifact_cache().put("chunks", records, *key)
+
+    def ingest_file(self, path: Path, sha256: str, file_key: str) -> Dict[str, int]:
+        fm = self.fm
+        if fm.file_unchanged(file_key, sha256, self.chunking):
+            return {"added": 0, "removed": 0, "kept": len(fm.file_ids(file_key))}
+
+        old_ids = set(fm.file_ids(file_key))
+        ids: List[str] = []
+        added = 0
+        batch: List[Document] = []
+        inflight: deque = deque()
+
+        def drain_one():
+            future, docs = inflight.popleft()
+            fm.append_embedded(docs, [d.metadata["chunk_id"] for d in docs], future.result())
+
+        with ThreadPoolExecutor(max_workers=self.max_inflight, thread_name_prefix="embed") as pool:
+            def submit(docs: List[Document]):
+                while len(inflight) >= self.max_inflight:
+                    drain_one()
+                inflight.append((pool.submit(fm.emb.embed_documents, [d.page_content for d in docs]), docs))
+
+            for chunk in self.iter_chunks(path, sha256, file_key):
+                cid = chunk.metadata["chunk_id"]
+                ids.append(cid)
+                if cid in old_ids or fm.is_indexed(cid):
+                    continue
+                batch.append(chunk)
+                added += 1
+                if len(batch) >= self.batch_size:
+                    submit(batch)
+                    batch = []
+            if batch:
+                submit(batch)
+            while inflight:
+                drain_one()
+
+        removed = fm.finish_file(file_key, sha256, ids, self.chunking)
+        return {"added": added, "removed": removed, "kept": len(ids) - added}
+
+
 class ChatIngestor:
     def __init__( self,
         temp_base: str = "data",
         faiss_base: str = "faiss_index",
         use_session_dirs: bool = True,
         session_id: Optional[str] = None,
+        shared: bool = False,
     ):
         try:
             self.log = CustomLogger().get_logger(__name__)
-            self.model_loader = ModelLoader()
             
             self.use_session = use_session_dirs
             self.session_id = session_id or generate_session_id()
@@ -112,13 +395,16 @@ class ChatIngestor:
             self.faiss_base = Path(faiss_base); self.faiss_base.mkdir(parents=True, exist_ok=True)
             
             self.temp_dir = self._resolve_dir(self.temp_base)
-            self.faiss_dir = self._resolve_dir(self.faiss_base)
+            # shared mode: one sharded index for every session instead of faiss_index/<session_id>
+            self.shared = get_shared_index() if shared else None
+            self.faiss_dir = self.shared.root if self.shared else self._resolve_dir(self.faiss_base)
 
             self.log.info("ChatIngestor initialized",
                       session_id=self.session_id,
                       temp_dir=str(self.temp_dir),
                       faiss_dir=str(self.faiss_dir),
-                      sessionized=self.use_session)
+                      sessionized=self.use_session,
+                      shared=self.shared is not None)
         except Exception as e:
             self.log.error("Failed to initialize ChatIngestor", error=str(e))
             raise DocumentPortalException("Initialization error in ChatIngestor", e) from e
@@ -131,47 +417,165 @@ class ChatIngestor:
             return d
         return base # fallback: "faiss_index/"
         
-    def _split(self, docs: List[Document], chunk_size=1000, chunk_overlap=200) -> List[Document]:
-        splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-        chunks = splitter.split_documents(docs)
-        self.log.info("Documents split", chunks=len(chunks), chunk_size=chunk_size, overlap=chunk_overlap)
-        return chunks
-    
     def built_retriver( self,
         uploaded_files: Iterable,
         *,
         chunk_size: int = 1000,
         chunk_overlap: int = 200,
         k: int = 5,):
+        if self.shared is not None:
+            return self._build_shared(uploaded_files, chunk_size=chunk_size, chunk_overlap=chunk_overlap, k=k)
         try:
-            paths = save_uploaded_files(uploaded_files, self.temp_dir)
-            docs = load_documents(paths)
-            if not docs:
-                raise ValueError("No valid documents loaded")
-            
-            chunks = self._split(docs, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-            
+            from src.document_chat.vectorstore_cache import CachedIndexRetriever
+
             ## FAISS manager very very important class for the docchat
-            fm = FaissManager(self.faiss_dir, self.model_loader)
-            
-            texts = [c.page_content for c in chunks]
-            metas = [c.metadata for c in chunks]
-            
-            try:
-                vs = fm.load_or_create(texts=texts, metadatas=metas)
-            except Exception:
-                vs = fm.load_or_create(texts=texts, metadatas=metas)
-                
-            added = fm.add_documents(chunks)
-            self.log.info("FAISS index updated", added=added, index=str(self.faiss_dir))
-            
-            return vs.as_retriever(search_type="similarity", search_kwargs={"k": k})
+            fm = FaissManager(self.faiss_dir)
+            cfg = get_model_registry().config.get("ingestion", {}) or {}
+            pipeline = IngestPipeline(
+                fm,
+                chunk_size=chunk_size,
+                chunk_overlap=chunk_overlap,
+                batch_size=int(cfg.get("embed_batch_size", 64)),
+                max_inflight=int(cfg.get("max_inflight_batches", 2)),
+            )
+
+            totals = {"added": 0, "removed": 0, "kept": 0}
+            for uf in uploaded_files:
+                # save one by one so each stored path keeps its original upload name (the file key)
+                file_key = Path(getattr(uf, "name", "file")).name
+                saved = save_uploaded_file(uf, self.temp_dir)
+                if saved is None:
+                    continue
+                sha = saved.sha256  # hashed while streaming, no second read
+                if fm.file_unchanged(file_key, sha, pipeline.chunking):
+                    self.log.info("File unchanged, skipped", file=file_key)
+                    continue
+
+                delta = pipeline.ingest_file(saved.path, sha, file_key)
+                for name, n in delta.items():
+                    totals[name] += n
+                self.log.info("File synced", file=file_key, **delta)
+
+            fm.save()
+            if not fm._exists():
+                raise ValueError("No valid documents loaded")
+            self.log.info("FAISS index updated", index=str(self.faiss_dir), **totals)
+
+            # loaded on first query through the shared cache, not replayed here after every ingest
+            return CachedIndexRetriever(index_dir=str(self.faiss_dir), index_name=fm.store.index_name, k=k)
             
+        except UploadTooLarge:
+            raise
         except Exception as e:
             self.log.error("Failed to build retriever", error=str(e))
             raise DocumentPortalException("Failed to build retriever", e) from e
+
+    def _build_shared(self, uploaded_files: Iterable, *, chunk_size: int, chunk_overlap: int, k: int):
+        """Ingest into the shared sharded index; chunks carry session_id and are registered per tenant."""
+        try:
+            from src.document_chat.shared_retriever import SharedIndexRetriever
+
+            shared = self.shared
+            cfg = get_model_registry().config.get("ingestion", {}) or {}
+            managers: Dict[str, FaissManager] = {}
+            totals = {"added": 0, "removed": 0, "kept": 0}
+            for uf in uploaded_files:
+                name = Path(getattr(uf, "name", "file")).name
+                saved = save_uploaded_file(uf, self.temp_dir)
+                if saved is None:
+                    continue
+                # a re-uploaded file stays in its shard so only its changed chunks are touched
+                shard = shared.shard_for_file(self.session_id, name) or shared.active_shard()
+                fm = managers.get(shard)
+                if fm is None:
+                    fm = managers[shard] = FaissManager(shared.shard_dir(shard))
+                pipeline = IngestPipeline(
+                    fm,
+                    chunk_size=chunk_size,
+                    chunk_overlap=chunk_overlap,
+                    batch_size=int(cfg.get("embed_batch_size", 64)),
+                    max_inflight=int(cfg.get("max_inflight_batches", 2)),
+                    extra_metadata={"session_id": self.session_id},
+                )
+                file_key = shared.namespaced_key(self.session_id, name)
+                delta = pipeline.ingest_file(saved.path, saved.sha256, file_key)
+                shared.register_file(self.session_id, name, shard, fm.file_ids(file_key))
+                for key, n in delta.items():
+                    totals[key] += n
+                self.log.info("File synced", file=name, shard=shard, **delta)
+
+            for fm in managers.values():
+                fm.save()
+            self.log.info("Shared index updated", root=str(shared.root), session_id=self.session_id, **totals)
+            return SharedIndexRetriever(shared=shared, session_ids=[self.session_id], k=k)
+        except UploadTooLarge:
+            raise
+        except Exception as e:
+            self.log.error("Failed to build shared retriever", error=str(e))
+            raise DocumentPortalException("Failed to build retriever", e) from e
         
             
+class LazyPdfDocument:
+    """
+    Page-marked text of a PDF (same layout as DocHandler.read_pdf) whose pages
+    are only extracted when needed: head_tail() reads from both ends until the
+    character budgets are met, so the cost does not grow with page count.
+    """
+
+    def __init__(self, pages, source: str = ""):
+        self._pages = pages  # LazyPdfPages, or a list of page texts already extracted
+        self.source = source
+
+    @property
+    def page_count(self) -> int:
+        return len(self._pages)
+
+    @property
+    def pages_extracted(self) -> int:
+        return getattr(self._pages, "extracted", len(self._pages))
+
+    def _chunk(self, i: int) -> str:
+        return f"\n--- Page {i + 1} ---\n{self._pages[i]}"
+
+    def text(self) -> str:
+        """Full text, exactly as DocHandler.read_pdf returns it (extracts every page)."""
+        return "\n".join(self._chunk(i) for i in range(self.page_count))
+
+    def head_tail(self, head_chars: int, tail_chars: int) -> Tuple[str, str, bool]:
+        """
+        (head, tail, complete): at least head_chars from the start and tail_chars
+        from the end of text(). complete means every page was needed; head is
+        then the whole text and tail is empty.
+        """
+        front: List[str] = []
+        back: List[str] = []
+        start, stop = 0, self.page_count
+        size = -1  # "\n".join adds one separator per page after the first
+        while start < stop and size < head_chars:
+            front.append(self._chunk(start))
+            size += len(front[-1]) + 1
+            start += 1
+        size = -1
+        while stop > start and size < tail_chars:
+            stop -= 1
+            back.append(self._chunk(stop))
+            size += len(back[-1]) + 1
+        back.reverse()
+        if start >= stop:
+            return "\n".join(front + back), "", True
+        return "\n".join(front), "\n".join(back), False
+
+    def close(self):
+        if hasattr(self._pages, "close"):
+            self._pages.close()
+
+    def __enter__(self) -> "LazyPdfDocument":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
 class DocHandler:
     """
     PDF save + read (page-wise) for analysis.
@@ -182,6 +586,8 @@ class DocHandler:
         self.session_id = session_id or generate_session_id("session")
         self.session_path = os.path.join(self.data_dir, self.session_id)
         os.makedirs(self.session_path, exist_ok=True)
+        self._buffers: Dict[str, bytes] = {}  # small uploads kept in memory, keyed by saved path
+        self.hashes: Dict[str, str] = {}  # saved path -> sha256 of its content
         self.log.info("DocHandler initialized", session_id=self.session_id, session_path=self.session_path)
 
     def save_pdf(self, uploaded_file) -> str:
@@ -190,24 +596,43 @@ class DocHandler:
             if not filename.lower().endswith(".pdf"):
                 raise ValueError("Invalid file type. Only PDFs are allowed.")
             save_path = os.path.join(self.session_path, filename)
-            with open(save_path, "wb") as f:
-                if hasattr(uploaded_file, "read"):
-                    f.write(uploaded_file.read())
-                else:
-                    f.write(uploaded_file.getbuffer())
-            self.log.info("PDF saved successfully", file=filename, save_path=save_path, session_id=self.session_id)
+            saved = get_blob_store().save(
+                uploaded_file, Path(save_path), owner=self.session_path, keep_in_memory=UPLOAD_MEMORY_BYTES
+            )
+            self.hashes[save_path] = saved.sha256
+            if saved.data is not None:
+                self._buffers[save_path] = saved.data
+            self.log.info("PDF saved successfully", file=filename, save_path=save_path,
+                          bytes=saved.size, sha256=saved.sha256, session_id=self.session_id)
             return save_path
+        except UploadTooLarge:
+            raise
         except Exception as e:
             self.log.error("Failed to save PDF", error=str(e), session_id=self.session_id)
             raise DocumentPortalException(f"Failed to save PDF: {str(e)}", e) from e
 
+    def open_pdf(self, pdf_path: str) -> LazyPdfDocument:
+        """
+        Lazy view of a saved PDF for analysis. Previously extracted content comes
+        from the artifact cache; otherwise pages are read on demand with PyMuPDF
+        (files it cannot open fall back to full extraction via read_pdf's backends).
+        """
+        sha = self.hashes.get(pdf_path)
+        cached = get_artifact_cache().get("documents", sha, extractor_signature(".pdf")) if sha else None
+        if cached is not None:
+            return LazyPdfDocument([r["page_content"] for r in cached], source=pdf_path)
+        try:
+            pages = LazyPdfPages(pdf_path, self._buffers.get(pdf_path))
+        except Exception as e:
+            self.log.warning("Lazy PDF open failed, extracting all pages", pdf_path=pdf_path, error=str(e))
+            return LazyPdfDocument(extract_pdf_pages(pdf_path, self._buffers.get(pdf_path), sha), source=pdf_path)
+        self.log.info("PDF opened lazily", pdf_path=pdf_path, session_id=self.session_id, pages=len(pages))
+        return LazyPdfDocument(pages, source=pdf_path)
+
     def read_pdf(self, pdf_path: str) -> str:
         try:
-            text_chunks = []
-            with fitz.open(pdf_path) as doc:
-                for page_num in range(doc.page_count):
-                    page = doc.load_page(page_num)
-                    text_chunks.append(f"\n--- Page {page_num + 1} ---\n{page.get_text()}")  # type: ignore
+            pages = extract_pdf_pages(pdf_path, self._buffers.get(pdf_path), self.hashes.get(pdf_path))
+            text_chunks = [f"\n--- Page {i + 1} ---\n{t}" for i, t in enumerate(pages)]
             text = "\n".join(text_chunks)
             self.log.info("PDF read successfully", pdf_path=pdf_path, session_id=self.session_id, pages=len(text_chunks))
             return text
@@ -226,6 +651,8 @@ class DocumentComparator:
         self.session_id = session_id or generate_session_id()
         self.session_path = self.base_dir / self.session_id
         self.session_path.mkdir(parents=True, exist_ok=True)
+        self._buffers: Dict[str, bytes] = {}  # small uploads kept in memory, keyed by saved path
+        self.hashes: Dict[str, str] = {}  # saved path -> sha256 of its content
         self.log.info("DocumentComparator initialized", session_path=str(self.session_path))
 
     def save_uploaded_files(self, reference_file, actual_file):
@@ -235,28 +662,29 @@ class DocumentComparator:
             for fobj, out in ((reference_file, ref_path), (actual_file, act_path)):
                 if not fobj.name.lower().endswith(".pdf"):
                     raise ValueError("Only PDF files are allowed.")
-                with open(out, "wb") as f:
-                    if hasattr(fobj, "read"):
-                        f.write(fobj.read())
-                    else:
-                        f.write(fobj.getbuffer())
+                saved = get_blob_store().save(
+                    fobj, out, owner=str(self.session_path), keep_in_memory=UPLOAD_MEMORY_BYTES
+                )
+                self.hashes[str(out)] = saved.sha256
+                if saved.data is not None:
+                    self._buffers[str(out)] = saved.data
             self.log.info("Files saved", reference=str(ref_path), actual=str(act_path), session=self.session_id)
             return ref_path, act_path
+        except UploadTooLarge:
+            raise
         except Exception as e:
             self.log.error("Error saving PDF files", error=str(e), session=self.session_id)
             raise DocumentPortalException("Error saving files", e) from e
 
     def read_pdf(self, pdf_path: Path) -> str:
         try:
-            with fitz.open(pdf_path) as doc:
-                if doc.is_encrypted:
-                    raise ValueError(f"PDF is encrypted: {pdf_path.name}")
-                parts = []
-                for page_num in range(doc.page_count):
-                    page = doc.load_page(page_num)
-                    text = page.get_text()  # type: ignore
-                    if text.strip():
-                        parts.append(f"\n --- Page {page_num + 1} --- \n{text}")
+            key = str(pdf_path)
+            pages = extract_pdf_pages(key, self._buffers.get(key), self.hashes.get(key))
+            parts = [
+                f"\n --- Page {i + 1} --- \n{text}"
+                for i, text in enumerate(pages)
+                if text.strip()
+            ]
             self.log.info("PDF read successfully", file=str(pdf_path), pages=len(parts))
             return "\n".join(parts)
         except Exception as e:
@@ -282,6 +710,7 @@ class DocumentComparator:
             sessions = sorted([f for f in self.base_dir.iterdir() if f.is_dir()], reverse=True)
             for folder in sessions[keep_latest:]:
                 shutil.rmtree(folder, ignore_errors=True)
+                get_blob_store().release(str(folder))
                 self.log.info("Old session folder deleted", path=str(folder))
         except Exception as e:
             self.log.error("Error cleaning old sessions", error=str(e))
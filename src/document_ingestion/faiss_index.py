@@ -0,0 +1,509 @@
+from __future__ import annotations
+import math
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import faiss
+
+from utils.config_loader import load_config
+from logger.custom_logger import CustomLogger
+
+log = CustomLogger().get_logger(__name__)
+
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+COMPRESSION_TYPES = ("none", "fp16", "int8")
+
+# Full-precision vectors of a compressed base, next to <base>.faiss (read via mmap for re-ranking)
+FULL_VECTORS_SUFFIX = ".vectors.npy"
+
+# Points per centroid k-means wants for a stable IVF/PQ training
+_TRAIN_POINTS_PER_CENTROID = 39
+
+
+class IndexSettings:
+    """
+    faiss_db.index / faiss_db.search from config.
+
+    Ingest segments are always flat (exact, cheap to build). At compaction the
+    base is converted to `type` once it holds promote_after vectors or more;
+    nprobe / ef_search are the default per-query search breadth. storage picks
+    the compacted base's on-disk format (see sqlite_docstore).
+
+    compression stores the base's codes as fp16 / int8 scalar-quantized
+    vectors, optionally truncated to their first `dim` components (Matryoshka
+    embeddings keep most of their ranking quality in the leading dimensions);
+    the top k * rerank candidates are re-scored against the full-precision
+    vectors kept on disk (see CompressedIndex).
+    """
+
+    def __init__(self, cfg: Optional[Dict[str, Any]] = None):
+        cfg = cfg or {}
+        index = cfg.get("index", {}) or {}
+        search = cfg.get("search", {}) or {}
+        self.type = str(index.get("type", "flat")).lower()
+        if self.type not in INDEX_TYPES:
+            raise ValueError(f"Unsupported faiss_db.index.type: {self.type} (expected one of {INDEX_TYPES})")
+        self.promote_after = int(index.get("promote_after", 50000))
+        self.nlist = int(index.get("nlist", 0))
+        self.pq_m = int(index.get("pq_m", 16))
+        self.hnsw_m = int(index.get("hnsw_m", 32))
+        self.ef_construction = int(index.get("ef_construction", 200))
+        self.nprobe = int(search.get("nprobe", 16))
+        self.ef_search = int(search.get("ef_search", 64))
+        self.storage = str(cfg.get("storage", "mmap")).lower()
+        if self.storage not in ("pickle", "mmap"):
+            raise ValueError(f"Unsupported faiss_db.storage: {self.storage} (expected pickle or mmap)")
+        compression = cfg.get("compression", {}) or {}
+        self.compression = str(compression.get("type", "none")).lower()
+        if self.compression not in COMPRESSION_TYPES:
+            raise ValueError(
+                f"Unsupported faiss_db.compression.type: {self.compression} (expected one of {COMPRESSION_TYPES})"
+            )
+        self.dim = int(compression.get("dim", 0))
+        self.rerank = max(1, int(compression.get("rerank", 4)))
+
+    def qtype(self, kind: str) -> str:
+        # IVF-PQ codes are already compressed: only truncation applies to them
+        return "none" if kind == "ivf_pq" else self.compression
+
+    def compression_tag(self, d: int, kind: str) -> Optional[str]:
+        """Compression a `kind` base of dimension d should have, e.g. "int8/256" (None = uncompressed)."""
+        qtype = self.qtype(kind)
+        if qtype == "none" and not 0 < self.dim < d:
+            return None
+        return f"{qtype}/{self.dim if 0 < self.dim < d else d}"
+
+
+_settings: Optional[IndexSettings] = None
+_settings_lock = threading.Lock()
+
+
+def get_index_settings() -> IndexSettings:
+    global _settings
+    if _settings is None:
+        with _settings_lock:
+            if _settings is None:
+                _settings = IndexSettings(load_config().get("faiss_db", {}) or {})
+    return _settings
+
+
+# ---------- Index kinds ----------
+
+def unwrap(index):
+    """The faiss index under any TunableIndex / CompressedIndex proxies."""
+    while isinstance(index, (TunableIndex, CompressedIndex)):
+        index = index.base_index
+    return index
+
+
+def compressed_of(index) -> Optional["CompressedIndex"]:
+    while isinstance(index, TunableIndex):
+        index = index.base_index
+    return index if isinstance(index, CompressedIndex) else None
+
+
+def index_kind(index) -> str:
+    index = faiss.downcast_index(unwrap(index))
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf_flat"
+    if isinstance(index, (faiss.IndexFlat, faiss.IndexScalarQuantizer)):
+        return "flat"
+    return type(index).__name__
+
+
+def target_kind(settings: IndexSettings, ntotal: int, current: str) -> str:
+    """Index type a compacted base of ntotal vectors should have."""
+    if current != "flat" or settings.type == "flat" or ntotal < settings.promote_after:
+        return current
+    return settings.type
+
+
+def reconstruct_all(index) -> np.ndarray:
+    compressed = compressed_of(index)
+    if compressed is not None:
+        return compressed.full_vectors()  # not the lossy codes
+    index = unwrap(index)
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype="float32")
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+_QTYPES = {"fp16": ("SQfp16", "QT_fp16"), "int8": ("SQ8", "QT_8bit")}
+
+
+def build_index(
+    kind: str,
+    vectors: np.ndarray,
+    metric: int,
+    settings: IndexSettings,
+    compressed: bool = False,
+    normalize_L2: bool = False,
+):
+    """
+    A trained faiss index of the given kind holding vectors (row i == id i);
+    with compressed, a CompressedIndex per settings.compression / dim.
+    """
+    if compressed and settings.compression_tag(vectors.shape[1], kind):
+        return CompressedIndex.build(kind, vectors, metric, settings, normalize_L2)
+    return _build(kind, vectors, metric, settings)
+
+
+def _build(kind: str, vectors: np.ndarray, metric: int, settings: IndexSettings, qtype: Optional[str] = None):
+    n, d = vectors.shape
+    factory_code, qt = _QTYPES.get(qtype, ("Flat", None))
+    nlist = settings.nlist or int(4 * math.sqrt(max(n, 1)))
+    nlist = max(1, min(nlist, n // _TRAIN_POINTS_PER_CENTROID))
+    if kind == "ivf_pq" and (d % settings.pq_m or n < 256 * _TRAIN_POINTS_PER_CENTROID):
+        log.warning("Too few vectors or incompatible dimension for PQ, using IVF-Flat", vectors=n, dim=d)
+        kind = "ivf_flat"
+
+    if kind == "flat":
+        index = faiss.IndexScalarQuantizer(d, getattr(faiss.ScalarQuantizer, qt), metric) if qt else faiss.IndexFlat(d, metric)
+    elif kind == "hnsw":
+        if qt:
+            index = faiss.IndexHNSWSQ(d, getattr(faiss.ScalarQuantizer, qt), settings.hnsw_m, metric)
+        else:
+            index = faiss.IndexHNSWFlat(d, settings.hnsw_m, metric)
+        index.hnsw.efConstruction = settings.ef_construction
+    elif kind == "ivf_flat":
+        index = faiss.index_factory(d, f"IVF{nlist},{factory_code}", metric)
+    elif kind == "ivf_pq":
+        index = faiss.index_factory(d, f"IVF{nlist},PQ{settings.pq_m}", metric)
+    else:
+        raise ValueError(f"Unsupported index type: {kind}")
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+def convert(vs, kind: str, settings: Optional[IndexSettings] = None, compressed: bool = False):
+    """Rebuild a LangChain FAISS store's index in place as `kind` (ids/docstore unchanged)."""
+    settings = settings or get_index_settings()
+    before = index_kind(vs.index)
+    vs.index = build_index(
+        kind,
+        reconstruct_all(vs.index),
+        unwrap(vs.index).metric_type,
+        settings,
+        compressed=compressed,
+        normalize_L2=bool(getattr(vs, "_normalize_L2", False)),
+    )
+    log.info(
+        "FAISS index converted",
+        source=before,
+        target=index_kind(vs.index),
+        compression=compression_tag(vs.index),
+        vectors=vs.index.ntotal,
+    )
+
+
+def compression_tag(index) -> Optional[str]:
+    compressed = compressed_of(index)
+    return compressed.tag if compressed is not None else None
+
+
+# ---------- Merging / deleting across index kinds ----------
+
+def merge_into(vs, segment):
+    """Append a (flat) segment store to vs, whatever vs's index type is."""
+    if index_kind(vs.index) == index_kind(segment.index) == "flat" and compressed_of(vs.index) is None:
+        vs.merge_from(segment)
+        return
+    ids = [segment.index_to_docstore_id[i] for i in range(segment.index.ntotal)]
+    docs = [segment.docstore.search(cid) for cid in ids]
+    vectors = reconstruct_all(segment.index)
+    vs.add_embeddings(
+        list(zip([d.page_content for d in docs], vectors.tolist())),
+        metadatas=[d.metadata for d in docs],
+        ids=ids,
+    )
+
+
+def _renumber_ivf(index, removed: np.ndarray):
+    """
+    IVF remove_ids keeps the surviving ids, while the docstore mapping (and every
+    other index kind) shifts later positions down: renumber the stored ids to match.
+    """
+    ivf = faiss.extract_index_ivf(unwrap(index))
+    ivf.make_direct_map(False)
+    invlists = ivf.invlists
+    for list_no in range(ivf.nlist):
+        n = invlists.list_size(list_no)
+        if n:
+            ids = faiss.rev_swig_ptr(invlists.get_ids(list_no), n)
+            ids -= np.searchsorted(removed, ids)
+
+
+def delete_from(vs, ids: List[str]):
+    """Delete ids from vs; indexes without remove_ids (HNSW) are rebuilt without them."""
+    drop = set(ids)
+    removed = np.sort(np.fromiter((pos for pos, cid in vs.index_to_docstore_id.items() if cid in drop), dtype="int64"))
+    try:
+        vs.delete(ids)
+        if index_kind(vs.index) in ("ivf_flat", "ivf_pq"):
+            _renumber_ivf(vs.index, removed)
+        return
+    except RuntimeError:
+        pass
+    kind = index_kind(vs.index)
+    keep = [i for i in range(vs.index.ntotal) if vs.index_to_docstore_id[i] not in drop]
+    vectors = reconstruct_all(vs.index)[keep]
+    new_map = {new: vs.index_to_docstore_id[old] for new, old in enumerate(keep)}
+    vs.docstore.delete(list(drop & set(vs.index_to_docstore_id.values())))
+    vs.index = build_index(
+        kind,
+        vectors,
+        unwrap(vs.index).metric_type,
+        get_index_settings(),
+        compressed=compressed_of(vs.index) is not None,
+        normalize_L2=bool(getattr(vs, "_normalize_L2", False)),
+    )
+    vs.index_to_docstore_id = new_map
+    log.info("FAISS index rebuilt to apply deletes", kind=kind, deleted=len(drop), vectors=len(keep))
+
+
+# ---------- Per-query search parameters ----------
+
+_search_overrides: ContextVar[Optional[Dict[str, int]]] = ContextVar("faiss_search_params", default=None)
+
+
+@contextmanager
+def search_params(nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """Override nprobe / efSearch for FAISS searches made inside this block (thread/task local)."""
+    overrides = {k: v for k, v in {"nprobe": nprobe, "ef_search": ef_search}.items() if v}
+    token = _search_overrides.set({**(_search_overrides.get() or {}), **overrides})
+    try:
+        yield
+    finally:
+        _search_overrides.reset(token)
+
+
+@contextmanager
+def search_param_defaults(nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """Like search_params(), but values already set by an enclosing block win."""
+    current = _search_overrides.get() or {}
+    with search_params(
+        nprobe=current.get("nprobe", nprobe), ef_search=current.get("ef_search", ef_search)
+    ):
+        yield
+
+
+class TunableIndex:
+    """
+    Read-side proxy over an approximate faiss index: every search gets explicit
+    SearchParameters (config defaults or search_params() overrides), so
+    concurrent queries can use different nprobe/efSearch without mutating the
+    shared index. Everything else is delegated to the wrapped index.
+    """
+
+    def __init__(self, index, settings: IndexSettings):
+        self.base_index = index
+        self.kind = index_kind(index)
+        self.settings = settings
+
+    def __getattr__(self, name):
+        return getattr(self.base_index, name)
+
+    def _params(self):
+        overrides = _search_overrides.get() or {}
+        if self.kind == "hnsw":
+            return faiss.SearchParametersHNSW(efSearch=overrides.get("ef_search", self.settings.ef_search))
+        if self.kind in ("ivf_flat", "ivf_pq"):
+            return faiss.SearchParametersIVF(nprobe=overrides.get("nprobe", self.settings.nprobe))
+        return None
+
+    def search(self, x, k, **kwargs):
+        params = self._params()
+        if params is not None:
+            kwargs.setdefault("params", params)
+        return self.base_index.search(x, k, **kwargs)
+
+
+def search_selected(index, x: np.ndarray, k: int, positions: np.ndarray):
+    """
+    Search only the vectors at `positions` (FAISS IDSelector, applied inside the
+    index scan rather than by post-filtering), with the same nprobe/efSearch
+    resolution as TunableIndex. Returns faiss (distances, labels).
+    """
+    settings = index.settings if isinstance(index, TunableIndex) else get_index_settings()
+    base = unwrap(index)
+    kind = index_kind(base)
+    overrides = _search_overrides.get() or {}
+    selector = faiss.IDSelectorBatch(positions.astype("int64"))
+    if kind == "hnsw":
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=overrides.get("ef_search", settings.ef_search))
+    elif kind in ("ivf_flat", "ivf_pq"):
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=overrides.get("nprobe", settings.nprobe))
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    searcher = compressed_of(index) or base  # compressed: truncate the query and re-rank
+    return searcher.search(x, min(k, len(positions)), params=params)
+
+
+def make_tunable(vs, settings: Optional[IndexSettings] = None):
+    """Install TunableIndex on a served (read-only) store with an approximate index."""
+    if index_kind(vs.index) in ("hnsw", "ivf_flat", "ivf_pq") and not isinstance(vs.index, TunableIndex):
+        vs.index = TunableIndex(vs.index, settings or get_index_settings())
+    return vs
+
+
+# ---------- Compressed bases ----------
+
+class CompressedIndex:
+    """
+    A scalar-quantized (and optionally dimension-truncated) faiss index plus
+    the full-precision vectors it was built from, kept on disk.
+
+    Searches run on the compact codes with the query truncated the same way,
+    over k * rerank candidates, which are then re-scored exactly against the
+    full-precision rows (read through np.memmap: only candidate rows are paged
+    in). Vectors added after loading (segments replayed on top of the base)
+    are kept in memory alongside; `rows` maps each index position to its
+    full-precision row so remove_ids keeps both in step.
+    """
+
+    def __init__(self, index, full: np.ndarray, normalize_L2: bool = False, rerank: int = 4, qtype: str = "none"):
+        self.base_index = index
+        self.full = full
+        self.normalize_L2 = normalize_L2
+        self.rerank = rerank
+        self.qtype = qtype
+        self.rows = np.arange(index.ntotal, dtype="int64")  # >= 0: row of full, < 0: -1 - row of extra
+        self._extra: List[np.ndarray] = []
+        self._extra_n = 0
+
+    @classmethod
+    def build(cls, kind: str, vectors: np.ndarray, metric: int, settings: IndexSettings, normalize_L2: bool = False):
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        dim = settings.dim if 0 < settings.dim < vectors.shape[1] else vectors.shape[1]
+        qtype = settings.qtype(kind)
+        index = _build(kind, cls._truncate(vectors, dim, normalize_L2), metric, settings, qtype=qtype)
+        return cls(index, vectors, normalize_L2, settings.rerank, qtype)
+
+    @classmethod
+    def load(cls, index, path: Path, normalize_L2: bool = False, settings: Optional[IndexSettings] = None):
+        settings = settings or get_index_settings()
+        full = np.load(str(path), mmap_mode="r")
+        codes = faiss.downcast_index(index)
+        if isinstance(codes, faiss.IndexHNSW):
+            codes = faiss.downcast_index(codes.storage)
+        qtype = "none"
+        if hasattr(codes, "sq"):
+            qtype = {faiss.ScalarQuantizer.QT_fp16: "fp16", faiss.ScalarQuantizer.QT_8bit: "int8"}.get(codes.sq.qtype, "none")
+        return cls(index, full, normalize_L2, settings.rerank, qtype)
+
+    @staticmethod
+    def _truncate(x: np.ndarray, dim: int, normalize_L2: bool) -> np.ndarray:
+        if dim >= x.shape[1]:
+            return np.ascontiguousarray(x, dtype="float32")
+        out = np.ascontiguousarray(x[:, :dim], dtype="float32")
+        if normalize_L2:
+            faiss.normalize_L2(out)
+        return out
+
+    @property
+    def d(self) -> int:
+        return self.full.shape[1]
+
+    @property
+    def tag(self) -> str:
+        return f"{self.qtype}/{self.base_index.d}"
+
+    def __getattr__(self, name):
+        return getattr(self.base_index, name)
+
+    # ---------- Full-precision rows ----------
+
+    def _gather(self, positions: np.ndarray) -> np.ndarray:
+        rows = self.rows[positions]
+        out = np.empty((len(positions), self.d), dtype="float32")
+        on_disk = rows >= 0
+        if on_disk.any():
+            order = np.argsort(rows[on_disk])  # sorted reads from the memmap
+            picked = np.flatnonzero(on_disk)[order]
+            out[picked] = self.full[rows[on_disk][order]]
+        if not on_disk.all():
+            extra = np.concatenate(self._extra) if len(self._extra) > 1 else self._extra[0]
+            self._extra = [extra]
+            out[~on_disk] = extra[-1 - rows[~on_disk]]
+        return out
+
+    def full_vectors(self) -> np.ndarray:
+        return self._gather(np.arange(self.base_index.ntotal, dtype="int64"))
+
+    def reconstruct(self, i: int, *args) -> np.ndarray:
+        return self._gather(np.asarray([i], dtype="int64"))[0]
+
+    # ---------- faiss index surface used by LangChain / FaissManager ----------
+
+    def add(self, x: np.ndarray):
+        x = np.ascontiguousarray(x, dtype="float32")
+        self.base_index.add(self._truncate(x, self.base_index.d, self.normalize_L2))
+        self._extra.append(x.copy())
+        new = -1 - np.arange(self._extra_n, self._extra_n + len(x), dtype="int64")
+        self.rows = np.concatenate([self.rows, new])
+        self._extra_n += len(x)
+
+    def remove_ids(self, ids) -> int:
+        ids = np.asarray(ids, dtype="int64")
+        removed = self.base_index.remove_ids(ids)  # raises RuntimeError for HNSW, see delete_from
+        self.rows = np.delete(self.rows, ids[(ids >= 0) & (ids < len(self.rows))])
+        return removed
+
+    def search(self, x, k, params=None, **kwargs):
+        x = np.ascontiguousarray(x, dtype="float32")
+        nq = x.shape[0]
+        fetch = max(k, k * self.rerank)
+        xt = self._truncate(x, self.base_index.d, self.normalize_L2)
+        if params is not None:
+            kwargs["params"] = params
+        _, labels = self.base_index.search(xt, fetch, **kwargs)
+
+        higher_is_better = self.base_index.metric_type == faiss.METRIC_INNER_PRODUCT
+        out_d = np.full((nq, k), -np.inf if higher_is_better else np.inf, dtype="float32")
+        out_i = np.full((nq, k), -1, dtype="int64")
+        for q in range(nq):
+            cand = labels[q][labels[q] >= 0]
+            if not len(cand):
+                continue
+            vecs = self._gather(cand)
+            if higher_is_better:
+                scores = vecs @ x[q]
+                order = np.argsort(-scores)[:k]
+            else:
+                scores = ((vecs - x[q]) ** 2).sum(axis=1)  # squared L2, as faiss reports it
+                order = np.argsort(scores)[:k]
+            out_d[q, : len(order)] = scores[order]
+            out_i[q, : len(order)] = cand[order]
+        return out_d, out_i
+
+
+def save_full_vectors(vs, folder: Path, name: str):
+    """Write <name>.vectors.npy for a compressed store (no-op otherwise)."""
+    compressed = compressed_of(vs.index)
+    if compressed is None:
+        return
+    target = Path(folder) / f"{name}{FULL_VECTORS_SUFFIX}"
+    tmp = target.with_name(f"{name}.vectors.tmp.npy")
+    np.save(str(tmp), compressed.full_vectors())
+    tmp.replace(target)
+
+
+def attach_full_vectors(vs, folder: Path, name: str):
+    """Re-wrap a loaded base whose full-precision vectors were saved beside it."""
+    path = Path(folder) / f"{name}{FULL_VECTORS_SUFFIX}"
+    if path.exists() and compressed_of(vs.index) is None:
+        vs.index = CompressedIndex.load(vs.index, path, normalize_L2=bool(getattr(vs, "_normalize_L2", False)))
+    return vs
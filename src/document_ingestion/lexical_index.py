@@ -0,0 +1,149 @@
+from __future__ import annotations
+import os
+import re
+import gzip
+import json
+import math
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from logger.custom_logger import CustomLogger
+
+log = CustomLogger().get_logger(__name__)
+
+# Words, plus identifiers such as "4.2.1", "AB-1234" or "ISO/IEC" kept whole
+_TOKEN_RE = re.compile(r"[0-9a-z]+(?:[._\-/][0-9a-z]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased terms; compound identifiers are emitted whole and as their parts."""
+    terms: List[str] = []
+    for tok in _TOKEN_RE.findall(text.lower()):
+        terms.append(tok)
+        if not tok.isalnum():
+            terms.extend(p for p in re.split(r"[._\-/]", tok) if p)
+    return terms
+
+
+class BM25Index:
+    """
+    Inverted index (BM25 / Okapi) over the chunks of one FAISS index directory,
+    keyed by the same chunk ids as the vectors.
+
+    Persisted as <index_dir>/<index_name>.bm25.json.gz, stamped with the manifest
+    generation it reflects (see SegmentStore.last_gen); a stale or missing file
+    is rebuilt from the FAISS docstore on load.
+    """
+
+    def __init__(self, gen: int = 0, k1: float = 1.5, b: float = 0.75):
+        self.gen = gen
+        self.k1 = k1
+        self.b = b
+        self.doc_len: Dict[str, int] = {}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self._total_len = 0
+
+    def __len__(self) -> int:
+        return len(self.doc_len)
+
+    # ---------- Updates ----------
+
+    def add(self, ids: Iterable[str], texts: Iterable[str]):
+        for cid, text in zip(ids, texts):
+            if cid in self.doc_len:
+                continue
+            terms = Counter(tokenize(text))
+            self.doc_len[cid] = sum(terms.values())
+            self._total_len += self.doc_len[cid]
+            for term, tf in terms.items():
+                self.postings.setdefault(term, {})[cid] = tf
+
+    def remove(self, ids: Iterable[str]):
+        drop = {cid for cid in ids if cid in self.doc_len}
+        if not drop:
+            return
+        for cid in drop:
+            self._total_len -= self.doc_len.pop(cid)
+        for term in list(self.postings):
+            plist = self.postings[term]
+            for cid in drop.intersection(plist):
+                del plist[cid]
+            if not plist:
+                del self.postings[term]
+
+    # ---------- Search ----------
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Top-k (chunk id, BM25 score), best first."""
+        n = len(self.doc_len)
+        if not n:
+            return []
+        avgdl = self._total_len / n or 1.0
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            idf = math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            for cid, tf in plist.items():
+                norm = tf + self.k1 * (1 - self.b + self.b * self.doc_len[cid] / avgdl)
+                scores[cid] = scores.get(cid, 0.0) + idf * tf * (self.k1 + 1) / norm
+        return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:k]
+
+    # ---------- Persistence ----------
+
+    @staticmethod
+    def path_for(index_dir: Path, index_name: str = "index") -> Path:
+        return Path(index_dir) / f"{index_name}.bm25.json.gz"
+
+    def save(self, path: Path):
+        payload = {"gen": self.gen, "k1": self.k1, "b": self.b, "doc_len": self.doc_len, "postings": self.postings}
+        tmp = path.with_name(path.name + ".tmp")
+        with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=5) as f:
+            json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["BM25Index"]:
+        if not path.exists():
+            return None
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                payload = json.load(f)
+        except Exception as e:
+            log.warning("Unreadable BM25 index, will rebuild", path=str(path), error=str(e))
+            return None
+        idx = cls(gen=payload.get("gen", 0), k1=payload.get("k1", 1.5), b=payload.get("b", 0.75))
+        idx.doc_len = payload.get("doc_len", {})
+        idx.postings = payload.get("postings", {})
+        idx._total_len = sum(idx.doc_len.values())
+        return idx
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore, gen: int) -> "BM25Index":
+        """Rebuild from the texts held in a loaded FAISS docstore."""
+        idx = cls(gen=gen)
+        ids = list(vectorstore.index_to_docstore_id.values())
+        idx.add(ids, (vectorstore.docstore.search(cid).page_content for cid in ids))
+        return idx
+
+    @classmethod
+    def for_store(cls, store, vectorstore, gen: Optional[int] = None) -> "BM25Index":
+        """
+        The persisted index of a SegmentStore if current, else rebuilt (and persisted)
+        from vectorstore. gen is the store generation vectorstore was loaded at
+        (read before loading, so a racing commit can only make it look stale).
+        """
+        path = cls.path_for(store.index_dir, store.index_name)
+        gen = store.last_gen() if gen is None else gen
+        idx = cls.load(path)
+        if idx is not None and idx.gen == gen:
+            return idx
+        idx = cls.from_vectorstore(vectorstore, gen)
+        try:
+            store.write_if_current(gen, lambda: idx.save(path))
+        except OSError as e:
+            log.warning("Could not persist rebuilt BM25 index", path=str(path), error=str(e))
+        log.info("BM25 index rebuilt", index_dir=str(store.index_dir), docs=len(idx), gen=gen)
+        return idx
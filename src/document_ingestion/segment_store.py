@@ -0,0 +1,484 @@
+from __future__ import annotations
+import os
+import json
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_community.vectorstores import FAISS
+
+from src.document_ingestion.faiss_index import (
+    FULL_VECTORS_SUFFIX,
+    attach_full_vectors,
+    compression_tag,
+    convert,
+    delete_from,
+    get_index_settings,
+    index_kind,
+    make_tunable,
+    merge_into,
+    save_full_vectors,
+    target_kind,
+    unwrap,
+)
+from src.document_ingestion.sqlite_docstore import (
+    DOCSTORE_SUFFIX,
+    has_mmap_store,
+    load_mmap_store,
+    save_mmap_store,
+)
+from logger.custom_logger import CustomLogger
+from exception.custom_exception import DocumentPortalException
+
+try:
+    import fcntl
+except ImportError:  # Windows: in-process locking only
+    fcntl = None
+
+log = CustomLogger().get_logger(__name__)
+
+# One lock per index directory, shared by every SegmentStore in the process
+_dir_locks: Dict[str, threading.RLock] = {}
+_dir_locks_guard = threading.Lock()
+_compacting: set = set()
+# Index dirs whose manifest.lock the current thread holds (the file lock is taken once per thread)
+_file_locks_held = threading.local()
+
+
+def _dir_lock(path: Path) -> threading.RLock:
+    key = str(path.resolve())
+    with _dir_locks_guard:
+        return _dir_locks.setdefault(key, threading.RLock())
+
+
+class SegmentStore:
+    """
+    Append-only on-disk layout for one FAISS index directory.
+
+        <index_dir>/base_<gen>.faiss|.pkl     compacted index (or legacy index.faiss|.pkl)
+        <index_dir>/base_<gen>.faiss|.docstore.sqlite   ... or, with faiss_db.storage: mmap,
+                                              an mmap-able index + per-id SQLite docstore
+        <index_dir>/segments/seg_<gen>.*      small indexes, one per ingest batch
+        <index_dir>/manifest.log              write-ahead manifest, one JSON record per line
+
+    manifest.log starts with an optional checkpoint record naming the base and
+    carrying the file manifest at compaction time, followed by one commit record
+    per batch:
+
+        {"op": "checkpoint", "gen": 7, "base": "base_00000007", "index": "hnsw", "format": "mmap", "meta": {...}}
+        {"op": "commit", "gen": 8, "segment": "seg_00000008", "delete": [...], "files": {...}, "rows": {...}}
+
+    A batch costs one small segment write plus one appended line, independent of
+    index size. Loading replays the log; compaction folds segments into a new base.
+    Several worker processes may share a directory: commits and the compaction
+    swap hold an exclusive flock on manifest.lock (readers a shared one), and
+    compactions are serialized across processes by compact.lock.
+
+    Segments are always flat; compaction promotes the base to the configured
+    approximate index type (faiss_db.index, see faiss_index.IndexSettings) once
+    it is large enough, and loaded stores search it with per-query nprobe/efSearch.
+    With faiss_db.compression the base holds scalar-quantized codes and its
+    full-precision vectors go to base_<gen>.vectors.npy, memory-mapped for re-ranking.
+    """
+
+    LOG_NAME = "manifest.log"
+    LOCK_NAME = "manifest.lock"
+    COMPACT_LOCK_NAME = "compact.lock"
+    SEGMENT_DIR = "segments"
+    LEGACY_META = "ingested_meta.json"
+
+    def __init__(self, index_dir: Path, index_name: str = "index"):
+        self.index_dir = Path(index_dir)
+        self.index_name = index_name
+        self.log_path = self.index_dir / self.LOG_NAME
+        self.segment_dir = self.index_dir / self.SEGMENT_DIR
+        self._lock = _dir_lock(self.index_dir)
+
+    @contextmanager
+    def _locked(self, exclusive: bool = True):
+        """
+        The directory's in-process lock plus a flock on manifest.lock, so commits
+        and compaction swaps in other worker processes are excluded too (exclusive
+        for writers, shared for readers). Re-entrant within a thread.
+        """
+        with self._lock:
+            held = getattr(_file_locks_held, "dirs", None)
+            if held is None:
+                held = _file_locks_held.dirs = set()
+            key = str(self.index_dir)
+            if fcntl is None or key in held or not (exclusive or self.index_dir.is_dir()):
+                yield
+                return
+            self.index_dir.mkdir(parents=True, exist_ok=True)
+            with open(self.index_dir / self.LOCK_NAME, "a+b") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                held.add(key)
+                try:
+                    yield
+                finally:
+                    held.discard(key)
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _compaction_slot(self):
+        """Yields False if another process is already compacting this directory."""
+        if fcntl is None:
+            yield True
+            return
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.index_dir / self.COMPACT_LOCK_NAME, "a+b") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # ---------- Reading ----------
+
+    def read_log(self) -> List[Dict[str, Any]]:
+        if not self.log_path.exists():
+            return []
+        records = []
+        with open(self.log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # Torn tail from a crash mid-append: the batch never committed
+                    log.warning("Ignoring torn manifest record", path=str(self.log_path))
+                    break
+        return records
+
+    def _checkpoint(self, records: List[Dict[str, Any]]) -> Tuple[Optional[str], Dict[str, Any], int]:
+        """(base index name, manifest at checkpoint, checkpoint gen); falls back to the legacy layout."""
+        if records and records[0].get("op") == "checkpoint":
+            cp = records[0]
+            return cp.get("base"), cp.get("meta") or {}, cp.get("gen", 0)
+        meta: Dict[str, Any] = {}
+        legacy_meta = self.index_dir / self.LEGACY_META
+        if legacy_meta.exists():
+            try:
+                meta = json.loads(legacy_meta.read_text(encoding="utf-8")) or {}
+            except Exception:
+                meta = {}
+        base = self.index_name if self._index_files_exist(self.index_dir, self.index_name) else None
+        return base, meta, 0
+
+    @staticmethod
+    def _index_files_exist(folder: Path, name: str) -> bool:
+        return (folder / f"{name}.faiss").exists() and (folder / f"{name}.pkl").exists()
+
+    @staticmethod
+    def apply_meta(meta: Dict[str, Any], record: Dict[str, Any]):
+        files = meta.setdefault("files", {})
+        rows = meta.setdefault("rows", {})
+        for key, entry in (record.get("files") or {}).items():
+            if entry is None:
+                files.pop(key, None)
+            else:
+                files[key] = entry
+        for cid, key in (record.get("rows") or {}).items():
+            if key is None:
+                rows.pop(cid, None)
+            else:
+                rows[cid] = key
+
+    def load_meta(self) -> Dict[str, Any]:
+        """Replay the manifest without touching any vectors (cheap)."""
+        with self._locked(exclusive=False):
+            records = self.read_log()
+            _, meta, _ = self._checkpoint(records)
+        meta = {"files": dict(meta.get("files", {})), "rows": dict(meta.get("rows", {}))}
+        for rec in records:
+            if rec.get("op") == "commit":
+                self.apply_meta(meta, rec)
+        return meta
+
+    def exists(self) -> bool:
+        records = self.read_log()
+        base, _, _ = self._checkpoint(records)
+        return base is not None or any(r.get("segment") for r in records)
+
+    def load(self, embeddings, records: Optional[List[Dict[str, Any]]] = None) -> Optional[FAISS]:
+        """
+        Load base + all committed segments into one in-memory FAISS store
+        (segments are merged in commit order, deletes applied as they occur).
+        The result is for searching: approximate indexes get per-query search params.
+        """
+        try:
+            # Held so a concurrent compaction cannot unlink files we are about to read
+            with self._locked(exclusive=False):
+                vs = self._replay(self.read_log() if records is None else records, embeddings)
+            return make_tunable(vs) if vs is not None else None
+        except Exception as e:
+            log.error("Failed to load segmented FAISS index", error=str(e), index_dir=str(self.index_dir))
+            raise DocumentPortalException("Failed to load FAISS segments", e) from e
+
+    def _replay(self, records: List[Dict[str, Any]], embeddings) -> Optional[FAISS]:
+        base, _, _ = self._checkpoint(records)
+        vs: Optional[FAISS] = None
+        if base is not None:
+            vs = self._load_base(base, records, embeddings)
+
+        for rec in records:
+            if rec.get("op") != "commit":
+                continue
+            if rec.get("delete") and vs is not None:
+                known = set(vs.index_to_docstore_id.values())
+                present = [i for i in rec["delete"] if i in known]
+                if present:
+                    delete_from(vs, present)
+            if rec.get("segment"):
+                seg = self._load_index(self.segment_dir, rec["segment"], embeddings)
+                if vs is None:
+                    vs = seg
+                else:
+                    merge_into(vs, seg)
+        return vs
+
+    def _load_base(self, base: str, records: List[Dict[str, Any]], embeddings) -> FAISS:
+        if not has_mmap_store(self.index_dir, base):
+            return attach_full_vectors(self._load_index(self.index_dir, base, embeddings), self.index_dir, base)
+        # mmap'd codes / IVF lists are read-only: read them into memory if later commits must modify them
+        mutated = any(r.get("segment") or r.get("delete") for r in records if r.get("op") == "commit")
+        vs = load_mmap_store(self.index_dir, base, embeddings, mmap=not mutated)
+        return attach_full_vectors(vs, self.index_dir, base)
+
+    @staticmethod
+    def _load_index(folder: Path, name: str, embeddings) -> FAISS:
+        return FAISS.load_local(
+            str(folder),
+            embeddings=embeddings,
+            index_name=name,
+            allow_dangerous_deserialization=True,  # ok if you trust the index
+        )
+
+    def generation(self) -> Tuple:
+        """
+        On-disk version stamp: changes on every commit and compaction.
+        Used by caches to decide whether a loaded store is stale.
+        """
+        stamp = []
+        paths = [self.log_path]
+        if not self.log_path.exists():
+            paths = [self.index_dir / f"{self.index_name}{ext}" for ext in (".faiss", ".pkl")]
+            if not all(p.exists() for p in paths):
+                raise FileNotFoundError(f"No FAISS index in {self.index_dir}")
+        for p in paths:
+            st = os.stat(p)
+            stamp.append((st.st_mtime_ns, st.st_size))
+        return tuple(stamp)
+
+    def disk_bytes(self) -> int:
+        """
+        Bytes of every index file currently referenced (rough in-memory size of the
+        loaded store). Full-precision vectors of a compressed base are not counted:
+        they are only paged in for re-ranked candidates.
+        """
+        records = self.read_log()
+        base, _, _ = self._checkpoint(records)
+        files = []
+        if base is not None:
+            files += [self.index_dir / f"{base}{ext}" for ext in (".faiss", ".pkl", DOCSTORE_SUFFIX)]
+        for rec in records:
+            if rec.get("segment"):
+                files += [self.segment_dir / f"{rec['segment']}{ext}" for ext in (".faiss", ".pkl")]
+        return sum(p.stat().st_size for p in files if p.exists())
+
+    def last_gen(self) -> int:
+        """Generation of the latest commit/checkpoint (0 for an empty or legacy index)."""
+        return max([r.get("gen", 0) for r in self.read_log()] + [0])
+
+    def started_empty(self, gen: int) -> bool:
+        """True if the store had no base and no segment before commit gen (gen began a new index)."""
+        with self._locked(exclusive=False):
+            records = self.read_log()
+            base, _, _ = self._checkpoint(records)
+        return base is None and not any(r.get("segment") for r in records if r.get("gen", 0) < gen)
+
+    def write_if_current(self, gen: int, write: Callable[[], Any]) -> bool:
+        """
+        Run write() (e.g. persisting a side index built at gen) under the directory
+        lock, only if nothing was committed or compacted since gen. Returns whether it ran.
+        """
+        with self._locked():
+            if self.last_gen() != gen:
+                return False
+            write()
+            return True
+
+    def segment_count(self) -> int:
+        return sum(1 for r in self.read_log() if r.get("segment"))
+
+    def needs_compaction(self, compact_after: int) -> bool:
+        """
+        Too many segments, or deletes against a base that cannot remove vectors
+        in place (HNSW: every load would rebuild it until compacted).
+        """
+        records = self.read_log()
+        if sum(1 for r in records if r.get("segment")) >= compact_after:
+            return True
+        base_index = records[0].get("index") if records and records[0].get("op") == "checkpoint" else None
+        return base_index == "hnsw" and any(r.get("delete") for r in records[1:])
+
+    # ---------- Writing ----------
+
+    def _next_gen(self, records: List[Dict[str, Any]]) -> int:
+        return max([r.get("gen", 0) for r in records] + [0]) + 1
+
+    def _append(self, record: Dict[str, Any]):
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def commit(
+        self,
+        segment: Optional[FAISS],
+        delete_ids: Optional[List[str]] = None,
+        files: Optional[Dict[str, Any]] = None,
+        rows: Optional[Dict[str, Any]] = None,
+    ) -> int:
+        """
+        Durably record one batch: write the new vectors (if any) as a segment,
+        then append the commit record. Returns the batch generation.
+        """
+        try:
+            with self._locked():
+                gen = self._next_gen(self.read_log())
+                record: Dict[str, Any] = {"op": "commit", "gen": gen, "segment": None}
+                if segment is not None:
+                    name = f"seg_{gen:08d}"
+                    self.segment_dir.mkdir(parents=True, exist_ok=True)
+                    segment.save_local(str(self.segment_dir), index_name=name)
+                    record["segment"] = name
+                record["delete"] = list(delete_ids or [])
+                record["files"] = files or {}
+                record["rows"] = rows or {}
+                # The segment only becomes visible once this line is on disk
+                self._append(record)
+            log.info("Segment committed", gen=gen, segment=record["segment"],
+                     deleted=len(record["delete"]), index_dir=str(self.index_dir))
+            return gen
+        except Exception as e:
+            log.error("Failed to commit segment", error=str(e), index_dir=str(self.index_dir))
+            raise DocumentPortalException("Failed to commit FAISS segment", e) from e
+
+    def compact(self, embeddings):
+        """
+        Fold base + segments into a single new base and rewrite the manifest as
+        checkpoint + any commits that arrived while compacting.
+        Writers are only blocked for the final swap, not for the index rebuild.
+        """
+        with self._compaction_slot() as ours:
+            if not ours:
+                log.info("Compaction already running in another process", index_dir=str(self.index_dir))
+                return
+            self._compact(embeddings)
+
+    def _compact(self, embeddings):
+        try:
+            with self._locked(exclusive=False):
+                records = self.read_log()
+            if not any(r.get("op") == "commit" for r in records):
+                return
+            old_base, _, _ = self._checkpoint(records)
+
+            # Only the compactor deletes files and compactions are serialized, so no lock needed here
+            vs = self._replay(records, embeddings)
+            meta = {"files": {}, "rows": {}}
+            _, cp_meta, _ = self._checkpoint(records)
+            self.apply_meta(meta, cp_meta)
+            for rec in records:
+                if rec.get("op") == "commit":
+                    self.apply_meta(meta, rec)
+
+            gen = records[-1].get("gen", 0)
+            base = f"base_{gen:08d}"
+            kind = None
+            settings = get_index_settings()
+            if vs is not None:
+                kind = index_kind(vs.index)
+                wanted = target_kind(settings, vs.index.ntotal, kind)
+                compression = settings.compression_tag(vs.index.d, wanted)
+                if wanted != kind or compression != compression_tag(vs.index):
+                    convert(vs, wanted, compressed=compression is not None)
+                    kind = index_kind(vs.index)
+                if settings.storage == "mmap":
+                    save_mmap_store(vs, self.index_dir, base)
+                else:
+                    index, vs.index = vs.index, unwrap(vs.index)
+                    try:
+                        vs.save_local(str(self.index_dir), index_name=base)
+                    finally:
+                        vs.index = index
+                save_full_vectors(vs, self.index_dir, base)
+
+            with self._locked():
+                current = self.read_log()
+                if current[:len(records)] != records:
+                    # the log was rewritten under us (e.g. by a compactor that ignored compact.lock)
+                    log.warning("Manifest changed during compaction, keeping it", index_dir=str(self.index_dir))
+                    return
+                tail = current[len(records):]  # commits appended while we were compacting
+                checkpoint = {
+                    "op": "checkpoint",
+                    "gen": gen,
+                    "base": base if vs is not None else None,
+                    "index": kind,
+                    "format": settings.storage if vs is not None else None,
+                    "compression": compression_tag(vs.index) if vs is not None else None,
+                    "meta": meta,
+                }
+                tmp = self.log_path.with_suffix(".log.tmp")
+                with open(tmp, "w", encoding="utf-8") as f:
+                    for rec in [checkpoint] + tail:
+                        f.write(json.dumps(rec, ensure_ascii=False, separators=(",", ":")) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, self.log_path)
+
+                # Old files are no longer referenced by the manifest
+                folded = [r["segment"] for r in records if r.get("segment")]
+                for name in folded:
+                    for ext in (".faiss", ".pkl"):
+                        (self.segment_dir / f"{name}{ext}").unlink(missing_ok=True)
+                if old_base is not None and old_base != base:
+                    for ext in (".faiss", ".pkl", DOCSTORE_SUFFIX, FULL_VECTORS_SUFFIX):
+                        (self.index_dir / f"{old_base}{ext}").unlink(missing_ok=True)
+                (self.index_dir / self.LEGACY_META).unlink(missing_ok=True)
+
+            log.info("Segments compacted", base=base, index=kind, segments=len(folded), index_dir=str(self.index_dir))
+        except Exception as e:
+            log.error("Failed to compact segments", error=str(e), index_dir=str(self.index_dir))
+            raise DocumentPortalException("Failed to compact FAISS segments", e) from e
+
+    def compact_async(self, embeddings) -> Optional[threading.Thread]:
+        """Run compact() on a daemon thread (one at a time per store)."""
+        key = str(self.index_dir.resolve())
+        with _dir_locks_guard:
+            if key in _compacting:
+                return None
+            _compacting.add(key)
+
+        def run():
+            try:
+                self.compact(embeddings)
+            except Exception:
+                pass  # already logged; the segments stay valid and are retried next time
+            finally:
+                with _dir_locks_guard:
+                    _compacting.discard(key)
+
+        t = threading.Thread(target=run, name=f"faiss-compact-{self.index_dir.name}", daemon=True)
+        t.start()
+        return t
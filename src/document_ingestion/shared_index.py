@@ -0,0 +1,167 @@
+from __future__ import annotations
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from utils.config_loader import load_config
+from logger.custom_logger import CustomLogger
+from exception.custom_exception import DocumentPortalException
+from src.document_ingestion.segment_store import SegmentStore
+
+log = CustomLogger().get_logger(__name__)
+
+
+class SharedIndex:
+    """
+    One index shared by every session, split into shards of bounded size.
+
+        <root>/shard_00000/ ...       each shard is a regular SegmentStore/FaissManager dir
+        <root>/tenants.sqlite         which session's file/chunks live in which shard
+
+    New files go to the active (last) shard; once it holds max_shard_vectors
+    vectors a new shard is started. A file that is re-uploaded stays in the
+    shard it was first written to, so its incremental sync still applies.
+    Queries are restricted to a set of sessions by searching each shard with
+    a FAISS ID selector built from the tenants table (see SharedIndexRetriever).
+    """
+
+    TENANTS_DB = "tenants.sqlite"
+
+    def __init__(self, root: str = "faiss_index/_shared", max_shard_vectors: int = 200_000):
+        try:
+            self.root = Path(root)
+            self.root.mkdir(parents=True, exist_ok=True)
+            self.max_shard_vectors = max_shard_vectors
+            self._lock = threading.Lock()
+            self._conn = sqlite3.connect(str(self.root / self.TENANTS_DB), check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS chunks (
+                       session_id TEXT NOT NULL,
+                       file_key TEXT NOT NULL,
+                       shard TEXT NOT NULL,
+                       chunk_id TEXT NOT NULL,
+                       PRIMARY KEY (session_id, file_key, chunk_id)
+                   )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_chunks_tenant ON chunks(session_id, shard)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS version (v INTEGER NOT NULL)")
+            if self._conn.execute("SELECT COUNT(*) FROM version").fetchone()[0] == 0:
+                self._conn.execute("INSERT INTO version(v) VALUES (0)")
+            self._conn.commit()
+        except Exception as e:
+            log.error("Failed to open shared index", error=str(e), root=str(root))
+            raise DocumentPortalException("Shared index initialization error", e) from e
+
+    # ---------- Shards ----------
+
+    @staticmethod
+    def namespaced_key(session_id: str, file_key: str) -> str:
+        """File key inside a shard: chunk ids hash it, so equal files of two sessions never collide."""
+        return f"{session_id}/{file_key}"
+
+    def shard_dir(self, shard: str) -> Path:
+        return self.root / shard
+
+    def shards(self) -> List[str]:
+        return sorted(p.name for p in self.root.glob("shard_*") if p.is_dir())
+
+    def active_shard(self) -> str:
+        """Shard new files go to; rolls over to a fresh shard when the last one is full."""
+        with self._lock:
+            shards = self.shards()
+            if shards:
+                last = shards[-1]
+                size = len(SegmentStore(self.shard_dir(last)).load_meta()["rows"])
+                if size < self.max_shard_vectors:
+                    return last
+                log.info("Shared index shard full, rolling", shard=last, vectors=size)
+            shard = f"shard_{len(shards):05d}"
+            self.shard_dir(shard).mkdir(parents=True, exist_ok=True)
+            return shard
+
+    def shard_for_file(self, session_id: str, file_key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT shard FROM chunks WHERE session_id=? AND file_key=? LIMIT 1", (session_id, file_key)
+            ).fetchone()
+        return row[0] if row else None
+
+    # ---------- Tenants ----------
+
+    def register_file(self, session_id: str, file_key: str, shard: str, chunk_ids: Iterable[str]):
+        """Record the current chunk ids of one session file (replaces its previous list)."""
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks WHERE session_id=? AND file_key=?", (session_id, file_key))
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO chunks(session_id, file_key, shard, chunk_id) VALUES (?,?,?,?)",
+                [(session_id, file_key, shard, cid) for cid in chunk_ids],
+            )
+            self._conn.execute("UPDATE version SET v = v + 1")
+            self._conn.commit()
+
+    def version(self) -> int:
+        """Bumped on every tenant change (by any process): per-tenant id lists cached under it."""
+        with self._lock:
+            return self._conn.execute("SELECT v FROM version").fetchone()[0]
+
+    def tenant_shards(self, session_ids: List[str]) -> List[str]:
+        marks = ",".join("?" * len(session_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT DISTINCT shard FROM chunks WHERE session_id IN ({marks}) ORDER BY shard", session_ids
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def tenant_chunk_ids(self, session_ids: List[str], shard: str) -> List[str]:
+        marks = ",".join("?" * len(session_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT chunk_id FROM chunks WHERE shard=? AND session_id IN ({marks})", [shard, *session_ids]
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sessions, chunks = self._conn.execute(
+                "SELECT COUNT(DISTINCT session_id), COUNT(*) FROM chunks"
+            ).fetchone()
+        return {
+            "root": str(self.root),
+            "shards": len(self.shards()),
+            "sessions": sessions,
+            "chunks": chunks,
+            "max_shard_vectors": self.max_shard_vectors,
+        }
+
+
+_shared: Optional[SharedIndex] = None
+_shared_enabled: Optional[bool] = None
+_shared_lock = threading.Lock()
+
+
+def shared_index_enabled() -> bool:
+    """config['faiss_db']['shared']['enabled'], read once per process."""
+    global _shared_enabled
+    if _shared_enabled is None:
+        with _shared_lock:
+            if _shared_enabled is None:
+                cfg = load_config().get("faiss_db", {}).get("shared", {}) or {}
+                _shared_enabled = bool(cfg.get("enabled", False))
+    return _shared_enabled
+
+
+def get_shared_index() -> SharedIndex:
+    """Return the process-wide SharedIndex, configured from config['faiss_db']['shared']."""
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                cfg = load_config().get("faiss_db", {}).get("shared", {}) or {}
+                _shared = SharedIndex(
+                    root=os.getenv("SHARED_INDEX_PATH", cfg.get("path", "faiss_index/_shared")),
+                    max_shard_vectors=int(cfg.get("max_shard_vectors", 200_000)),
+                )
+    return _shared
@@ -0,0 +1,149 @@
+from __future__ import annotations
+import os
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Union
+
+import faiss
+from langchain_core.documents import Document
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+
+from logger.custom_logger import CustomLogger
+from src.document_ingestion.faiss_index import unwrap
+
+log = CustomLogger().get_logger(__name__)
+
+DOCSTORE_SUFFIX = ".docstore.sqlite"
+# mmap of IndexFlatCodes storage, faiss >= 1.11; older versions read flat codes into memory
+MMAP_IFC = getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """
+    Read-only SQLite docstore of a saved FAISS store: chunk texts and metadata
+    are fetched per id (i.e. only for search hits) instead of unpickling the
+    whole docstore at load.
+
+    Documents added or deleted after loading (segments replayed on top of the
+    base) live in an in-memory overlay; the file itself is only written by
+    save_mmap_store().
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        self._added: Dict[str, Document] = {}
+        self._deleted: set = set()
+
+    def search(self, search: str) -> Union[str, Document]:
+        if search in self._added:
+            return self._added[search]
+        if search in self._deleted:
+            return f"ID {search} not found."
+        with self._lock:
+            row = self._conn.execute("SELECT text, metadata FROM docs WHERE id=?", (search,)).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(id=search, page_content=row[0], metadata=json.loads(row[1]))
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        overlapping = set(texts).intersection(self._added)
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        for cid, doc in texts.items():
+            self._deleted.discard(cid)
+            self._added[cid] = doc
+
+    def delete(self, ids: List) -> None:
+        for cid in ids:
+            if self._added.pop(cid, None) is None:
+                self._deleted.add(cid)
+
+    def positions(self) -> Dict[int, str]:
+        """index position -> docstore id, as saved."""
+        with self._lock:
+            return dict(self._conn.execute("SELECT pos, id FROM positions"))
+
+    def meta(self) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT key, value FROM meta"))
+
+
+def has_mmap_store(folder: Path, name: str) -> bool:
+    return (Path(folder) / f"{name}.faiss").exists() and (Path(folder) / f"{name}{DOCSTORE_SUFFIX}").exists()
+
+
+def save_mmap_store(vs: FAISS, folder: Path, name: str):
+    """
+    Write vs as <name>.faiss (plain faiss file, mmap-able) + <name>.docstore.sqlite.
+    Both files are built under temp names and renamed into place, so a reader
+    (possibly mmapping it) never sees a half-written index.
+    """
+    folder = Path(folder)
+    suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+    index_path = folder / f"{name}.faiss"
+    index_tmp = index_path.with_name(index_path.name + suffix)
+    try:
+        faiss.write_index(unwrap(vs.index), str(index_tmp))
+        os.replace(index_tmp, index_path)
+    finally:
+        index_tmp.unlink(missing_ok=True)
+
+    target = folder / f"{name}{DOCSTORE_SUFFIX}"
+    tmp = target.with_name(target.name + suffix)
+    tmp.unlink(missing_ok=True)
+    conn = sqlite3.connect(str(tmp))
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("CREATE TABLE docs (id TEXT PRIMARY KEY, text TEXT NOT NULL, metadata TEXT NOT NULL)")
+        conn.execute("CREATE TABLE positions (pos INTEGER PRIMARY KEY, id TEXT NOT NULL)")
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+        def rows() -> Iterable[tuple]:
+            for cid in vs.index_to_docstore_id.values():
+                doc = vs.docstore.search(cid)
+                if isinstance(doc, Document):
+                    yield cid, doc.page_content, json.dumps(doc.metadata or {}, ensure_ascii=False, default=str)
+
+        conn.executemany("INSERT INTO docs(id, text, metadata) VALUES (?,?,?)", rows())
+        conn.executemany("INSERT INTO positions(pos, id) VALUES (?,?)", vs.index_to_docstore_id.items())
+        conn.executemany(
+            "INSERT INTO meta(key, value) VALUES (?,?)",
+            [
+                ("distance_strategy", str(getattr(vs.distance_strategy, "value", vs.distance_strategy))),
+                ("normalize_L2", json.dumps(bool(getattr(vs, "_normalize_L2", False)))),
+            ],
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp, target)
+
+
+def load_mmap_store(folder: Path, name: str, embeddings, mmap: bool = True) -> FAISS:
+    """
+    Open a store written by save_mmap_store(). With mmap the vectors stay in
+    the OS page cache (shared by every worker) instead of being read into RAM:
+    IO_FLAG_MMAP_IFC maps the codes of flat / HNSW / SQ indexes and IO_FLAG_MMAP
+    the inverted lists of IVF ones (IO_FLAG_MMAP alone still reads flat codes
+    into memory). Mapped codes are read-only and faiss aborts the process on an
+    add or remove, so pass mmap=False for a store that will be modified.
+    """
+    folder = Path(folder)
+    flags = faiss.IO_FLAG_MMAP | MMAP_IFC | faiss.IO_FLAG_READ_ONLY if mmap else 0
+    index = faiss.read_index(str(folder / f"{name}.faiss"), flags)
+    docstore = SQLiteDocstore(folder / f"{name}{DOCSTORE_SUFFIX}")
+    meta = docstore.meta()
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=docstore.positions(),
+        normalize_L2=json.loads(meta.get("normalize_L2", "false")),
+        distance_strategy=DistanceStrategy(meta.get("distance_strategy", DistanceStrategy.EUCLIDEAN_DISTANCE.value)),
+    )
@@ -0,0 +1,71 @@
+from __future__ import annotations
+import os
+import json
+import time
+import zlib
+import hashlib
+import threading
+from typing import Any, Optional
+
+from utils.config_loader import load_config
+from utils.sqlite_cache import SQLiteLRUCache
+
+
+class ArtifactCache(SQLiteLRUCache):
+    """
+    On-disk LRU cache of parse/split artifacts (extracted page texts, chunks).
+
+    Entries are keyed by (kind, file sha256, extractor version, params...) and stored
+    as zlib-compressed JSON in SQLite; once the stored bytes exceed max_bytes the
+    least recently used entries are dropped.
+    """
+
+    NAME = "Artifact cache"
+    TABLE = "artifacts"
+    COLUMNS = "kind TEXT NOT NULL, payload BLOB NOT NULL"
+    ACCESS_INDEX = "ix_art_access"
+
+    def __init__(self, path: str = "cache/artifacts.sqlite", max_bytes: int = 2 * 1024 * 1024 * 1024):
+        super().__init__(path, max_bytes)
+
+    @staticmethod
+    def make_key(kind: str, *parts: Any) -> str:
+        return hashlib.sha256("|".join([kind, *map(str, parts)]).encode("utf-8")).hexdigest()
+
+    def get(self, kind: str, *parts: Any) -> Optional[Any]:
+        key = self.make_key(kind, *parts)
+        with self._lock:
+            row = self._conn.execute("SELECT payload FROM artifacts WHERE key=?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._touch([key])
+            self.hits += 1
+        return json.loads(zlib.decompress(row[0]).decode("utf-8"))
+
+    def put(self, kind: str, value: Any, *parts: Any):
+        key = self.make_key(kind, *parts)
+        payload = zlib.compress(json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8"), 6)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO artifacts(key, kind, payload, size, last_access) VALUES (?,?,?,?,?)",
+                (key, kind, payload, len(payload), time.time()),
+            )
+            self._conn.commit()
+            self._written(len(payload))
+
+
+_cache: Optional[ArtifactCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_artifact_cache() -> ArtifactCache:
+    """Return the process-wide ArtifactCache, configured from config['artifact_cache']."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                cfg = load_config().get("artifact_cache", {}) or {}
+                path = os.getenv("ARTIFACT_CACHE_PATH", cfg.get("path", "cache/artifacts.sqlite"))
+                _cache = ArtifactCache(path=path, max_bytes=int(cfg.get("max_mb", 2048)) * 1024 * 1024)
+    return _cache
@@ -0,0 +1,212 @@
+from __future__ import annotations
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Any, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: thread lock only
+    fcntl = None
+
+from logger.custom_logger import CustomLogger
+from exception.custom_exception import DocumentPortalException
+from utils.file_io import StreamedFile, stream_to_file
+
+log = CustomLogger().get_logger(__name__)
+
+
+class BlobStore:
+    """
+    Content-addressed upload store shared by the analysis, compare and chat paths.
+
+    Each distinct file is stored once as <root>/<sha[:2]>/<sha><ext> and linked
+    (hardlink, else symlink, else copy) into the session directories that use it.
+    References are counted per owner (a session directory); a blob is deleted when
+    its last owner releases it. Storing, linking and referencing a blob is one step
+    under a thread lock plus a file lock on refs.lock, so a concurrent release()
+    in any worker process cannot delete the blob in between.
+
+    Links and references live as long as their session: expire_sessions() releases
+    every owner whose last upload is older than the session TTL (links removed,
+    the session directory too once empty).
+    """
+
+    def __init__(self, root: str = "data/blobs"):
+        try:
+            self.root = Path(root)
+            self.tmp_dir = self.root / "tmp"
+            self.tmp_dir.mkdir(parents=True, exist_ok=True)
+            self._lock = threading.Lock()
+            self._lock_path = self.root / "refs.lock"
+            self._conn = sqlite3.connect(str(self.root / "refs.sqlite"), check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS refs (
+                       sha256 TEXT NOT NULL,
+                       ext TEXT NOT NULL,
+                       owner TEXT NOT NULL,
+                       PRIMARY KEY (sha256, owner)
+                   )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_refs_owner ON refs(owner)")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS links (
+                       path TEXT PRIMARY KEY,
+                       owner TEXT NOT NULL,
+                       used REAL NOT NULL
+                   )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_links_owner ON links(owner)")
+            self._conn.commit()
+        except Exception as e:
+            log.error("Failed to open blob store", error=str(e), root=str(root))
+            raise DocumentPortalException("Blob store initialization error", e) from e
+
+    def blob_path(self, sha256: str, ext: str) -> Path:
+        return self.root / sha256[:2] / f"{sha256}{ext}"
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self._lock_path, "a+b") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def save(
+        self,
+        uf,
+        dest: Path,
+        owner: str,
+        keep_in_memory: int = 0,
+        ext: Optional[str] = None,
+        name_for: Optional[Callable[[str], str]] = None,
+    ) -> StreamedFile:
+        """
+        Stream an upload into the store (a blob that already exists is not written
+        again), expose it at dest inside owner's directory and take a reference for
+        owner. With name_for, dest is a directory and the file is named
+        name_for(sha256) (for names that depend on the content).
+        """
+        ext = ext or dest.suffix.lower()
+        tmp = self.tmp_dir / f"{uuid.uuid4().hex}{ext}"
+        streamed = stream_to_file(uf, tmp, keep_in_memory=keep_in_memory)
+        if name_for is not None:
+            dest = dest / name_for(streamed.sha256)
+        source = self.blob_path(streamed.sha256, ext)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            with self._locked():
+                if source.exists():
+                    log.info("Upload deduplicated", sha256=streamed.sha256, bytes=streamed.size)
+                else:
+                    source.parent.mkdir(parents=True, exist_ok=True)
+                    os.replace(tmp, source)
+                if dest.exists() or dest.is_symlink():
+                    dest.unlink()
+                try:
+                    os.link(source, dest)
+                except OSError:
+                    try:
+                        os.symlink(source.resolve(), dest)
+                    except OSError:
+                        shutil.copyfile(source, dest)
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO refs(sha256, ext, owner) VALUES (?,?,?)",
+                    (streamed.sha256, ext, owner),
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO links(path, owner, used) VALUES (?,?,?)",
+                    (str(dest), owner, time.time()),
+                )
+                self._conn.commit()
+        finally:
+            tmp.unlink(missing_ok=True)
+        return streamed._replace(path=dest)
+
+    def release(self, owner: str) -> int:
+        """
+        Remove owner's links (and its directory, once empty), drop its references
+        and delete blobs nobody references any more.
+        """
+        return self._release(owner)
+
+    def _release(self, owner: str, idle_before: Optional[float] = None) -> int:
+        with self._locked():
+            if idle_before is not None:
+                # re-checked under the lock: the session may have uploaded again since it was picked
+                last = self._conn.execute("SELECT MAX(used) FROM links WHERE owner=?", (owner,)).fetchone()[0]
+                if last is not None and last >= idle_before:
+                    return 0
+            links = [p for (p,) in self._conn.execute("SELECT path FROM links WHERE owner=?", (owner,))]
+            for path in links:
+                Path(path).unlink(missing_ok=True)
+            self._conn.execute("DELETE FROM links WHERE owner=?", (owner,))
+            rows = self._conn.execute("SELECT sha256, ext FROM refs WHERE owner=?", (owner,)).fetchall()
+            self._conn.execute("DELETE FROM refs WHERE owner=?", (owner,))
+            removed = self._delete_unreferenced(rows)
+        try:
+            os.rmdir(owner)  # only succeeds when nothing else lives there (e.g. not a shared upload dir)
+        except OSError:
+            pass
+        if rows:
+            log.info("Blob references released", owner=owner, refs=len(rows), blobs_deleted=removed)
+        return removed
+
+    def expire_sessions(self, max_age_seconds: float) -> int:
+        """Release every owner whose most recent upload is older than max_age_seconds; returns how many."""
+        cutoff = time.time() - max_age_seconds
+        with self._locked():
+            owners = [
+                o for (o,) in self._conn.execute(
+                    "SELECT owner FROM links GROUP BY owner HAVING MAX(used) < ?", (cutoff,)
+                )
+            ]
+        for owner in owners:
+            self._release(owner, idle_before=cutoff)
+        if owners:
+            log.info("Expired upload sessions released", sessions=len(owners), max_age_seconds=max_age_seconds)
+        return len(owners)
+
+    def _delete_unreferenced(self, rows: List[Tuple[str, str]]) -> int:
+        removed = 0
+        for sha, ext in rows:
+            left = self._conn.execute("SELECT COUNT(*) FROM refs WHERE sha256=?", (sha,)).fetchone()[0]
+            if left == 0:
+                self.blob_path(sha, ext).unlink(missing_ok=True)
+                removed += 1
+        self._conn.commit()
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            blobs, refs = self._conn.execute(
+                "SELECT COUNT(DISTINCT sha256), COUNT(*) FROM refs"
+            ).fetchone()
+            sessions = self._conn.execute("SELECT COUNT(DISTINCT owner) FROM links").fetchone()[0]
+        return {"root": str(self.root), "blobs": blobs, "refs": refs, "sessions": sessions}
+
+
+_store: Optional[BlobStore] = None
+_store_lock = threading.Lock()
+
+
+def get_blob_store() -> BlobStore:
+    """Return the process-wide BlobStore (root from BLOB_STORE_PATH, default data/blobs)."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = BlobStore(os.getenv("BLOB_STORE_PATH", os.path.join("data", "blobs")))
+    return _store
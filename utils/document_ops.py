@@ -12,10 +12,12 @@ from typing import Iterable, List, Optional, Dict, Any
 import fitz  # PyMuPDF
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, TextLoader
 from langchain_community.vectorstores import FAISS
 
 from utils.model_loader import ModelLoader
+from utils.file_io import file_sha256
+from utils.artifact_cache import get_artifact_cache
+from utils.extractors import extract, extractor_signature
 from logger.custom_logger import CustomLogger
 from exception.custom_exception import DocumentPortalException
 
@@ -24,22 +26,53 @@ log = CustomLogger().get_logger(__name__)
 SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".txt"}
 SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".txt"}
 
+def documents_to_records(docs: List[Document]) -> List[Dict[str, Any]]:
+    return [{"page_content": d.page_content, "metadata": d.metadata} for d in docs]
+
+def documents_from_records(records: List[Dict[str, Any]], path: Optional[Path] = None) -> List[Document]:
+    """Rebuild Documents from cached records, pointing source metadata at this copy of the file."""
+    docs = []
+    for r in records:
+        md = dict(r.get("metadata") or {})
+        if path is not None:
+            for key in ("source", "file_path"):
+                if key in md:
+                    md[key] = str(path)
+        docs.append(Document(page_content=r["page_content"], metadata=md))
+    return docs
+
+def extract_documents(path: str, data: Optional[bytes] = None, sha256: Optional[str] = None) -> List[Document]:
+    """
+    Page-level Documents for any supported file, via the configured extractor
+    backends (utils/extractors.py), served from the artifact cache when this
+    exact content was extracted before. data: in-memory copy of the file, if any.
+    """
+    sha256 = sha256 or file_sha256(Path(path))
+    signature = extractor_signature(Path(path).suffix)
+    cache = get_artifact_cache()
+    cached = cache.get("documents", sha256, signature)
+    if cached is not None:
+        log.info("Extraction served from cache", path=str(path), pages=len(cached))
+        return documents_from_records(cached, Path(path))
+
+    docs = extract(str(path), data)
+    cache.put("documents", documents_to_records(docs), sha256, signature)
+    return docs
+
+def extract_pdf_pages(pdf_path: str, data: Optional[bytes] = None, sha256: Optional[str] = None) -> List[str]:
+    """Page texts of a PDF (see extract_documents)."""
+    return [d.page_content for d in extract_documents(pdf_path, data, sha256)]
+
 def load_documents(paths: Iterable[Path]) -> List[Document]:
-    """Load docs using appropriate loader based on extension."""
+    """Load page-level docs with the extractor configured for each extension."""
     docs: List[Document] = []
     try:
         for p in paths:
             ext = p.suffix.lower()
-            if ext == ".pdf":
-                loader = PyPDFLoader(str(p))
-            elif ext == ".docx":
-                loader = Docx2txtLoader(str(p))
-            elif ext == ".txt":
-                loader = TextLoader(str(p), encoding="utf-8")
-            else:
+            if ext not in SUPPORTED_EXTENSIONS:
                 log.warning("Unsupported extension skipped", path=str(p))
                 continue
-            docs.extend(loader.load())
+            docs.extend(extract_documents(str(p)))
         log.info("Documents loaded", count=len(docs))
         return docs
     except Exception as e:
@@ -0,0 +1,127 @@
+from __future__ import annotations
+import os
+import time
+import hashlib
+from array import array
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from utils.sqlite_cache import SQLiteLRUCache
+from logger.custom_logger import CustomLogger
+
+log = CustomLogger().get_logger(__name__)
+
+
+class EmbeddingCache(SQLiteLRUCache):
+    """
+    Persistent, content-addressed store of embedding vectors (SQLite).
+
+    Key = sha256(model name + kind + text), so the same chunk embedded by any
+    session (or any process sharing the file) is only sent to the provider once.
+    When the stored vectors exceed max_bytes the least recently used rows are dropped.
+    """
+
+    NAME = "Embedding cache"
+    TABLE = "embeddings"
+    COLUMNS = "model TEXT NOT NULL, vector BLOB NOT NULL"
+    ACCESS_INDEX = "ix_emb_access"
+    COUNT_LABEL = "rows"
+
+    def __init__(self, path: str = "cache/embeddings.sqlite", max_bytes: int = 1024 * 1024 * 1024):
+        super().__init__(path, max_bytes)
+
+    @staticmethod
+    def make_key(model: str, text: str, kind: str = "document") -> str:
+        h = hashlib.sha256()
+        h.update(model.encode("utf-8"))
+        h.update(b"\0" + kind.encode("utf-8") + b"\0")
+        h.update(text.encode("utf-8"))
+        return h.hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        if not keys:
+            return found
+        with self._lock:
+            if self._closed:
+                self.misses += len(set(keys))
+                return found
+            # SQLite caps bound parameters, so look up in slices
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", part
+                ).fetchall()
+                for key, blob in rows:
+                    vec = array("f")
+                    vec.frombytes(blob)
+                    found[key] = vec.tolist()
+                if rows:
+                    self._touch(k for k, _ in rows)
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+        return found
+
+    def put_many(self, model: str, items: Dict[str, List[float]]):
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        for key, vec in items.items():
+            blob = array("f", vec).tobytes()
+            rows.append((key, model, blob, len(blob), now))
+        with self._lock:
+            if self._closed:
+                return
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings(key, model, vector, size, last_access) VALUES (?,?,?,?,?)",
+                rows,
+            )
+            self._conn.commit()
+            self._written(sum(r[3] for r in rows))
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that consults an EmbeddingCache before calling the
+    underlying provider; only cache misses (deduplicated) are sent upstream.
+    """
+
+    def __init__(self, underlying: Embeddings, cache: EmbeddingCache, model_name: str):
+        self.underlying = underlying
+        self.cache = cache
+        self.model_name = model_name
+
+    def _embed(self, texts: List[str], kind: str, embed_fn) -> List[List[float]]:
+        keys = [EmbeddingCache.make_key(self.model_name, t, kind) for t in texts]
+        found = self.cache.get_many(keys)
+
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = embed_fn(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(self.model_name, fresh)
+            found.update(fresh)
+            log.info("Embeddings computed", requested=len(texts), embedded=len(missing), kind=kind)
+        return [found[k] for k in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts, "document", self.underlying.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        # Queries use a different task type upstream, so they are cached under their own kind
+        return self._embed([text], "query", lambda ts: [self.underlying.embed_query(ts[0])])[0]
+
+
+def build_embedding_cache(config: dict) -> Optional[EmbeddingCache]:
+    """Create the EmbeddingCache described by config['embedding_cache'] (None if disabled)."""
+    cfg = config.get("embedding_cache", {}) or {}
+    if not cfg.get("enabled", True):
+        return None
+    path = os.getenv("EMBEDDING_CACHE_PATH", cfg.get("path", "cache/embeddings.sqlite"))
+    return EmbeddingCache(path=path, max_bytes=int(cfg.get("max_mb", 1024)) * 1024 * 1024)
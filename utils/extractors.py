@@ -0,0 +1,169 @@
+from __future__ import annotations
+import importlib.metadata
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Type
+
+from langchain_core.documents import Document
+
+from utils.config_loader import load_config
+from utils.pdf_extraction import extract_pages
+from logger.custom_logger import CustomLogger
+
+log = CustomLogger().get_logger(__name__)
+
+
+def _pkg_version(name: str) -> str:
+    try:
+        return importlib.metadata.version(name)
+    except importlib.metadata.PackageNotFoundError:
+        return "0"
+
+
+class BaseExtractor:
+    """
+    One text-extraction backend. extract() returns page-level Documents with the
+    same metadata keys whatever the backend: source, page (0-based), total_pages, extractor.
+    """
+    name: str = ""
+    package: str = ""
+    revision: int = 1  # bump when this backend's output changes (invalidates cached artifacts)
+
+    @property
+    def version(self) -> str:
+        return f"{self.name}-{_pkg_version(self.package)}/{self.revision}"
+
+    def pages(self, path: str, data: Optional[bytes] = None) -> List[str]:
+        raise NotImplementedError
+
+    def extract(self, path: str, data: Optional[bytes] = None) -> List[Document]:
+        pages = self.pages(path, data)
+        return [
+            Document(
+                page_content=text,
+                metadata={"source": str(path), "page": i, "total_pages": len(pages), "extractor": self.name},
+            )
+            for i, text in enumerate(pages)
+        ]
+
+
+EXTRACTORS: Dict[str, Type[BaseExtractor]] = {}
+
+
+def register_extractor(cls: Type[BaseExtractor]) -> Type[BaseExtractor]:
+    EXTRACTORS[cls.name] = cls
+    return cls
+
+
+@register_extractor
+class PyMuPDFExtractor(BaseExtractor):
+    name = "pymupdf"
+    package = "PyMuPDF"
+
+    def pages(self, path: str, data: Optional[bytes] = None) -> List[str]:
+        return extract_pages(path, data)  # parallel page ranges for large files
+
+
+@register_extractor
+class PyPDFExtractor(BaseExtractor):
+    name = "pypdf"
+    package = "pypdf"
+
+    def pages(self, path: str, data: Optional[bytes] = None) -> List[str]:
+        import io
+        from pypdf import PdfReader
+
+        reader = PdfReader(io.BytesIO(data) if data is not None else path)
+        if reader.is_encrypted:
+            raise ValueError(f"PDF is encrypted: {Path(path).name}")
+        return [page.extract_text() or "" for page in reader.pages]
+
+
+@register_extractor
+class TextExtractor(BaseExtractor):
+    """Reads .txt incrementally and emits ~page_chars pseudo-pages (cut on line boundaries)."""
+    name = "text"
+    package = "langchain-core"
+
+    def __init__(self, page_chars: int = 4000):
+        self.page_chars = page_chars
+
+    def _iter_pages(self, path: str, data: Optional[bytes]) -> Iterator[str]:
+        lines = (data.decode("utf-8", errors="replace").splitlines(keepends=True)
+                 if data is not None else open(path, "r", encoding="utf-8", errors="replace"))
+        try:
+            buf: List[str] = []
+            size = 0
+            for line in lines:
+                buf.append(line)
+                size += len(line)
+                if size >= self.page_chars:
+                    yield "".join(buf)
+                    buf, size = [], 0
+            if buf:
+                yield "".join(buf)
+        finally:
+            if hasattr(lines, "close"):
+                lines.close()
+
+    def pages(self, path: str, data: Optional[bytes] = None) -> List[str]:
+        return list(self._iter_pages(path, data))
+
+
+@register_extractor
+class DocxExtractor(BaseExtractor):
+    name = "docx2txt"
+    package = "docx2txt"
+
+    def pages(self, path: str, data: Optional[bytes] = None) -> List[str]:
+        import io
+        import docx2txt
+
+        # .docx has no stored pagination: the whole body is one page
+        return [docx2txt.process(io.BytesIO(data) if data is not None else path)]
+
+
+DEFAULT_CHAINS: Dict[str, List[str]] = {
+    ".pdf": ["pymupdf", "pypdf"],
+    ".docx": ["docx2txt"],
+    ".txt": ["text"],
+}
+
+_chains: Optional[Dict[str, List[str]]] = None
+_options: Dict[str, dict] = {}
+
+
+def _load_chains() -> Dict[str, List[str]]:
+    global _chains
+    if _chains is None:
+        cfg = load_config().get("extractors", {}) or {}
+        chains = dict(DEFAULT_CHAINS)
+        chains.update({ext: list(names) for ext, names in (cfg.get("backends") or {}).items()})
+        _options["text"] = {"page_chars": int(cfg.get("text_page_chars", 4000))}
+        _chains = chains
+    return _chains
+
+
+def extractor_chain(ext: str) -> List[BaseExtractor]:
+    """Configured backends for an extension, preferred first (fallbacks after)."""
+    names = _load_chains().get(ext.lower(), [])
+    return [EXTRACTORS[n](**_options.get(n, {})) for n in names if n in EXTRACTORS]
+
+
+def extractor_signature(ext: str) -> str:
+    """Versions of the backends that may produce an extension's text (part of artifact cache keys)."""
+    return ",".join(e.version for e in extractor_chain(ext))
+
+
+def extract(path: str, data: Optional[bytes] = None) -> List[Document]:
+    """Extract page-level Documents with the first backend of the chain that succeeds."""
+    chain = extractor_chain(Path(path).suffix)
+    if not chain:
+        raise ValueError(f"No extractor configured for: {Path(path).suffix}")
+    error: Optional[Exception] = None
+    for extractor in chain:
+        try:
+            return extractor.extract(path, data)
+        except Exception as e:
+            error = e
+            log.warning("Extractor failed, trying next", extractor=extractor.name, path=str(path), error=str(e))
+    raise error  # type: ignore[misc]
@@ -1,11 +1,13 @@
 from __future__ import annotations
+import os
 import re
+import hashlib
 import uuid
 from pathlib import Path
 from datetime import datetime
 from zoneinfo import ZoneInfo
 import uuid
-from typing import Iterable, List
+from typing import Iterable, Iterator, List, NamedTuple, Optional
 #from logger import GLOBAL_LOGGER as log
 from logger.custom_logger import CustomLogger
 from exception.custom_exception import DocumentPortalException
@@ -13,6 +15,40 @@ from exception.custom_exception import DocumentPortalException
 log = CustomLogger().get_logger(__name__)
 SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".txt"}
 
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(200 * 1024 * 1024)))
+# uploads up to this size are also kept in memory so parsers can skip re-reading the file
+UPLOAD_MEMORY_BYTES = int(os.getenv("UPLOAD_MEMORY_BYTES", str(16 * 1024 * 1024)))
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+class StreamedFile(NamedTuple):
+    path: Path
+    sha256: str
+    size: int
+    data: Optional[bytes] = None  # only set when size <= keep_in_memory
+
+
+def iter_upload_chunks(uf, chunk_size: int = UPLOAD_CHUNK_BYTES) -> Iterator[bytes]:
+    """
+    Yield an uploaded file's content in fixed-size chunks, whatever its API:
+    .iter_chunks() (FastAPI adapter), .read(n) (file-like / Streamlit) or .getbuffer().
+    """
+    if hasattr(uf, "iter_chunks"):
+        yield from uf.iter_chunks(chunk_size)
+    elif hasattr(uf, "read"):
+        if hasattr(uf, "seek"):
+            uf.seek(0)
+        for block in iter(lambda: uf.read(chunk_size), b""):
+            yield block
+    else:
+        view = memoryview(uf.getbuffer())
+        for i in range(0, len(view), chunk_size):
+            yield bytes(view[i:i + chunk_size])
+
 # ----------------------------- #
 # Helpers (file I/O + loading)  #
 # ----------------------------- #
@@ -20,30 +56,83 @@ def generate_session_id(prefix: str = "session") -> str:
     ist = ZoneInfo("Asia/Kolkata")
     return f"{prefix}_{datetime.now(ist).strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
 
+def file_sha256(path: Path, block_size: int = 1024 * 1024) -> str:
+    """sha256 of a file on disk, read in fixed-size blocks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def stream_to_file(
+    uf,
+    dest: Path,
+    *,
+    chunk_size: int = UPLOAD_CHUNK_BYTES,
+    max_bytes: Optional[int] = UPLOAD_MAX_BYTES,
+    keep_in_memory: int = 0,
+) -> StreamedFile:
+    """
+    Copy an upload to dest in bounded chunks, hashing and counting as it goes.
+    Aborts as soon as max_bytes is exceeded (nothing is left behind), and returns
+    the bytes too when the whole file fits in keep_in_memory.
+    """
+    declared = getattr(uf, "size", None)
+    if max_bytes is not None and declared is not None and declared > max_bytes:
+        raise UploadTooLarge(f"File exceeds {max_bytes} bytes")
+
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_name(dest.name + ".part")
+    h = hashlib.sha256()
+    size = 0
+    held: Optional[List[bytes]] = [] if keep_in_memory > 0 else None
+    try:
+        with open(tmp, "wb") as f:
+            for block in iter_upload_chunks(uf, chunk_size):
+                size += len(block)
+                if max_bytes is not None and size > max_bytes:
+                    raise UploadTooLarge(f"File exceeds {max_bytes} bytes")
+                h.update(block)
+                f.write(block)
+                if held is not None:
+                    held.append(block)
+                    if size > keep_in_memory:
+                        held = None  # spilled: disk copy only
+        os.replace(tmp, dest)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return StreamedFile(dest, h.hexdigest(), size, b"".join(held) if held is not None else None)
+
+def save_uploaded_file(uf, target_dir: Path) -> Optional[StreamedFile]:
+    """
+    Stream one upload into the shared blob store and link it into target_dir
+    under its content hash; None if the type is unsupported.
+    """
+    from utils.blob_store import get_blob_store  # blob_store builds on this module
+
+    name = getattr(uf, "name", "file")
+    ext = Path(name).suffix.lower()
+    if ext not in SUPPORTED_EXTENSIONS:
+        log.warning("Unsupported file skipped", filename=name)
+        return None
+    saved = get_blob_store().save(
+        uf, target_dir, owner=str(target_dir), ext=ext, name_for=lambda sha: f"{sha[:16]}{ext}"
+    )
+    log.info("File saved for ingestion", uploaded=name, saved_as=str(saved.path), bytes=saved.size, sha256=saved.sha256)
+    return saved
+
 def save_uploaded_files(uploaded_files: Iterable, target_dir: Path) -> List[Path]:
     """Save uploaded files (Streamlit-like) and return local paths."""
     try:
-        target_dir.mkdir(parents=True, exist_ok=True)
         saved: List[Path] = []
         for uf in uploaded_files:
-            name = getattr(uf, "name", "file")
-            ext = Path(name).suffix.lower()
-            if ext not in SUPPORTED_EXTENSIONS:
-                log.warning("Unsupported file skipped", filename=name)
-                continue
-            # Clean file name (only alphanum, dash, underscore)
-            safe_name = re.sub(r'[^a-zA-Z0-9_\-]', '_', Path(name).stem).lower()
-            fname = f"{safe_name}_{uuid.uuid4().hex[:6]}{ext}"
-            fname = f"{uuid.uuid4().hex[:8]}{ext}"
-            out = target_dir / fname
-            with open(out, "wb") as f:
-                if hasattr(uf, "read"):
-                    f.write(uf.read())
-                else:
-                    f.write(uf.getbuffer())  # fallback
-            saved.append(out)
-            log.info("File saved for ingestion", uploaded=name, saved_as=str(out))
+            result = save_uploaded_file(uf, target_dir)
+            if result is not None:
+                saved.append(result.path)
         return saved
+    except UploadTooLarge:
+        raise
     except Exception as e:
         log.error("Failed to save uploaded files", error=str(e), dir=str(target_dir))
         raise DocumentPortalException("Failed to save uploaded files", e) from e
\ No newline at end of file
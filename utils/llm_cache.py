@@ -0,0 +1,122 @@
+from __future__ import annotations
+import os
+import time
+import zlib
+import hashlib
+from typing import Any, Dict, Optional, Sequence
+
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.load import dumps, loads
+
+from utils.sqlite_cache import SQLiteLRUCache
+from logger.custom_logger import CustomLogger
+
+log = CustomLogger().get_logger(__name__)
+
+
+class LLMResponseCache(SQLiteLRUCache, BaseCache):
+    """
+    Disk-backed cache of LLM generations for deterministic (temperature 0) calls.
+
+    LangChain hands every lookup the rendered prompt (template + inputs, serialized)
+    and the model's identifying string (provider class, model, temperature, ...);
+    entries are keyed by the sha256 of each, stored zlib-compressed in SQLite,
+    expire after ttl_seconds and are LRU-evicted beyond max_bytes.
+
+    Attach it to a chat model (`llm.model_copy(update={"cache": cache})`, see
+    ModelRegistry.get_llm(cached=True)) and every LCEL chain built on that model
+    is cached, including fixing-parser retries.
+    """
+
+    NAME = "LLM response cache"
+    TABLE = "responses"
+    COLUMNS = "llm TEXT NOT NULL, payload BLOB NOT NULL, created REAL NOT NULL"
+    ACCESS_INDEX = "ix_resp_access"
+
+    def __init__(
+        self,
+        path: str = "cache/llm_responses.sqlite",
+        ttl_seconds: int = 7 * 24 * 3600,
+        max_bytes: int = 256 * 1024 * 1024,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.expired = 0
+        super().__init__(path, max_bytes)
+
+    @staticmethod
+    def make_key(prompt: str, llm_string: str) -> str:
+        llm_hash = hashlib.sha256(llm_string.encode("utf-8")).hexdigest()
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        return f"{llm_hash}:{prompt_hash}"
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = self.make_key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            if self._closed:
+                self.misses += 1
+                return None
+            row = self._conn.execute("SELECT payload, created FROM responses WHERE key=?", (key,)).fetchone()
+            if row is not None and self.ttl_seconds > 0 and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key=?", (key,))
+                self._conn.commit()
+                self.expired += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._touch([key])
+            self.hits += 1
+        try:
+            return loads(zlib.decompress(row[0]).decode("utf-8"))
+        except Exception as e:
+            # written by an incompatible langchain version: treat as a miss
+            log.warning("Unreadable LLM cache entry", error=str(e))
+            return None
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Any]) -> None:
+        key = self.make_key(prompt, llm_string)
+        payload = zlib.compress(dumps(list(return_val)).encode("utf-8"), 6)
+        now = time.time()
+        with self._lock:
+            if self._closed:
+                return
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses(key, llm, payload, size, created, last_access) VALUES (?,?,?,?,?,?)",
+                (key, key.split(":", 1)[0], payload, len(payload), now, now),
+            )
+            self._conn.commit()
+            self._written(len(payload))
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._touched.clear()
+            self._bytes = 0
+
+    def _purge(self):
+        if self.ttl_seconds > 0:
+            cur = self._conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl_seconds,))
+            self._conn.commit()
+            self.expired += cur.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats.update(ttl_seconds=self.ttl_seconds, expired=self.expired)
+        return stats
+
+
+def build_llm_response_cache(config: dict) -> Optional[LLMResponseCache]:
+    """Build the LLM response cache from config['llm_cache'] (None when disabled)."""
+    cfg = config.get("llm_cache", {}) or {}
+    if not cfg.get("enabled", True):
+        return None
+    path = os.getenv("LLM_CACHE_PATH", cfg.get("path", "cache/llm_responses.sqlite"))
+    return LLMResponseCache(
+        path=path,
+        ttl_seconds=int(cfg.get("ttl_seconds", 7 * 24 * 3600)),
+        max_bytes=int(cfg.get("max_mb", 256)) * 1024 * 1024,
+    )
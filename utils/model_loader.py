@@ -1,8 +1,13 @@
 
 import os
 import sys
+import threading
+from typing import Any, Dict, Optional, Tuple
 from dotenv import load_dotenv
 from utils.config_loader import load_config
+from utils.embedding_cache import CachedEmbeddings, build_embedding_cache
+from utils.llm_cache import build_llm_response_cache
+from utils.rate_limiter import build_rate_limits
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_groq import ChatGroq
@@ -50,34 +55,41 @@ class ModelLoader:
             log.error("Error loading embedding model", error=str(e))
             raise DocumentPortalException("Failed to load embedding model", sys)
         
-    def load_llm(self):
+    def llm_config(self, provider_key: Optional[str] = None) -> Dict[str, Any]:
         """
-        Load and return the LLM model.
-        Load LLM dynamically based on provider in config.
+        Return the config block of the LLM selected by provider_key
+        (defaults to the LLM_PROVIDER env var, then "google").
         """
-        
         llm_block = self.config["llm"]
-
-        log.info("Loading LLM...")
-        
-        provider_key = os.getenv("LLM_PROVIDER", "google")  
+        provider_key = provider_key or os.getenv("LLM_PROVIDER", "google")
         if provider_key not in llm_block:
             log.error("LLM provider not found in config", provider_key=provider_key)
             raise ValueError(f"Provider '{provider_key}' not found in config")
+        return llm_block[provider_key]
 
-        llm_config = llm_block[provider_key]
+    def load_llm(self, provider_key: Optional[str] = None, max_retries: Optional[int] = None):
+        """
+        Load and return the LLM model.
+        Load LLM dynamically based on provider in config.
+        max_retries overrides the SDK's own retry count (left to the SDK when None).
+        """
+        log.info("Loading LLM...")
+
+        llm_config = self.llm_config(provider_key)
         provider = llm_config.get("provider")
         model_name = llm_config.get("model_name")
         temperature = llm_config.get("temperature", 0.2)
         max_tokens = llm_config.get("max_output_tokens", 2048)
         
         log.info("Loading LLM", provider=provider, model=model_name, temperature=temperature, max_tokens=max_tokens)
+        extra = {} if max_retries is None else {"max_retries": max_retries}
 
         if provider == "google":
             llm=ChatGoogleGenerativeAI(
                 model=model_name,
                 temperature=temperature,
-                max_output_tokens=max_tokens
+                max_output_tokens=max_tokens,
+                **extra,
             )
             return llm
 
@@ -86,6 +98,7 @@ class ModelLoader:
                 model=model_name,
                 api_key=self.api_keys["GROQ_API_KEY"],
                 temperature=temperature,
+                **extra,
             )
             return llm
             
@@ -100,8 +113,151 @@ class ModelLoader:
             log.error("Unsupported LLM provider", provider=provider)
             raise ValueError(f"Unsupported LLM provider: {provider}")
         
-    
-    
+
+
+class ModelRegistry:
+    """
+    Process-wide, thread-safe registry of configured LLM and embedding clients.
+
+    Clients are built once per (kind, provider, model, params) key and shared by
+    every caller, so env validation, YAML parsing and client construction (and
+    the client's HTTP connection pool) are paid once per process, not per request.
+    """
+
+    def __init__(self, loader: Optional[ModelLoader] = None):
+        self._lock = threading.RLock()
+        self._clients: Dict[Tuple, Any] = {}
+        self.loader = loader or ModelLoader()
+        self.embedding_cache = build_embedding_cache(self.loader.config)
+        self.llm_cache = build_llm_response_cache(self.loader.config)
+        self.rate_limits = build_rate_limits(self.loader.config)
+
+    @property
+    def config(self) -> dict:
+        return self.loader.config
+
+    def _get_or_create(self, key: Tuple, factory):
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = factory()
+                self._clients[key] = client
+                log.info("Model client registered", key=[str(k) for k in key])
+            return client
+
+    def get_llm(self, provider_key: Optional[str] = None, cached: bool = False, priority: str = "interactive"):
+        """
+        Return the shared LLM client for provider_key (see ModelLoader.llm_config).
+
+        cached=True returns a copy of that client whose generations go through the
+        on-disk LLM response cache (for deterministic chains such as analyze/compare);
+        it shares the underlying HTTP client. Falls back to the plain client when
+        the cache is disabled.
+
+        When the model has rate limits configured, calls are admitted by the shared
+        limiter at `priority` ("interactive" for chat, "batch" for background work)
+        and rate-limit errors are retried with jittered exponential backoff.
+        """
+        cfg = self.loader.llm_config(provider_key)
+        model_name = cfg.get("model_name")
+        key = (
+            "llm",
+            cfg.get("provider"),
+            model_name,
+            cfg.get("temperature", 0.2),
+            cfg.get("max_output_tokens", 2048),
+        )
+        limits = self.rate_limits
+        max_retries = limits.client_max_retries if limits and limits.limiter(model_name) else None
+        llm = self._get_or_create(key, lambda: self.loader.load_llm(provider_key, max_retries=max_retries))
+        if cached and self.llm_cache is not None:
+            key = key + ("cached",)
+            base = llm
+            llm = self._get_or_create(key, lambda: base.model_copy(update={"cache": self.llm_cache}))
+        if limits is None:
+            return llm
+
+        def factory():
+            limited, is_limited = limits.limit_llm(llm, model_name, priority)
+            return limits.with_retry(limited) if is_limited else limited
+
+        return self._get_or_create(key + ("limited", priority), factory)
+
+    def get_embeddings(self):
+        """
+        Return the shared embedding client, wrapped by the persistent
+        embedding cache when one is configured.
+        """
+        cfg = self.config["embedding_model"]
+        key = ("embeddings", cfg.get("provider"), cfg.get("model_name"))
+
+        def factory():
+            emb = self.loader.load_embeddings()
+            if self.rate_limits is not None:
+                emb = self.rate_limits.limit_embeddings(emb, cfg.get("model_name"))
+            if self.embedding_cache is None:
+                return emb
+            return CachedEmbeddings(emb, self.embedding_cache, model_name=cfg.get("model_name"))
+
+        return self._get_or_create(key, factory)
+
+    def warm_up(self):
+        """
+        Build the default clients and make one tiny call through each so the
+        first user request does not pay for connection setup / auth.
+        """
+        try:
+            self.get_embeddings().embed_query("warm-up")
+            self.get_llm().invoke("ping")
+            log.info("Model registry warmed up", clients=len(self._clients))
+        except Exception as e:
+            # A failed warm-up must not take the service down; clients are still usable
+            log.warning("Model warm-up failed", error=str(e))
+
+    def reload(self, warm_up: bool = False):
+        """Re-read env + config and drop all cached clients (e.g. after a key rotation)."""
+        with self._lock:
+            old_caches = (self.embedding_cache, self.llm_cache)
+            self.loader = ModelLoader()
+            self._clients.clear()
+            self.embedding_cache = build_embedding_cache(self.loader.config)
+            self.llm_cache = build_llm_response_cache(self.loader.config)
+            self.rate_limits = build_rate_limits(self.loader.config)
+        for cache in old_caches:
+            if cache is not None:
+                cache.close()
+        log.info("Model registry reloaded")
+        if warm_up:
+            self.warm_up()
+
+    def reload_in_background(self, warm_up: bool = False):
+        """reload() on a daemon thread, for signal handlers (which must not block); failures are logged."""
+        def run():
+            try:
+                self.reload(warm_up)
+            except Exception as e:
+                log.error("Model registry reload failed", error=str(e))
+
+        threading.Thread(target=run, name="model-registry-reload", daemon=True).start()
+
+
+_registry: Optional[ModelRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> ModelRegistry:
+    """Return the process-wide ModelRegistry, creating it on first use."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry()
+    return _registry
+
+
 if __name__ == "__main__":
     loader = ModelLoader()
     
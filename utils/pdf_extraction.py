@@ -0,0 +1,121 @@
+from __future__ import annotations
+import os
+import threading
+import multiprocessing
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional
+
+import fitz  # PyMuPDF
+
+# Kept free of app imports: this module is what spawned pool workers load.
+
+PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))
+PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "32"))
+WORKERS = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _extract_range(pdf_path: str, start: int, stop: int) -> List[str]:
+    """Worker: open the file independently and return the texts of pages [start, stop)."""
+    with fitz.open(pdf_path) as doc:
+        return [doc.load_page(i).get_text() for i in range(start, stop)]  # type: ignore
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn, not fork: the API process is multi-threaded
+                _pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def extract_pages(pdf_path: str, data: Optional[bytes] = None) -> List[str]:
+    """
+    Text of every page of a PDF, in order.
+
+    Large PDFs are split into page ranges that are extracted in parallel by a
+    process pool (workers open pdf_path themselves); small ones are read serially
+    in-process, from data (the upload's bytes, when still in memory) instead of
+    the file. Whether data is given never decides which path is taken.
+    """
+    on_disk = data is None or os.path.isfile(pdf_path)
+    with (fitz.open(pdf_path) if data is None else fitz.open(stream=data, filetype="pdf")) as doc:
+        if doc.is_encrypted:
+            raise ValueError(f"PDF is encrypted: {os.path.basename(pdf_path)}")
+        page_count = doc.page_count
+        if not on_disk or WORKERS <= 1 or page_count < PARALLEL_MIN_PAGES:
+            return [doc.load_page(i).get_text() for i in range(page_count)]  # type: ignore
+
+    ranges = [(s, min(s + PAGES_PER_TASK, page_count)) for s in range(0, page_count, PAGES_PER_TASK)]
+    pool = _get_pool()
+    futures = []
+    try:
+        futures = [pool.submit(_extract_range, str(pdf_path), s, e) for s, e in ranges]
+        pages: List[str] = []
+        for f in futures:  # submission order == page order
+            pages.extend(f.result())
+        return pages
+    except BrokenProcessPool:
+        # a worker died (e.g. killed): rebuild the pool next time, answer serially now
+        _discard_pool(pool)
+        return _extract_range(str(pdf_path), 0, page_count)
+    except CancelledError:
+        # the pool was shut down under us (app shutdown or another request found it broken)
+        return _extract_range(str(pdf_path), 0, page_count)
+    except BaseException:
+        # an error in this PDF (e.g. a corrupt page): drop the rest of its ranges, leave the pool alone
+        for f in futures:
+            f.cancel()
+        raise
+
+
+class LazyPdfPages:
+    """
+    Page texts of one PDF, extracted on first access. len() is the page count
+    from the document's page tree, so nothing is parsed until a page is read.
+    Not thread-safe: use from one thread at a time, then close().
+    """
+
+    def __init__(self, pdf_path: str, data: Optional[bytes] = None):
+        self._doc = fitz.open(stream=data, filetype="pdf") if data is not None else fitz.open(pdf_path)
+        if self._doc.is_encrypted:
+            self._doc.close()
+            raise ValueError(f"PDF is encrypted: {os.path.basename(pdf_path)}")
+        self._pages: Dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return self._doc.page_count
+
+    def __getitem__(self, i: int) -> str:
+        if i not in self._pages:
+            self._pages[i] = self._doc.load_page(i).get_text()  # type: ignore
+        return self._pages[i]
+
+    @property
+    def extracted(self) -> int:
+        return len(self._pages)
+
+    def close(self):
+        self._doc.close()
+
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    """Shut down a broken pool, unless another request has already replaced it."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
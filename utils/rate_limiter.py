@@ -0,0 +1,426 @@
+from __future__ import annotations
+import os
+import time
+import random
+import asyncio
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import Embeddings
+from langchain_core.rate_limiters import BaseRateLimiter
+from langchain_core.runnables.retry import RunnableRetry
+from tenacity import retry_if_exception
+
+from logger.custom_logger import CustomLogger
+from exception.custom_exception import DocumentPortalException
+
+log = CustomLogger().get_logger(__name__)
+
+PRIORITIES = ("interactive", "batch")
+
+# Longest single sleep while waiting, so cross-process refills and pauses are noticed
+_POLL_SECONDS = 0.25
+
+
+def is_retryable_error(exc: BaseException) -> bool:
+    """Rate-limit (429 / quota) or overload (503) errors, whatever the provider SDK raised."""
+    status = getattr(exc, "status_code", None) or getattr(exc, "code", None)
+    if status in (429, 503):
+        return True
+    if type(exc).__name__ in ("RateLimitError", "ResourceExhausted", "TooManyRequests", "ServiceUnavailable"):
+        return True
+    text = str(exc).lower()
+    return any(s in text for s in ("429", "resource_exhausted", "resource exhausted", "rate limit", "quota"))
+
+
+class _MemoryState:
+    """Bucket state of this process only."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows: Dict[str, Dict[str, float]] = {}
+
+    @contextmanager
+    def transaction(self, model: str) -> Iterator[Dict[str, float]]:
+        with self._lock:
+            yield self._rows.setdefault(model, {})
+
+
+class _SQLiteState:
+    """
+    Bucket state shared by every process using the same file: each update runs
+    in a BEGIN IMMEDIATE transaction, so workers draw from one budget.
+    """
+
+    def __init__(self, path: str):
+        try:
+            self.path = Path(path)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._lock = threading.Lock()
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS buckets (
+                       model TEXT PRIMARY KEY,
+                       requests REAL NOT NULL,
+                       tokens REAL NOT NULL,
+                       updated REAL NOT NULL,
+                       paused_until REAL NOT NULL,
+                       failures INTEGER NOT NULL
+                   )"""
+            )
+        except Exception as e:
+            log.error("Failed to open rate limit state", error=str(e), path=str(path))
+            raise DocumentPortalException("Rate limiter initialization error", e) from e
+
+    @contextmanager
+    def transaction(self, model: str) -> Iterator[Dict[str, float]]:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT requests, tokens, updated, paused_until, failures FROM buckets WHERE model=?", (model,)
+                ).fetchone()
+                state: Dict[str, float] = {}
+                if row is not None:
+                    state = dict(zip(("requests", "tokens", "updated", "paused_until", "failures"), row))
+                yield state
+                if state:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO buckets(model, requests, tokens, updated, paused_until, failures) "
+                        "VALUES (?,?,?,?,?,?)",
+                        (model, state["requests"], state["tokens"], state["updated"],
+                         state["paused_until"], int(state["failures"])),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+
+class ModelRateLimiter:
+    """
+    Token buckets for one model: requests per minute and tokens per minute.
+
+    - A call is admitted when a request is available and the token balance is
+      positive; tokens are charged afterwards with the provider-reported usage
+      (the balance may go negative and must refill before the next admission).
+    - "batch" callers (ingestion, background work) only draw on the part of each
+      bucket above batch_reserve and wait while interactive callers in this
+      process are waiting, so chat stays responsive during bulk jobs.
+    - A rate-limit error pauses the model for everyone, with jittered exponential
+      backoff on consecutive failures.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        rpm: float = 0,
+        tpm: float = 0,
+        batch_reserve: float = 0.2,
+        backoff_initial: float = 1.0,
+        backoff_max: float = 30.0,
+        state=None,
+    ):
+        self.model = model
+        self.rpm = float(rpm)
+        self.tpm = float(tpm)
+        self.batch_reserve = batch_reserve
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self._state = state or _MemoryState()
+        self._waiting_lock = threading.Lock()
+        self._interactive_waiting = 0
+        self.admitted = {p: 0 for p in PRIORITIES}
+        self.waited_seconds = {p: 0.0 for p in PRIORITIES}
+        self.rate_limit_errors = 0
+        self.tokens_charged = 0
+
+    # ---------- Buckets ----------
+
+    def _refill(self, state: Dict[str, float], now: float):
+        if not state:
+            state.update(requests=self.rpm, tokens=self.tpm, updated=now, paused_until=0.0, failures=0)
+            return
+        elapsed = max(0.0, now - state["updated"])
+        state["requests"] = min(self.rpm, state["requests"] + elapsed * self.rpm / 60.0)
+        state["tokens"] = min(self.tpm, state["tokens"] + elapsed * self.tpm / 60.0)
+        state["updated"] = now
+
+    def _try_take(self, priority: str) -> float:
+        """Take one request if allowed; else return the seconds to wait before retrying."""
+        now = time.time()
+        reserve = self.batch_reserve if priority == "batch" else 0.0
+        with self._state.transaction(self.model) as state:
+            self._refill(state, now)
+            if state["paused_until"] > now:
+                return state["paused_until"] - now
+            waits = []
+            if self.rpm:
+                need = 1.0 + reserve * self.rpm
+                if state["requests"] < need:
+                    waits.append((need - state["requests"]) * 60.0 / self.rpm)
+            if self.tpm:
+                need = reserve * self.tpm
+                if state["tokens"] <= need:
+                    waits.append((need - state["tokens"] + 1.0) * 60.0 / self.tpm)
+            if waits:
+                return max(waits)
+            if self.rpm:
+                state["requests"] -= 1.0
+            return 0.0
+
+    def _next_wait(self, priority: str) -> float:
+        if priority == "batch" and self._interactive_waiting:
+            return _POLL_SECONDS
+        return self._try_take(priority)
+
+    @contextmanager
+    def _waiting(self, priority: str):
+        if priority == "interactive":
+            with self._waiting_lock:
+                self._interactive_waiting += 1
+        try:
+            yield
+        finally:
+            if priority == "interactive":
+                with self._waiting_lock:
+                    self._interactive_waiting -= 1
+
+    def acquire(self, priority: str = "interactive", blocking: bool = True) -> bool:
+        start = time.monotonic()
+        with self._waiting(priority):
+            while True:
+                wait = self._next_wait(priority)
+                if wait <= 0:
+                    break
+                if not blocking:
+                    return False
+                time.sleep(min(wait, _POLL_SECONDS))
+        self._admitted(priority, time.monotonic() - start)
+        return True
+
+    async def aacquire(self, priority: str = "interactive", blocking: bool = True) -> bool:
+        start = time.monotonic()
+        with self._waiting(priority):
+            while True:
+                wait = self._next_wait(priority)
+                if wait <= 0:
+                    break
+                if not blocking:
+                    return False
+                await asyncio.sleep(min(wait, _POLL_SECONDS))
+        self._admitted(priority, time.monotonic() - start)
+        return True
+
+    def _admitted(self, priority: str, waited: float):
+        self.admitted[priority] += 1
+        self.waited_seconds[priority] += waited
+        if waited > 1.0:
+            log.info("Rate limiter delayed call", model=self.model, priority=priority, waited_s=round(waited, 2))
+
+    # ---------- Feedback ----------
+
+    def charge(self, tokens: int):
+        """Debit tokens actually used by an admitted call."""
+        if not tokens:
+            return
+        self.tokens_charged += tokens
+        if not self.tpm:
+            return
+        with self._state.transaction(self.model) as state:
+            self._refill(state, time.time())
+            state["tokens"] -= tokens
+
+    def succeeded(self):
+        with self._state.transaction(self.model) as state:
+            self._refill(state, time.time())
+            state["failures"] = 0
+
+    def rate_limited(self) -> float:
+        """Record a rate-limit error; pauses the model and returns the pause length."""
+        self.rate_limit_errors += 1
+        with self._state.transaction(self.model) as state:
+            now = time.time()
+            self._refill(state, now)
+            state["failures"] += 1
+            delay = min(self.backoff_max, self.backoff_initial * 2 ** (state["failures"] - 1))
+            delay *= random.uniform(0.5, 1.5)  # jitter: workers must not come back in lockstep
+            state["paused_until"] = max(state["paused_until"], now + delay)
+        log.warning("Rate limited by provider, pausing model", model=self.model, pause_s=round(delay, 2))
+        return delay
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rpm": self.rpm,
+            "tpm": self.tpm,
+            "admitted": dict(self.admitted),
+            "waited_seconds": {p: round(s, 2) for p, s in self.waited_seconds.items()},
+            "rate_limit_errors": self.rate_limit_errors,
+            "tokens_charged": self.tokens_charged,
+        }
+
+
+class PriorityRateLimiter(BaseRateLimiter):
+    """A ModelRateLimiter seen at one priority: what a chat model's `rate_limiter` field takes."""
+
+    def __init__(self, limiter: ModelRateLimiter, priority: str = "interactive"):
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unsupported priority: {priority} (expected one of {PRIORITIES})")
+        self.limiter = limiter
+        self.priority = priority
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        return self.limiter.acquire(self.priority, blocking=blocking)
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        return await self.limiter.aacquire(self.priority, blocking=blocking)
+
+
+class UsageCallback(BaseCallbackHandler):
+    """Charges provider-reported token usage to the limiter and reports rate-limit errors."""
+
+    def __init__(self, limiter: ModelRateLimiter):
+        self.limiter = limiter
+
+    def on_llm_end(self, response, **kwargs: Any) -> None:
+        tokens = 0
+        for generations in response.generations:
+            for gen in generations:
+                usage = getattr(getattr(gen, "message", None), "usage_metadata", None) or {}
+                if "total_cost" in usage:
+                    continue  # served from the LLM cache (LangChain zeroes the cost of cache hits)
+                tokens += int(usage.get("total_tokens", 0) or 0)
+        self.limiter.charge(tokens)
+        self.limiter.succeeded()
+
+    def on_llm_error(self, error: BaseException, **kwargs: Any) -> None:
+        if is_retryable_error(error):
+            self.limiter.rate_limited()
+
+
+class RateLimitRetry(RunnableRetry):
+    """RunnableRetry that only retries rate-limit / overload errors (see is_retryable_error)."""
+
+    @property
+    def _kwargs_retrying(self) -> Dict[str, Any]:
+        kwargs = super()._kwargs_retrying
+        kwargs["retry"] = retry_if_exception(is_retryable_error)
+        return kwargs
+
+
+class RateLimitedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper admitting each provider call through a ModelRateLimiter:
+    embed_documents (ingestion) as batch work, embed_query (chat) as interactive.
+    Rate-limit errors are retried with jittered exponential backoff.
+    """
+
+    def __init__(self, underlying: Embeddings, limiter: ModelRateLimiter, max_attempts: int = 4):
+        self.underlying = underlying
+        self.limiter = limiter
+        self.max_attempts = max_attempts
+
+    def _call(self, fn: Callable[[], Any], priority: str, tokens: int):
+        for attempt in range(1, self.max_attempts + 1):
+            self.limiter.acquire(priority)
+            try:
+                result = fn()
+            except Exception as e:
+                if attempt == self.max_attempts or not is_retryable_error(e):
+                    raise
+                self.limiter.rate_limited()  # the next acquire waits out the pause
+                continue
+            self.limiter.charge(tokens)
+            self.limiter.succeeded()
+            return result
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        tokens = sum(max(1, len(t) // 4) for t in texts)  # ~4 chars per token
+        return self._call(lambda: self.underlying.embed_documents(texts), "batch", tokens)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._call(lambda: self.underlying.embed_query(text), "interactive", max(1, len(text) // 4))
+
+
+class RateLimits:
+    """
+    The ModelRateLimiters of a process, one per configured model name, plus the
+    retry policy. Models without an entry in rate_limits.models are not limited.
+    """
+
+    def __init__(self, cfg: Dict[str, Any]):
+        self.models: Dict[str, Dict[str, Any]] = dict(cfg.get("models", {}) or {})
+        self.batch_reserve = float(cfg.get("batch_reserve", 0.2))
+        retry = cfg.get("retry", {}) or {}
+        self.max_attempts = int(retry.get("max_attempts", 4))
+        self.initial_delay = float(retry.get("initial_delay", 1.0))
+        self.max_delay = float(retry.get("max_delay", 30.0))
+        self.jitter = float(retry.get("jitter", 1.0))
+        self.client_max_retries = int(cfg.get("client_max_retries", 0))
+        path = os.getenv("RATE_LIMIT_STATE_PATH", cfg.get("state_path", "") or "")
+        self._state = _SQLiteState(path) if path else _MemoryState()
+        self._lock = threading.Lock()
+        self._limiters: Dict[str, ModelRateLimiter] = {}
+
+    def limiter(self, model_name: str) -> Optional[ModelRateLimiter]:
+        limits = self.models.get(model_name)
+        if not limits:
+            return None
+        with self._lock:
+            limiter = self._limiters.get(model_name)
+            if limiter is None:
+                limiter = ModelRateLimiter(
+                    model_name,
+                    rpm=limits.get("rpm", 0) or 0,
+                    tpm=limits.get("tpm", 0) or 0,
+                    batch_reserve=self.batch_reserve,
+                    backoff_initial=self.initial_delay,
+                    backoff_max=self.max_delay,
+                    state=self._state,
+                )
+                self._limiters[model_name] = limiter
+            return limiter
+
+    def limit_llm(self, llm, model_name: str, priority: str = "interactive") -> Tuple[Any, bool]:
+        """
+        (client, limited): llm with this model's limiter at `priority` and the usage
+        callback attached; the caller wraps it with with_retry().
+        """
+        limiter = self.limiter(model_name)
+        if limiter is None:
+            return llm, False
+        return llm.model_copy(update={
+            "rate_limiter": PriorityRateLimiter(limiter, priority),
+            "callbacks": [*(llm.callbacks or []), UsageCallback(limiter)],
+        }), True
+
+    def with_retry(self, llm):
+        return RateLimitRetry(
+            bound=llm,
+            max_attempt_number=self.max_attempts,
+            wait_exponential_jitter=True,
+            exponential_jitter_params={"initial": self.initial_delay, "max": self.max_delay, "jitter": self.jitter},
+        )
+
+    def limit_embeddings(self, embeddings: Embeddings, model_name: str) -> Embeddings:
+        limiter = self.limiter(model_name)
+        if limiter is None:
+            return embeddings
+        return RateLimitedEmbeddings(embeddings, limiter, max_attempts=self.max_attempts)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {name: limiter.stats() for name, limiter in self._limiters.items()}
+
+
+def build_rate_limits(config: dict) -> Optional[RateLimits]:
+    """Build the rate limiters from config['rate_limits'] (None when disabled)."""
+    cfg = config.get("rate_limits", {}) or {}
+    if not cfg.get("enabled", True):
+        return None
+    return RateLimits(cfg)
@@ -0,0 +1,147 @@
+from __future__ import annotations
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable
+
+from logger.custom_logger import CustomLogger
+from exception.custom_exception import DocumentPortalException
+
+log = CustomLogger().get_logger(__name__)
+
+
+class SQLiteLRUCache:
+    """
+    Base of the on-disk LRU caches: one SQLite table with a key, the entry's size
+    in bytes and its last access time, plus the columns a subclass declares.
+
+    The stored size is tracked as a running total instead of summed on every
+    write. Other processes sharing the file are not seen by that total, so it is
+    re-read from the table every RESYNC_EVERY writes, and before anything is
+    evicted. Eviction trims to 90% of max_bytes so it does not run on every insert.
+
+    Hits do not write: their last_access times are buffered and written in one
+    transaction every TOUCH_BATCH keys or TOUCH_INTERVAL seconds (and before this
+    process evicts), so lookups do not contend for SQLite's single writer. LRU
+    order is therefore up to TOUCH_INTERVAL seconds stale for other processes.
+    """
+
+    NAME = "Cache"            # for logs and errors
+    TABLE = ""
+    COLUMNS = ""              # column DDL besides key / size / last_access
+    ACCESS_INDEX = ""
+    COUNT_LABEL = "entries"   # name of the row count in stats()
+    RESYNC_EVERY = 1000
+    TOUCH_BATCH = 256
+    TOUCH_INTERVAL = 30.0
+
+    def __init__(self, path: str, max_bytes: int):
+        try:
+            self.path = Path(path)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.max_bytes = max_bytes
+            self._lock = threading.Lock()
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                f"""CREATE TABLE IF NOT EXISTS {self.TABLE} (
+                       key TEXT PRIMARY KEY,
+                       {self.COLUMNS},
+                       size INTEGER NOT NULL,
+                       last_access REAL NOT NULL
+                   )"""
+            )
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS {self.ACCESS_INDEX} ON {self.TABLE}(last_access)")
+            self._conn.commit()
+            self._bytes = self._stored_bytes()
+            self._writes = 0
+            self._touched: Dict[str, float] = {}
+            self._touch_flushed = time.monotonic()
+            self._closed = False
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+        except Exception as e:
+            log.error(f"Failed to open {self.NAME.lower()}", error=str(e), path=str(path))
+            raise DocumentPortalException(f"{self.NAME} initialization error", e) from e
+
+    def _stored_bytes(self) -> int:
+        return self._conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.TABLE}").fetchone()[0]
+
+    def _touch(self, keys: Iterable[str]):
+        """Record hits (caller holds _lock); written to the table in batches."""
+        now = time.time()
+        for k in keys:
+            self._touched[k] = now
+        if len(self._touched) >= self.TOUCH_BATCH or time.monotonic() - self._touch_flushed >= self.TOUCH_INTERVAL:
+            self._flush_touches()
+
+    def _flush_touches(self):
+        if self._touched:
+            self._conn.executemany(
+                f"UPDATE {self.TABLE} SET last_access=? WHERE key=?", [(t, k) for k, t in self._touched.items()]
+            )
+            self._conn.commit()
+            self._touched.clear()
+        self._touch_flushed = time.monotonic()
+
+    def _written(self, nbytes: int):
+        """Account for nbytes just written (caller holds _lock and has committed)."""
+        self._bytes += nbytes
+        self._writes += 1
+        if self._bytes > self.max_bytes or self._writes % self.RESYNC_EVERY == 0:
+            self._purge()
+            self._bytes = self._stored_bytes()
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def _purge(self):
+        """Drop entries that are invalid regardless of space (e.g. expired); run on resync."""
+
+    def _evict(self):
+        self._flush_touches()
+        target = int(self.max_bytes * 0.9)
+        freed, dropped = 0, []
+        for key, size in self._conn.execute(f"SELECT key, size FROM {self.TABLE} ORDER BY last_access ASC"):
+            if self._bytes - freed <= target:
+                break
+            dropped.append((key,))
+            freed += size
+        self._conn.executemany(f"DELETE FROM {self.TABLE} WHERE key=?", dropped)
+        self._conn.commit()
+        self._bytes -= freed
+        self.evictions += len(dropped)
+        log.info(f"{self.NAME} evicted", entries=len(dropped), bytes=freed)
+
+    def close(self):
+        """
+        Close the connection. Clients built before a reload may still hold the
+        cache: once closed it misses on every lookup and ignores writes.
+        """
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self._flush_touches()
+                self._conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            if self._closed:
+                rows, total = 0, 0
+            else:
+                rows, total = self._conn.execute(
+                    f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.TABLE}"
+                ).fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "path": str(self.path),
+                self.COUNT_LABEL: rows,
+                "bytes": total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }